@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 import logging
+import logging.config
 from rich.logging import RichHandler
 from rich.traceback import install
 
@@ -45,9 +46,16 @@ LOGGING_CONFIG = {
 
 
 def setup_logging():
+    os.makedirs(os.path.dirname(LOGGING_CONFIG["handlers"]["file"]["filename"]), exist_ok=True)
     logging.config.dictConfig(LOGGING_CONFIG)
 
 
+# MONGODB
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_MAX_POOL_SIZE = int(
+    os.getenv("MONGO_MAX_POOL_SIZE", 100)
+)  # Connections per process, shared by its threads
+
 # DeFI PROTOCOLS
 KEY_PROTOCOLS = [
     "uniswap",  # DEX
@@ -62,3 +70,21 @@ KEY_PROTOCOLS = [
     "tether",  # Stablecoin
     "nftfi",  # NFT-Fi (optionnel)
 ]
+
+# USERS EXTRACTION
+USERS_MEMORY_BUDGET_MB = int(
+    os.getenv("USERS_MEMORY_BUDGET_MB", 4096)
+)  # Peak memory allowed to the streaming user extraction
+USERS_SPILL_DIR = os.getenv("USERS_SPILL_DIR", "tmp/users_partitions")
+USERS_MAX_ADDRESS_TRANSACTIONS = int(
+    os.getenv("USERS_MAX_ADDRESS_TRANSACTIONS", 50000)
+)  # Most recent transactions kept in a user document: ~300 B each under the 16 MB BSON limit
+
+# ETHERSCAN
+ETHERSCAN_API_URL = os.getenv("ETHERSCAN_API_URL", "https://api.etherscan.io/v2/api")
+ETHERSCAN_CALLS_PER_SECOND = float(
+    os.getenv("ETHERSCAN_CALLS_PER_SECOND", 5)
+)  # Free plan limit
+TRANSACTIONS_CHECKPOINT_BLOCKS = int(
+    os.getenv("TRANSACTIONS_CHECKPOINT_BLOCKS", 100000)
+)  # Blocks fetched and upserted between two checkpoints of a contract (~2 weeks)
@@ -1,29 +1,287 @@
-import pandas as pd
 import pyarrow.parquet as pq
 import pyarrow as pa
 import logging
-import json
+import os
+import shutil
+from datetime import datetime
+from itertools import islice
+from urllib.parse import quote
 
-from ..mongodb_handler import get_mongo_collection, get_mongo_client
+from ..mongodb_handler import get_mongo_collection, close_mongo_clients
 
 logger = logging.getLogger(__name__)
 
+TIMESTAMP = pa.timestamp("us")
+PROTOCOL_USAGE = pa.struct(
+    [
+        ("count", pa.int64()),
+        ("blockchain", pa.string()),
+        ("contract_id", pa.string()),
+    ]
+)
+USER_TRANSACTION = pa.struct(
+    [
+        ("transaction_hash", pa.string()),
+        ("timestamp", TIMESTAMP),
+        ("value (ETH)", pa.float64()),
+        ("is_sender", pa.bool_()),
+        ("gas_used", pa.float64()),
+        ("protocol_name", pa.string()),
+        ("protocol_type", pa.string()),
+        ("blockchain", pa.string()),
+        ("contract_id", pa.string()),
+    ]
+)
+MARKET_METRICS = [
+    f"{metric}_{window}"
+    for metric in [
+        "nb_tx",
+        "total_value_eth",
+        "total_gas_used",
+        "nb_unique_receivers",
+        "nb_unique_senders",
+        "std_value_eth",
+        "std_gas_used",
+        "avg_gas_used",
+        "avg_value_eth_per_tx",
+        "max_gas_used",
+        "max_value_eth",
+        "median_value_eth",
+        "min_gas_used",
+        "min_value_eth",
+        "num_errors",
+        "error_rate",
+    ]
+    for window in ["1h", "24h"]
+]
+
+EXPORT_SCHEMAS = {
+    "contracts": pa.schema(
+        [
+            ("contract_address", pa.string()),
+            ("blockchain", pa.string()),
+            ("type", pa.string()),
+            ("protocol_name", pa.string()),
+            ("protocol_symbol", pa.string()),
+            ("description", pa.string()),
+            ("website_url", pa.string()),
+        ]
+    ),
+    "transactions": pa.schema(
+        [
+            ("timestamp", TIMESTAMP),
+            ("transaction_hash", pa.string()),
+            ("from", pa.string()),
+            ("to", pa.string()),
+            ("value (ETH)", pa.float64()),
+            ("gas", pa.float64()),
+            ("gas_used", pa.float64()),
+            ("is_error", pa.string()),
+            ("error_code", pa.string()),
+            (
+                "metadata",
+                pa.struct(
+                    [
+                        ("protocol_name", pa.string()),
+                        ("type", pa.string()),
+                        ("blockchain", pa.string()),
+                        ("contract_id", pa.string()),
+                    ]
+                ),
+            ),
+        ]
+    ),
+    "users": pa.schema(
+        [
+            ("address", pa.string()),
+            ("first_seen", TIMESTAMP),
+            ("last_seen", TIMESTAMP),
+            ("protocol_types", pa.map_(pa.string(), pa.int64())),
+            ("protocols_used", pa.map_(pa.string(), PROTOCOL_USAGE)),
+            ("received_count", pa.int64()),
+            ("total_received (ETH)", pa.float64()),
+            ("sent_count", pa.int64()),
+            ("total_sent (ETH)", pa.float64()),
+            ("transactions", pa.list_(USER_TRANSACTION)),
+        ]
+    ),
+    "market_enriched": pa.schema(
+        [
+            ("timestamp", TIMESTAMP),
+            ("blockchain", pa.string()),
+            ("protocol_name", pa.string()),
+            ("symbol", pa.string()),
+            ("type", pa.string()),
+            ("contract_address", pa.string()),
+            ("open (usd)", pa.float64()),
+            ("high (usd)", pa.float64()),
+            ("low (usd)", pa.float64()),
+            ("close (usd)", pa.float64()),
+            ("volume", pa.float64()),
+        ]
+        + [(column, pa.float64()) for column in MARKET_METRICS]
+    ),
+}
+TRANSACTIONS_DATASET_SCHEMA = pa.schema(
+    [
+        field
+        for field in EXPORT_SCHEMAS["transactions"]
+        if field.name != "metadata"
+    ]
+    + [
+        ("type", pa.string()),
+        ("blockchain", pa.string()),
+        ("contract_id", pa.string()),
+    ]
+)  # Flattened, `protocol_name` and `month` are the Hive partition keys
+EXPORT_BATCH_SIZES = {"users": 1000}  # Users embed their transactions
+DEFAULT_EXPORT_BATCH_SIZE = 100000
+
+
+def iter_record_batches(cursor, schema: pa.Schema, batch_size: int, transform=None):
+    """
+    Pages a MongoDB cursor into Arrow record batches of a fixed schema.
+
+    :param cursor: The MongoDB cursor to read.
+    :param schema: The Arrow schema of the export; other fields are ignored. (pa.Schema)
+    :param batch_size: The number of documents per record batch. (int)
+    :param transform: Optional function applied to each document before the conversion.
+    :return: A generator of record batches. (Iterator[pa.RecordBatch])
+    """
+    cursor = cursor.batch_size(batch_size)
+    while True:
+        documents = list(islice(cursor, batch_size))
+        if not documents:
+            return
+        if transform is not None:
+            documents = [transform(document) for document in documents]
+        yield pa.RecordBatch.from_pylist(documents, schema=schema)
+
+
+def write_parquet(batches, schema: pa.Schema, output_file: str, row_group_size: int) -> int:
+    """
+    Streams record batches into a Parquet file, one row group per batch, so that memory
+    stays bounded by one batch. The file is only created if there is at least one row.
+
+    :param batches: The record batches to write. (Iterator[pa.RecordBatch])
+    :param schema: The Arrow schema of the file. (pa.Schema)
+    :param output_file: The path of the Parquet file. (str)
+    :param row_group_size: The maximum number of rows per row group. (int)
+    :return: The number of written rows. (int)
+    """
+    rows = 0
+    writer = None
+    try:
+        for batch in batches:
+            if writer is None:
+                os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+                writer = pq.ParquetWriter(output_file, schema)
+            writer.write_batch(batch, row_group_size=row_group_size)
+            rows += batch.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def export_collection_to_parquet(
+    collection, schema: pa.Schema, output_file: str, batch_size: int
+) -> int:
+    """
+    Streams a MongoDB collection into a Parquet file, one row group per `batch_size` documents.
+
+    :param collection: The MongoDB collection to export.
+    :param schema: The Arrow schema of the export. (pa.Schema)
+    :param output_file: The path of the Parquet file. (str)
+    :param batch_size: The number of documents per row group. (int)
+    :return: The number of exported rows. (int)
+    """
+    projection = {"_id": 0, **{name: 1 for name in schema.names}}
+    cursor = collection.find({}, projection)
+    return write_parquet(
+        iter_record_batches(cursor, schema, batch_size), schema, output_file, batch_size
+    )
+
+
+def _flatten_metadata(document: dict) -> dict:
+    """Moves the metadata fields of a transaction to the top level."""
+    document.update(document.pop("metadata", None) or {})
+    return document
+
+
+def _months(first: datetime, last: datetime):
+    """Yields the (start, end) bounds of the calendar months between two dates."""
+    month = datetime(first.year, first.month, 1)
+    while month <= last:
+        following = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        yield month, following
+        month = following
+
+
+def export_transactions_dataset(collection, base_dir: str, batch_size: int) -> int:
+    """
+    Exports the transactions as a Hive-partitioned Parquet dataset,
+    `base_dir/protocol_name=<name>/month=<YYYY-MM>/part-0.parquet`.
+    Each partition is sorted by timestamp and written in row groups of `batch_size` rows,
+    so that the min/max statistics of the row groups let readers skip time ranges, and the
+    partition keys let them skip protocols and months.
+
+    :param collection: The transactions collection.
+    :param base_dir: The root directory of the dataset, replaced if it exists. (str)
+    :param batch_size: The number of documents per row group. (int)
+    :return: The number of exported rows. (int)
+    """
+    collection.create_index([("metadata.protocol_name", 1), ("timestamp", 1)])
+    first = collection.find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+    last = collection.find_one({}, {"timestamp": 1}, sort=[("timestamp", -1)])
+    if first is None:
+        return 0
+
+    shutil.rmtree(base_dir, ignore_errors=True)
+    projection = {"_id": 0, **{name: 1 for name in EXPORT_SCHEMAS["transactions"].names}}
+
+    rows = 0
+    for protocol_name in sorted(collection.distinct("metadata.protocol_name")):
+        for start, end in _months(first["timestamp"], last["timestamp"]):
+            cursor = collection.find(
+                {
+                    "metadata.protocol_name": protocol_name,
+                    "timestamp": {"$gte": start, "$lt": end},
+                },
+                projection,
+            ).sort("timestamp", 1)
+            output_file = os.path.join(
+                base_dir,
+                f"protocol_name={quote(protocol_name, safe='')}",
+                f"month={start:%Y-%m}",
+                "part-0.parquet",
+            )
+            rows += write_parquet(
+                iter_record_batches(
+                    cursor, TRANSACTIONS_DATASET_SCHEMA, batch_size, _flatten_metadata
+                ),
+                TRANSACTIONS_DATASET_SCHEMA,
+                output_file,
+                batch_size,
+            )
+    return rows
+
 
 def save_mongodb_to_parquet():
     """
     Saves data from a MongoDB collection into a Parquet file.
+    Nested fields keep their structure: `transactions` is a list of structs, `protocols_used`
+    and `protocol_types` are maps. The transactions are written as a dataset partitioned by
+    protocol and month, see `export_transactions_dataset`.
 
     :raise Exception: If any error occurs during data export.
     """
-    collections = [
-        "contracts",
-        "transactions",
-        "users",
-        "market_enriched",
-    ]
-
-    for collection_name in collections:
-        output_file = f"data/defi_db/{collection_name}.parquet"
+    for collection_name, schema in EXPORT_SCHEMAS.items():
+        output_file = (
+            f"data/defi_db/{collection_name}"
+            if collection_name == "transactions"
+            else f"data/defi_db/{collection_name}.parquet"
+        )
         try:
             logger.info(
                 f"Exporting data from MongoDB collection `{collection_name}` to Parquet file: {output_file}"
@@ -31,147 +289,26 @@ def save_mongodb_to_parquet():
             mongo_collection = get_mongo_collection(
                 db_name="defi_db", collection_name=collection_name
             )
-            data = list(mongo_collection.find())
-
-            if not data:
-                print("No data found in collection.")
-                return
-
-            df = pd.DataFrame(data)
-            df = df.drop(columns=[col for col in ["_id"] if col in df.columns])
-
-            if collection_name == "contracts":
-                df = df.drop(
-                    columns=[
-                        col
-                        for col in ["contract_id", "protocol_id"]
-                        if col in df.columns
-                    ]
+            batch_size = EXPORT_BATCH_SIZES.get(collection_name, DEFAULT_EXPORT_BATCH_SIZE)
+            if collection_name == "transactions":
+                schema = TRANSACTIONS_DATASET_SCHEMA
+                rows = export_transactions_dataset(
+                    mongo_collection, output_file, batch_size
                 )
-                df = df[
-                    [
-                        "contract_address",
-                        "blockchain",
-                        "type",
-                        "protocol_name",
-                        "protocol_symbol",
-                        "description",
-                        "website_url",
-                    ]
-                ]
-
-            elif collection_name == "transactions":
-                df = df.drop(
-                    columns=[
-                        col for col in ["trace_id", "tx_hash"] if col in df.columns
-                    ]
+            else:
+                rows = export_collection_to_parquet(
+                    mongo_collection, schema, output_file, batch_size
                 )
-                df = df[
-                    [
-                        "timestamp",
-                        "transaction_hash",
-                        "from",
-                        "to",
-                        "value (ETH)",
-                        "gas",
-                        "gas_used",
-                        "is_error",
-                        "error_code",
-                        "metadata",
-                    ]
-                ]
 
-            elif collection_name == "users":
-                df = df.drop(columns=[col for col in ["user_id"] if col in df.columns])
-                df = df[
-                    [
-                        "address",
-                        "first_seen",
-                        "last_seen",
-                        "protocol_types",
-                        "protocols_used",
-                        "received_count",
-                        "total_received (ETH)",
-                        "sent_count",
-                        "total_sent (ETH)",
-                        "transactions",
-                    ]
-                ]
+            if not rows:
+                logger.warning(f"No data found in collection `{collection_name}`.")
+                continue
 
-            elif collection_name == "market_enriched":
-                df = df[
-                    [
-                        "timestamp",
-                        "blockchain",
-                        "protocol_name",
-                        "symbol",
-                        "type",
-                        "contract_address",
-                        "open (usd)",
-                        "high (usd)",
-                        "low (usd)",
-                        "close (usd)",
-                        "volume",
-                        "nb_tx_1h",
-                        "nb_tx_24h",
-                        "total_value_eth_1h",
-                        "total_value_eth_24h",
-                        "total_gas_used_1h",
-                        "total_gas_used_24h",
-                        "nb_unique_receivers_1h",
-                        "nb_unique_receivers_24h",
-                        "nb_unique_senders_1h",
-                        "nb_unique_senders_24h",
-                        "std_value_eth_1h",
-                        "std_value_eth_24h",
-                        "std_gas_used_1h",
-                        "std_gas_used_24h",
-                        "avg_gas_used_1h",
-                        "avg_gas_used_24h",
-                        "avg_value_eth_per_tx_1h",
-                        "avg_value_eth_per_tx_24h",
-                        "max_gas_used_1h",
-                        "max_gas_used_24h",
-                        "max_value_eth_1h",
-                        "max_value_eth_24h",
-                        "median_value_eth_1h",
-                        "median_value_eth_24h",
-                        "min_gas_used_1h",
-                        "min_gas_used_24h",
-                        "min_value_eth_1h",
-                        "min_value_eth_24h",
-                        "num_errors_1h",
-                        "num_errors_24h",
-                        "error_rate_1h",
-                        "error_rate_24h",
-                    ]
-                ]
-
-            for column in df.columns:
-                if df[column].dtype == "object":
-                    try:
-                        df[column] = df[column].apply(
-                            lambda x: (
-                                json.dumps(x, default=str)
-                                if isinstance(x, (dict, list))
-                                else str(x)
-                            )
-                        )
-                    except Exception as e:
-                        logger.error(
-                            f"Erreur de conversion pour la colonne `{column}` : {e}"
-                        )
-                        raise
-
-                logger.info(f"- column `{column}` is type {df[column].dtype}")
-
-            table = pa.Table.from_pandas(df)
-            pq.write_table(table, output_file)
-
-            logger.info(f"Data has been saved to the Parquet file: {output_file}")
+            for field in schema:
+                logger.info(f"- column `{field.name}` is type {field.type}")
+            logger.info(f"{rows} rows have been saved to the Parquet file: {output_file}")
 
         except Exception as e:
             logger.error(f"Error during data export: {e}")
 
-    client = get_mongo_client()
-    client.close()
+    close_mongo_clients()
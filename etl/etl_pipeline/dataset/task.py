@@ -5,7 +5,7 @@ from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from itertools import islice
 
-from .wrapped_task import precompute_protocol_ranges, load_market_data, wrapped_tasks
+from .wrapped_task import load_market_data, wrapped_tasks
 from ..mongodb_handler import get_mongo_database
 
 logger = logging.getLogger(__name__)
@@ -24,8 +24,8 @@ def generate_dataset():
     """
     Main function to generate and enrich a dataset using MongoDB.
 
-    This function retrieves user data from the MongoDB database, precomputes
-    protocol ranges, loads market data into a cache, and processes user data
+    This function retrieves user data from the MongoDB database, loads market data
+    into a sorted timestamp index per protocol, and processes user data
     in parallel using threading for better I/O performance.
 
     :raise Exception: If an error occurs during processing, it logs the error and continues with other tasks.
@@ -38,9 +38,6 @@ def generate_dataset():
         logger.warning("No users found in the database.")
         return
 
-    logger.info("Precomputing protocol ranges...")
-    protocol_ranges = precompute_protocol_ranges(db)
-
     logger.info("Loading market data into cache...")
     market_data_cache = load_market_data(db)
 
@@ -60,7 +57,7 @@ def generate_dataset():
         ):
             future = executor.submit(
                 wrapped_tasks,
-                (users_batch, counter, lock, protocol_ranges, market_data_cache),
+                (users_batch, counter, lock, market_data_cache),
             )
             try:
                 future.result()
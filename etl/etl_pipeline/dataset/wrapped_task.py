@@ -3,69 +3,80 @@ import logging
 from tqdm import tqdm
 import time
 import json
+import numpy as np
+import pandas as pd
 
 from ..mongodb_handler import get_mongo_database
 
 logger = logging.getLogger(__name__)
 
-
-def precompute_protocol_ranges(db):
-    """
-    Precomputes the minimum and maximum timestamp ranges for all protocols.
-
-    :param db: MongoDB database instance.
-    :return: A dictionary with protocol names as keys and (min_date, max_date) as values.
-    """
-    ranges = {}
-    protocol_data = db["market_enriched"].aggregate(
-        [
-            {
-                "$group": {
-                    "_id": "$protocol_name",
-                    "min_date": {"$min": "$timestamp"},
-                    "max_date": {"$max": "$timestamp"},
-                }
-            }
-        ]
-    )
-    for protocol in protocol_data:
-        ranges[protocol["_id"]] = (protocol["min_date"], protocol["max_date"])
-    return ranges
+OUT_OF_RANGE = -1
+PROTOCOL_NOT_FOUND = -2
 
 
 def load_market_data(db):
     """
-    Loads all market data into a cache for efficient lookup.
+    Loads all market data into a per-protocol sorted timestamp index for vectorized lookups.
 
     :param db: MongoDB database instance.
-    :return: A dictionary with protocol names as keys and their respective market data.
+    :return: A dictionary with protocol names as keys and, as values, a tuple of the sorted
+             timestamps (datetime64[us] array) and the market documents in the same order.
     """
-    market_data = {}
+    documents = {}
     cursor = db["market_enriched"].find({})
     for document in cursor:
-        protocol_name = document["protocol_name"]
-        timestamp = document["timestamp"]
-        market_data.setdefault(protocol_name, SortedDict())[timestamp] = document
+        documents.setdefault(document["protocol_name"], []).append(document)
+
+    market_data = {}
+    for protocol_name, protocol_documents in documents.items():
+        timestamps = np.array(
+            [document["timestamp"] for document in protocol_documents],
+            dtype="datetime64[us]",
+        )
+        order = np.argsort(timestamps, kind="stable")
+        market_data[protocol_name] = (
+            timestamps[order],
+            [protocol_documents[i] for i in order],
+        )
     return market_data
 
 
-def find_closest_timestamp(sorted_dict, target_timestamp):
-    pos = sorted_dict.bisect_left(target_timestamp)
-    keys = list(sorted_dict.keys())
-
-    # Trouver le plus proche entre les deux voisins
-    if pos == 0:
-        return keys[0]
-    if pos == len(keys):
-        return keys[-1]
-    before = keys[pos - 1]
-    after = keys[pos]
-    return (
-        before
-        if abs(before - target_timestamp) <= abs(after - target_timestamp)
-        else after
+def find_closest_snapshots(market_data, protocol_names, timestamps):
+    """
+    Joins transactions to the market snapshot of their protocol closest in time, one
+    `searchsorted` call per protocol. Ties go to the earlier snapshot.
+
+    :param market_data: The market index returned by `load_market_data`.
+    :param protocol_names: The protocol name of each transaction. (list)
+    :param timestamps: The timestamp of each transaction. (datetime64[us] array)
+    :return: The position of the closest snapshot in the documents of the protocol of each
+             transaction, OUT_OF_RANGE if the transaction is outside the market data of its
+             protocol, or PROTOCOL_NOT_FOUND. (int64 array)
+    """
+    positions = np.full(len(timestamps), PROTOCOL_NOT_FOUND, dtype=np.int64)
+    codes, names = pd.factorize(
+        np.asarray(protocol_names, dtype=object), use_na_sentinel=False
     )
 
+    for code, protocol_name in enumerate(names):
+        if protocol_name not in market_data:
+            continue
+        index, _ = market_data[protocol_name]
+        selected = np.flatnonzero(codes == code)
+        targets = timestamps[selected]
+
+        after = np.searchsorted(index, targets, side="left")
+        before = np.maximum(after - 1, 0)
+        after = np.minimum(after, len(index) - 1)
+        closest = np.where(
+            np.abs(targets - index[before]) <= np.abs(index[after] - targets),
+            before,
+            after,
+        )
+        in_range = (targets >= index[0]) & (targets <= index[-1])
+        positions[selected] = np.where(in_range, closest, OUT_OF_RANGE)
+    return positions
+
 
 def wrapped_tasks(args):
     """
@@ -76,40 +87,50 @@ def wrapped_tasks(args):
                  - users_batch: A batch of user documents to process.
                  - counter: A multiprocessing.Value object for tracking progress.
                  - lock: A multiprocessing.Lock object for thread-safe updates.
-                 - protocol_ranges: Precomputed protocol timestamp ranges.
-                 - market_data_cache: Cached market data for efficient lookups.
+                 - market_data_cache: Market index returned by `load_market_data`.
     """
-    users_batch, counter, lock, protocol_ranges, market_data_cache = args
+    users_batch, counter, lock, market_data_cache = args
     db = get_mongo_database(db_name="defi_db")
 
     dataset_updates = []
 
+    start = time.perf_counter()
+    transactions = [
+        transaction for user in users_batch for transaction in user.get("transactions", [])
+    ]
+    positions = find_closest_snapshots(
+        market_data_cache,
+        [transaction["protocol_name"] for transaction in transactions],
+        np.array(
+            [transaction["timestamp"] for transaction in transactions],
+            dtype="datetime64[us]",
+        ),
+    ).tolist()
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Joined {len(transactions)} transactions to their market snapshot in {elapsed:.2f}s "
+        f"({len(transactions) / max(elapsed, 1e-9):,.0f} joins/s)."
+    )
+
+    offset = 0
     for user in tqdm(users_batch, desc="Processing users", leave=False):
         transactions_with_market_data = []
 
         for transaction in user.get("transactions", []):
-            transaction_timestamp = transaction["timestamp"]
+            position = positions[offset]
+            offset += 1
             protocol_name = transaction["protocol_name"]
 
-            if protocol_name in protocol_ranges:
-                min_date, max_date = protocol_ranges[protocol_name]
-
-                if not (min_date <= transaction_timestamp <= max_date):
-                    continue
-
-                protocol_market_data = market_data_cache.get(
-                    protocol_name, SortedDict()
-                )
-                closest_timestamp = find_closest_timestamp(
-                    protocol_market_data, transaction_timestamp
-                )
-                market_data = protocol_market_data[closest_timestamp]
-            else:
+            if position == OUT_OF_RANGE:
+                continue
+            elif position == PROTOCOL_NOT_FOUND:
                 market_data = {"market_data": "Protocol not found"}
+            else:
+                market_data = market_data_cache[protocol_name][1][position]
 
             transaction_with_market_data = {
                 "transaction_hash": transaction["transaction_hash"],
-                "timestamp": transaction_timestamp,
+                "timestamp": transaction["timestamp"],
                 "value_eth": transaction["value (ETH)"],
                 "protocol_name": protocol_name,
                 "protocol_type": transaction["protocol_type"],
@@ -1,20 +1,43 @@
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 from ..mongodb_handler import get_mongo_collection
 
+METRIC_COLUMNS = [
+    "nb_tx",
+    "nb_unique_senders",
+    "nb_unique_receivers",
+    "total_value_eth",
+    "avg_value_eth_per_tx",
+    "max_value_eth",
+    "min_value_eth",
+    "std_value_eth",
+    "total_gas_used",
+    "avg_gas_used",
+    "max_gas_used",
+    "min_gas_used",
+    "std_gas_used",
+    "num_errors",
+    "error_rate",
+    "median_value_eth",
+]
 
-def aggregate_transactions(df, time_delta=None):
+
+def aggregate_transactions(df, time_delta=None, collection=None):
     """
     Aggregates the transaction data from the MongoDB collection based on the given DataFrame.
 
     :param df: A DataFrame containing the timestamps and protocol names.
     :param time_delta: The time interval (in hours) used to group the transactions.
+    :param collection: Optional transactions collection, defaults to `defi_db.transactions`.
     :return: A DataFrame enriched with the aggregated transaction data.
     :raise: Exception: If an error occurs during the aggregation process.
     """
-    transactions_collection = get_mongo_collection(
-        db_name="defi_db", collection_name="transactions"
-    )
+    transactions_collection = collection
+    if transactions_collection is None:
+        transactions_collection = get_mongo_collection(
+            db_name="defi_db", collection_name="transactions"
+        )
     results = []
 
     for _, row in tqdm(
@@ -175,3 +198,291 @@ def aggregate_transactions(df, time_delta=None):
     enriched_df = df.merge(agg_df, on=["timestamp", "protocol_name"], how="left")
 
     return enriched_df
+
+
+def _range_reduce(ufunc, segments, first, last):
+    """
+    Reduces `segments[first:last]` for every (first, last) pair with a sparse table.
+
+    :param ufunc: An idempotent binary ufunc (np.fmin or np.fmax).
+    :param segments: The values to reduce. (np.ndarray)
+    :param first: Inclusive start indices, with first < last. (np.ndarray)
+    :param last: Exclusive end indices. (np.ndarray)
+    :return: The reduced value of each range. (np.ndarray)
+    """
+    lengths = last - first
+    levels = np.floor(np.log2(np.maximum(lengths, 1))).astype(np.int64)
+    table = [segments]
+    span = 1
+    while span * 2 <= (lengths.max() if len(lengths) else 0):
+        table.append(ufunc(table[-1][:-span], table[-1][span:]))
+        span *= 2
+
+    result = np.empty(len(first), dtype=np.float64)
+    for level, level_table in enumerate(table):
+        mask = levels == level
+        if mask.any():
+            result[mask] = ufunc(
+                level_table[first[mask]], level_table[last[mask] - (1 << level)]
+            )
+    return result
+
+
+def _segments(n, lo, hi):
+    """
+    Cuts `n` sorted rows at every boundary of the non-empty windows into elementary segments.
+
+    :return: A tuple (nonempty, bounds, first, last): the mask of non-empty windows, the segment starts
+        and the inclusive first and exclusive last segment of each non-empty window.
+    """
+    nonempty = hi > lo
+    bounds = np.unique(np.concatenate([lo[nonempty], hi[nonempty]]))
+    bounds = bounds[bounds < n]
+    return nonempty, bounds, np.searchsorted(bounds, lo[nonempty]), np.searchsorted(bounds, hi[nonempty])
+
+
+def _range_combine(merge, segments, first, last):
+    """
+    Combines `segments[first:last]` for every (first, last) pair from disjoint power-of-two runs.
+
+    :param merge: An associative merge of two tuples of arrays, with all-zero tuples neutral.
+    :param segments: A tuple of arrays, one summary per segment. (tuple)
+    :param first: Inclusive start indices. (np.ndarray)
+    :param last: Exclusive end indices. (np.ndarray)
+    :return: A tuple of arrays, the merged summary of each range. (tuple)
+    """
+    runs = last - first
+    table = [segments]
+    span = 1
+    while span * 2 <= (runs.max() if len(runs) else 0):
+        table.append(merge(
+            tuple(summary[:-span] for summary in table[-1]),
+            tuple(summary[span:] for summary in table[-1]),
+        ))
+        span *= 2
+
+    result = tuple(np.zeros(len(first)) for _ in segments)
+    position = first.copy()
+    for level in range(len(table) - 1, -1, -1):  # Disjoint runs, largest first
+        mask = (runs >> level) & 1 == 1
+        if mask.any():
+            at = position[mask]
+            merged = merge(
+                tuple(summary[mask] for summary in result),
+                tuple(summary[at] for summary in table[level]),
+            )
+            for summary, update in zip(result, merged):
+                summary[mask] = update
+            position[mask] += 1 << level
+    return result
+
+
+def _window_sums(columns, lo, hi):
+    """
+    Computes the sums of several columns over `[lo, hi)` for every window.
+
+    Each window adds the sums of the elementary segments it spans, so no cumulative sum over the
+    protocol's history is differenced: the sums of a window are exact for integer counts and as
+    precise as its own values for floats.
+
+    :param columns: Arrays of the same length, in timestamp order. (list)
+    :return: A tuple of float64 arrays, zeros for empty windows. (tuple)
+    """
+    sums = tuple(np.zeros(len(lo)) for _ in columns)
+    nonempty, bounds, first, last = _segments(len(columns[0]), lo, hi)
+    if not nonempty.any():
+        return sums
+    segments = tuple(np.add.reduceat(np.asarray(column, dtype=np.float64), bounds) for column in columns)
+    merged = _range_combine(lambda a, b: tuple(x + y for x, y in zip(a, b)), segments, first, last)
+    for total, update in zip(sums, merged):
+        total[nonempty] = update
+    return sums
+
+
+def _window_extrema(values, lo, hi):
+    """
+    Computes the NaN-ignoring min and max of `values[lo:hi]` for every window.
+
+    The sorted values are cut at every window boundary into elementary segments reduced with
+    `reduceat`; each window then spans a contiguous run of segments resolved by a sparse table.
+
+    :return: A tuple (min, max) of arrays, NaN for empty windows.
+    """
+    minimum = np.full(len(lo), np.nan)
+    maximum = np.full(len(lo), np.nan)
+    nonempty, bounds, first, last = _segments(len(values), lo, hi)
+    if not nonempty.any():
+        return minimum, maximum
+
+    minimum[nonempty] = _range_reduce(
+        np.fmin, np.fmin.reduceat(values, bounds), first, last
+    )
+    maximum[nonempty] = _range_reduce(
+        np.fmax, np.fmax.reduceat(values, bounds), first, last
+    )
+    return minimum, maximum
+
+
+def _merge_moments(left, right):
+    """
+    Merges two (count, mean, m2) summaries of disjoint row sets with the pairwise update of Chan et al.,
+    m2 being the sum of the squared deviations from the mean. Empty summaries are neutral.
+    """
+    count_a, mean_a, m2_a = left
+    count_b, mean_b, m2_b = right
+    count = count_a + count_b
+    share = np.divide(count_b, count, out=np.zeros_like(mean_a), where=count > 0)
+    delta = mean_b - mean_a
+    return count, mean_a + delta * share, m2_a + m2_b + delta * delta * count_a * share
+
+
+def _window_moments(values, lo, hi):
+    """
+    Computes the NaN-ignoring count, mean and sum of squared deviations of `values[lo:hi]` for every window.
+
+    The elementary segments of `_segments` are summarized with two passes (mean, then squared
+    deviations from it), and each window merges the disjoint power-of-two runs of segments it spans.
+    No cumulative sum over the protocol's history is differenced, so a large value outside a window
+    cannot cancel the variance inside it.
+
+    :return: A tuple (count, mean, m2) of arrays, zeros for empty windows.
+    """
+    count = np.zeros(len(lo))
+    mean = np.zeros(len(lo))
+    m2 = np.zeros(len(lo))
+    nonempty, bounds, first, last = _segments(len(values), lo, hi)
+    if not nonempty.any():
+        return count, mean, m2
+
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    segment_count = np.add.reduceat(valid.astype(np.float64), bounds)
+    segment_mean = np.divide(
+        np.add.reduceat(filled, bounds), segment_count,
+        out=np.zeros(len(bounds)), where=segment_count > 0,
+    )
+    start = bounds[0]  # The rows before the first window are in no segment
+    lengths = np.diff(np.append(bounds, len(values)))
+    deviations = np.where(valid[start:], filled[start:] - np.repeat(segment_mean, lengths), 0.0)
+    segments = (segment_count, segment_mean, np.add.reduceat(deviations * deviations, bounds - start))
+    count[nonempty], mean[nonempty], m2[nonempty] = _range_combine(_merge_moments, segments, first, last)
+    return count, mean, m2
+
+
+def _window_distinct(codes, lo, hi):
+    """
+    Counts the distinct codes of `codes[lo:hi]` for every window in a single vectorized pass.
+
+    A transaction i is the first occurrence of its code inside a window iff the previous
+    occurrence `prev[i]` falls before the window start. With windows sorted by start, the windows
+    satisfying lo <= i < hi and lo > prev[i] form a contiguous range, accumulated with a difference array.
+
+    :param codes: Integer codes in timestamp order. (np.ndarray)
+    :param lo: Non-decreasing inclusive window starts. (np.ndarray)
+    :param hi: Non-decreasing exclusive window ends. (np.ndarray)
+    :return: The number of distinct codes per window. (np.ndarray)
+    """
+    n = len(codes)
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    prev_sorted = np.full(n, -1, dtype=np.int64)
+    same = sorted_codes[1:] == sorted_codes[:-1]
+    prev_sorted[1:][same] = order[:-1][same]
+    prev = np.empty(n, dtype=np.int64)
+    prev[order] = prev_sorted
+
+    positions = np.arange(n)
+    start = np.maximum(
+        np.searchsorted(lo, prev, side="right"),  # first window with lo > prev[i]
+        np.searchsorted(hi, positions, side="right"),  # first window with hi > i
+    )
+    end = np.searchsorted(lo, positions, side="right")  # windows with lo <= i
+    valid = start < end
+
+    diff = np.bincount(start[valid], minlength=len(lo) + 1) - np.bincount(
+        end[valid], minlength=len(lo) + 1
+    )
+    return np.cumsum(diff[:-1])
+
+
+def aggregate_windows(transactions, window_starts, time_delta):
+    """
+    Computes the market metrics of every [start, start + time_delta) window in one vectorized pass.
+
+    Counts and sums add segment sums, means and deviations from pairwise merges of segment moments,
+    extrema from a segment sparse table and unique senders/receivers from previous-occurrence
+    counting, so the cost is O(n log w) for n transactions and w windows instead of one database
+    round-trip per window.
+
+    :param transactions: Timestamp-sorted columns as returned by `get_protocol_transactions`. (dict)
+    :param window_starts: Window starts as int64 nanoseconds (UTC), sorted ascending. (np.ndarray)
+    :param time_delta: The window length in hours. (int)
+    :return: A dictionary mapping each name of METRIC_COLUMNS to an array aligned on `window_starts`. (dict)
+    """
+    timestamps = transactions["timestamp"]
+    lo = np.searchsorted(timestamps, window_starts, side="left")
+    hi = np.searchsorted(
+        timestamps, window_starts + np.int64(time_delta) * 3_600_000_000_000, side="left"
+    )
+    nb_tx = hi - lo
+
+    metrics = {
+        "nb_tx": nb_tx,
+        "nb_unique_senders": _window_distinct(transactions["from"], lo, hi),
+        "nb_unique_receivers": _window_distinct(transactions["to"], lo, hi),
+    }
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for column, name, total in [
+            ("value", "value_eth", "total_value_eth"),
+            ("gas_used", "gas_used", "total_gas_used"),
+        ]:
+            values = transactions[column]
+            count, mean, m2 = _window_moments(values, lo, hi)
+            metrics[total] = count * mean
+            metrics["avg_value_eth_per_tx" if column == "value" else "avg_gas_used"] = np.where(count > 0, mean, np.nan)
+            metrics[f"std_{name}"] = np.sqrt(m2 / count)
+            metrics[f"min_{name}"], metrics[f"max_{name}"] = _window_extrema(values, lo, hi)
+
+        # Mirrors the `$group` expression of the query path: mean of the even-valued transactions
+        values = transactions["value"]
+        even = np.mod(values, 2) == 0
+        even_count, even_sum, errors = _window_sums(
+            [even, np.where(even, values, 0.0), transactions["is_error"]], lo, hi
+        )
+        metrics["median_value_eth"] = even_sum / even_count
+        metrics["num_errors"] = errors.astype(np.int64)
+        metrics["error_rate"] = metrics["num_errors"] / nb_tx
+
+    empty = nb_tx == 0  # Windows without transactions are reported as zeros, as in the query path
+    for name in METRIC_COLUMNS:
+        metrics[name] = np.where(empty, 0, metrics[name])
+    return metrics
+
+
+def aggregate_transactions_columnar(df, transactions, time_deltas=(1, 24)):
+    """
+    Enriches the market rows of one protocol with the aggregated transaction metrics of several windows.
+
+    Drop-in replacement of successive `aggregate_transactions` calls: the protocol's transactions are
+    scanned once (see `get_protocol_transactions`) and every window length is computed from the same arrays.
+
+    :param df: A DataFrame containing the timestamps and protocol names of one protocol.
+    :param transactions: Timestamp-sorted columns as returned by `get_protocol_transactions`. (dict)
+    :param time_deltas: The time intervals (in hours) to aggregate. (tuple)
+    :return: A DataFrame enriched with the `<metric>_<time_delta>h` columns.
+    """
+    window_starts = (
+        pd.DatetimeIndex(pd.to_datetime(df["timestamp"], utc=True)).as_unit("ns").asi8
+    )
+    order = np.argsort(window_starts, kind="stable")
+
+    enriched_df = df.copy()
+    for time_delta in time_deltas:
+        metrics = aggregate_windows(transactions, window_starts[order], time_delta)
+        for name in METRIC_COLUMNS:
+            column = np.empty_like(metrics[name])
+            column[order] = metrics[name]
+            enriched_df[f"{name}_{time_delta}h"] = column
+
+    return enriched_df
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import logging
 
@@ -25,3 +26,103 @@ def get_market_data(protocol_name):
 
     except Exception as e:
         logger.error(f"An error occurred: {e}")
+
+
+def encode_addresses(values, vocabulary: dict) -> np.ndarray:
+    """
+    Dictionary-encodes a chunk of addresses into integer codes.
+
+    :param values: The addresses of the chunk (list or array).
+    :param vocabulary: A mapping address -> code shared between chunks, extended in place.
+    :return: The integer codes of the addresses. (np.ndarray)
+    """
+    local_codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=False)
+    mapping = np.fromiter(
+        (vocabulary.setdefault(address, len(vocabulary)) for address in uniques),
+        dtype=np.int64,
+        count=len(uniques),
+    )
+    return mapping[local_codes]
+
+
+def get_protocol_transactions(protocol_name, batch_size=100000, collection=None):
+    """
+    Streams the transactions of a protocol once and returns them as timestamp-sorted columns.
+
+    The cursor is consumed in batches of `batch_size` documents, each batch being converted to
+    NumPy arrays before the next one is fetched, so no per-document Python object outlives its batch.
+
+    :param protocol_name: Name of the protocol to filter the transactions. (str)
+    :param batch_size: Number of documents converted at once. (int)
+    :param collection: Optional transactions collection, defaults to `defi_db.transactions`.
+    :return: A dictionary of arrays `timestamp` (int64 ns, UTC), `from`, `to` (int64 codes),
+             `value`, `gas_used` (float64) and `is_error` (bool), sorted by timestamp. (dict)
+    """
+    if collection is None:
+        collection = get_mongo_collection(
+            db_name="defi_db", collection_name="transactions"
+        )
+    cursor = collection.find(
+        {"metadata.protocol_name": protocol_name},
+        {
+            "_id": 0,
+            "timestamp": 1,
+            "from": 1,
+            "to": 1,
+            "value (ETH)": 1,
+            "gas_used": 1,
+            "is_error": 1,
+        },
+        batch_size=batch_size,
+    )
+
+    vocabulary = {}
+    chunks = {
+        key: [] for key in ["timestamp", "from", "to", "value", "gas_used", "is_error"]
+    }
+
+    def flush(batch):
+        frame = pd.DataFrame(batch)
+        for column in ["value (ETH)", "gas_used", "is_error", "from", "to"]:
+            if column not in frame.columns:
+                frame[column] = None
+        chunks["timestamp"].append(
+            pd.DatetimeIndex(pd.to_datetime(frame["timestamp"], utc=True))
+            .as_unit("ns")
+            .asi8
+        )
+        chunks["from"].append(encode_addresses(frame["from"], vocabulary))
+        chunks["to"].append(encode_addresses(frame["to"], vocabulary))
+        chunks["value"].append(
+            pd.to_numeric(frame["value (ETH)"], errors="coerce").to_numpy(np.float64)
+        )
+        chunks["gas_used"].append(
+            pd.to_numeric(frame["gas_used"], errors="coerce").to_numpy(np.float64)
+        )
+        chunks["is_error"].append((frame["is_error"] == "1").to_numpy(bool))
+
+    batch = []
+    for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    if not chunks["timestamp"]:
+        return {
+            "timestamp": np.empty(0, dtype=np.int64),
+            "from": np.empty(0, dtype=np.int64),
+            "to": np.empty(0, dtype=np.int64),
+            "value": np.empty(0, dtype=np.float64),
+            "gas_used": np.empty(0, dtype=np.float64),
+            "is_error": np.empty(0, dtype=bool),
+        }
+
+    columns = {key: np.concatenate(parts) for key, parts in chunks.items()}
+    order = np.argsort(columns["timestamp"], kind="stable")
+    logger.info(
+        f"Loaded {len(order)} transactions ({len(vocabulary)} addresses) for protocol {protocol_name}."
+    )
+    return {key: values[order] for key, values in columns.items()}
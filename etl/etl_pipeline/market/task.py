@@ -3,8 +3,8 @@ from datetime import datetime
 import multiprocessing
 from tqdm import tqdm
 
-from .extract_market import get_market_data
-from .aggregate import aggregate_transactions
+from .extract_market import get_market_data, get_protocol_transactions
+from .aggregate import aggregate_transactions, aggregate_transactions_columnar
 from .load import load_df_to_mongo
 from ..mongodb_handler import get_mongo_database
 
@@ -21,27 +21,33 @@ def wrapped_enrich(args):
         - end_date (datetime): The end date for the enrichment.
         - counter (multiprocessing.Value): A shared counter to track the progress.
         - lock (multiprocessing.Lock): A lock to ensure thread safety when updating the counter.
+        - engine (str): "columnar" (single scan of the protocol's transactions) or "query" (one Mongo aggregation per row).
     :return: None
     :raise: Exception: If an error occurs during the enrichment process.
     """
-    protocol, start_date, end_date, counter, lock = args
+    protocol, start_date, end_date, counter, lock, engine = args
     try:
         df = get_market_data(protocol)
-        df = aggregate_transactions(df, time_delta=1)
-        df = aggregate_transactions(df, time_delta=24)
+        if engine == "columnar":
+            transactions = get_protocol_transactions(protocol)
+            df = aggregate_transactions_columnar(df, transactions, time_deltas=(1, 24))
+        else:
+            df = aggregate_transactions(df, time_delta=1)
+            df = aggregate_transactions(df, time_delta=24)
         load_df_to_mongo(df)
         logger.info(f"Enriched data for protocol {protocol}.\n {df.describe()}")
     except Exception as e:
         logger.error(f"Error enriching protocol {protocol}: {e}")
 
 
-def aggregation_task(start_date, end_date):
+def aggregation_task(start_date, end_date, engine="columnar"):
     """
     Main function to enrich the old_market collection with aggregated metrics for all protocols
     within a given date range.
 
     :param start_date: The start date (string in 'YYYY-MM-DD' format) for the enrichment.
     :param end_date: The end date (string in 'YYYY-MM-DD' format) for the enrichment.
+    :param engine: "columnar" to aggregate each protocol in a single scan, "query" for the per-row Mongo aggregations.
     :return: None
     :raise: Exception: If an error occurs during the database retrieval or task execution.
     """
@@ -61,7 +67,10 @@ def aggregation_task(start_date, end_date):
     counter = manager.Value("i", 0)
     lock = manager.Lock()
 
-    tasks = [(protocol, start_date, end_date, counter, lock) for protocol in protocols]
+    tasks = [
+        (protocol, start_date, end_date, counter, lock, engine)
+        for protocol in protocols
+    ]
     # tasks = [(protocol, start_date, end_date, counter, lock) for protocol in protocols if protocol == "NFTFI"]
 
     logger.info("Launching multiprocessing pool...")
@@ -1,22 +1,172 @@
 import logging
+import os
+import threading
+import time
 
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 
+from .config import MONGO_MAX_POOL_SIZE, MONGO_URI
 
-def get_mongo_client(mongo_uri="mongodb://localhost:27017/"):
+_clients = {}  # (pid, uri) -> MongoClient, shared by the threads of a process
+_metrics = {}  # (pid, uri) -> PoolMetrics
+_lock = threading.Lock()
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+    """
+    Connection pool and command latency metrics of a client, fed by the pymongo monitoring events.
     """
-    Connects to a MongoDB server and returns the client object.
-    :param: mongo_uri (str): URI of the MongoDB server. Default is 'mongodb://localhost:27017'.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created_at = time.time()
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checked_out = 0  # Connections currently in use
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0  # Wait queue timeouts are the sign of a saturated pool
+        self.checkout_wait_seconds = 0.0
+        self.commands = 0
+        self.command_failures = 0
+        self.command_seconds = 0.0
+        self.max_command_seconds = 0.0
+
+    # Connection pool events
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkout_wait_seconds += getattr(event, "duration", 0.0) or 0.0
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    # Command events
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._command(event)
+
+    def failed(self, event):
+        with self._lock:
+            self.command_failures += 1
+        self._command(event)
+
+    def _command(self, event):
+        seconds = event.duration_micros / 1e6
+        with self._lock:
+            self.commands += 1
+            self.command_seconds += seconds
+            self.max_command_seconds = max(self.max_command_seconds, seconds)
+
+    def snapshot(self) -> dict:
+        """Returns the current values of the metrics, with the derived averages."""
+        with self._lock:
+            metrics = {
+                key: value for key, value in vars(self).items() if not key.startswith("_")
+            }
+        metrics["open_connections"] = (
+            metrics["connections_created"] - metrics["connections_closed"]
+        )
+        metrics["avg_checkout_wait_ms"] = (
+            1000 * metrics["checkout_wait_seconds"] / max(metrics["checkouts"], 1)
+        )
+        metrics["avg_command_ms"] = (
+            1000 * metrics["command_seconds"] / max(metrics["commands"], 1)
+        )
+        return metrics
+
+
+def get_mongo_client(mongo_uri=None):
+    """
+    Returns the MongoDB client of the current process, creating it on first use.
+    Clients are shared by every caller of a process and are created lazily after a fork,
+    so a child process never reuses the connection pool of its parent.
+    :param: mongo_uri (str): URI of the MongoDB server. Defaults to `MONGO_URI` from the config.
     :return: MongoClient: The MongoDB client object.
     :raise: ValueError: If the URI is invalid.
     """
-    try:
-        client = MongoClient(mongo_uri)
-        logging.info("Connected to MongoDB at %s", mongo_uri)
+    mongo_uri = mongo_uri or MONGO_URI
+    key = (os.getpid(), mongo_uri)
+    client = _clients.get(key)
+    if client is not None:
         return client
-    except Exception as e:
-        logging.error("Failed to connect to MongoDB: %s", e)
-        raise ValueError(f"Invalid URI: {mongo_uri}") from e
+
+    with _lock:
+        if key in _clients:
+            return _clients[key]
+        for stale in [k for k in _clients if k[0] != key[0]]:
+            # Inherited from the parent process: drop without closing the parent's sockets.
+            del _clients[stale]
+            _metrics.pop(stale, None)
+        try:
+            metrics = PoolMetrics()
+            client = MongoClient(
+                mongo_uri, maxPoolSize=MONGO_MAX_POOL_SIZE, event_listeners=[metrics]
+            )
+            logging.info("Connected to MongoDB at %s", mongo_uri)
+        except Exception as e:
+            logging.error("Failed to connect to MongoDB: %s", e)
+            raise ValueError(f"Invalid URI: {mongo_uri}") from e
+        _clients[key] = client
+        _metrics[key] = metrics
+        return client
+
+
+def get_mongo_metrics(mongo_uri=None) -> dict:
+    """
+    Returns the connection pool and latency metrics of the client of the current process.
+    :param: mongo_uri (str): URI of the MongoDB server. Defaults to `MONGO_URI` from the config.
+    :return: dict: The metrics, empty if no client was created yet.
+    """
+    metrics = _metrics.get((os.getpid(), mongo_uri or MONGO_URI))
+    return metrics.snapshot() if metrics is not None else {}
+
+
+def close_mongo_clients():
+    """
+    Closes the MongoDB clients of the current process. The next call to `get_mongo_client`
+    creates a new one.
+    """
+    with _lock:
+        for key in [k for k in _clients if k[0] == os.getpid()]:
+            logging.info(f"MongoDB pool metrics for {key[1]}: {_metrics[key].snapshot()}")
+            _clients.pop(key).close()
+            _metrics.pop(key)
 
 
 def get_mongo_database(db_name):
@@ -25,7 +175,7 @@ def get_mongo_database(db_name):
     :param db_name: Name of the database (str)
     :return: Database instance
     """
-    client = MongoClient()
+    client = get_mongo_client()
     return client[db_name]
 
 
@@ -38,7 +188,7 @@ def get_mongo_collection(db_name, collection_name):
     :raise: ConnectionError: If the connection to MongoDB fails.
     """
     try:
-        client = MongoClient()
+        client = get_mongo_client()
         database = client[db_name]
         collection = database[collection_name]
 
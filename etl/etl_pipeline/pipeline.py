@@ -23,6 +23,7 @@ def process_etl_pipeline(
     protocols=False,
     contracts=False,
     transactions=False,
+    incremental=False,
     users=False,
     price=False,
     market=False,
@@ -38,6 +39,7 @@ def process_etl_pipeline(
     logger.info(f"protocols: {protocols}")
     logger.info(f"contracts: {contracts}")
     logger.info(f"transactions: {transactions}")
+    logger.info(f"incremental: {incremental}")
     logger.info(f"users: {users}")
     logger.info(f"price: {price}")
     logger.info(f"market: {market}")
@@ -71,7 +73,9 @@ def process_etl_pipeline(
     if transactions:
         console.rule("Step 3: Fetching Associated Transactions")
         logger.info("Fetching associated transactions...")
-        process_ethereum_contracts(start_date="2023-01-01", end_date="2024-12-31")
+        process_ethereum_contracts(
+            start_date="2023-01-01", end_date="2024-12-31", incremental=incremental
+        )
         logger.info("Transactions fetched successfully.\n")
     else:
         logger.warning("No transactions fetching asked. Skipping step 3.\n")
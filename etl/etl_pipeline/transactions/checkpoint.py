@@ -0,0 +1,74 @@
+import logging
+from datetime import datetime
+
+from ..mongodb_handler import get_mongo_collection
+
+
+def get_checkpoints_collection():
+    """
+    Returns the collection holding the ingestion checkpoint of each contract.
+
+    :return: The `checkpoints` collection of `defi_db`, indexed by contract id. (Collection)
+    """
+    collection = get_mongo_collection(db_name="defi_db", collection_name="checkpoints")
+    collection.create_index([("contract_id", 1)], unique=True)
+    return collection
+
+
+def get_checkpoint(contract_id: str, collection=None):
+    """
+    Retrieves the ingestion checkpoint of a contract.
+
+    :param contract_id: The unique identifier for the contract. (str)
+    :param collection: Optional checkpoints collection. Defaults to `defi_db.checkpoints`.
+    :return: The checkpoint document, with the `start_block` and the `last_block` fully
+             ingested, or None if the contract was never ingested. (dict)
+    """
+    collection = collection if collection is not None else get_checkpoints_collection()
+    return collection.find_one({"contract_id": contract_id}, {"_id": 0})
+
+
+def save_checkpoint(contract_id: str, start_block: int, last_block: int, collection=None):
+    """
+    Records that every block of a contract between `start_block` and `last_block` is ingested.
+
+    :param contract_id: The unique identifier for the contract. (str)
+    :param start_block: The first block of the ingested range. (int)
+    :param last_block: The highest block fully ingested. (int)
+    :param collection: Optional checkpoints collection. Defaults to `defi_db.checkpoints`.
+    :return: None
+    """
+    collection = collection if collection is not None else get_checkpoints_collection()
+    collection.update_one(
+        {"contract_id": contract_id},
+        {
+            "$set": {
+                "start_block": start_block,
+                "last_block": last_block,
+                "updated_at": datetime.utcnow(),
+            }
+        },
+        upsert=True,
+    )
+    logging.info(f"Checkpoint of contract '{contract_id}' saved at block {last_block}.")
+
+
+def resume_block(checkpoint, start_block: int):
+    """
+    Computes the block to resume the ingestion of a contract from.
+
+    The checkpoint is only used when it covers `start_block` contiguously, otherwise the
+    requested range would be left with a gap.
+
+    :param checkpoint: The checkpoint document of the contract, or None. (dict)
+    :param start_block: The first block requested. (int)
+    :return: The first block to fetch. (int)
+    """
+    if checkpoint is None:
+        return start_block
+    if checkpoint["start_block"] <= start_block <= checkpoint["last_block"] + 1:
+        return checkpoint["last_block"] + 1
+    logging.warning(
+        f"Checkpoint of contract '{checkpoint['contract_id']}' does not cover block {start_block}, ignoring it."
+    )
+    return start_block
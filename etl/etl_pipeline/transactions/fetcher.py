@@ -0,0 +1,345 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..config import ETH_API_KEY, ETHERSCAN_API_URL, ETHERSCAN_CALLS_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 10000  # API-imposed limit of rows per query (page * offset)
+
+
+class TokenBucket:
+    """
+    Asynchronous token bucket shared by every request of a fetcher, with an adaptive rate:
+    halved on each rate-limit answer and raised back toward the configured rate by a tenth of
+    it after every second of calls without one (additive increase, multiplicative decrease).
+
+    :param rate: Tokens added per second, i.e. the sustained calls per second. (float)
+    :param capacity: Maximum burst size. Defaults to `rate`. (float)
+    :param min_rate: Floor of the rate when slowing down. (float)
+    """
+
+    def __init__(self, rate: float, capacity: float = None, min_rate: float = 0.5):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.successes = 0  # Calls answered since the last change of rate
+        self.lock, self.loop = None, None
+
+    async def acquire(self):
+        """Waits until a token is available and consumes it."""
+        if self.loop is not asyncio.get_running_loop():  # A lock serves one `asyncio.run`
+            self.lock, self.loop = asyncio.Lock(), asyncio.get_running_loop()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def slow_down(self):
+        """Halves the rate after a rate-limit answer."""
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.successes = 0
+
+    def succeeded(self):
+        """Counts an answered call; a second of them raises the rate by a tenth of the configured one."""
+        self.successes += 1
+        if self.rate < self.max_rate and self.successes >= self.rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+            self.successes = 0
+
+
+class RateLimitError(Exception):
+    """Raised when the API answers that the rate limit is reached."""
+
+
+class TransientError(Exception):
+    """Raised when the API answers with a server error (5xx), which a later call may not get."""
+
+
+class EtherscanFetcher:
+    """
+    Rate-limited, adaptive fetcher of the token transfers of a contract.
+
+    Block ranges are fetched concurrently through one pooled HTTP session, every call
+    going through a shared token bucket. A range returning `MAX_RESULTS` rows may be
+    truncated, so it is split in two and refetched; the step of the next ranges is halved
+    after a split and doubled after a sparse range, so dense periods use narrow ranges and
+    quiet periods few calls. A single block of `MAX_RESULTS` rows is fetched from both ends
+    (see `fetch_block`). One fetcher serves every range of a contract, so its session,
+    threads and learned rate are reused from one checkpoint window to the next.
+
+    :param api_key: The Etherscan API key. (str)
+    :param base_url: The API endpoint, e.g. a local stub server. (str)
+    :param calls_per_second: The API rate limit. (float)
+    :param max_concurrency: Maximum number of requests in flight. (int)
+    :param initial_step: Initial number of blocks per range. (int)
+    :param max_step: Maximum number of blocks per range. (int)
+    :param max_retries: Retries of a call on rate limit or transient errors. (int)
+    :param record_dir: Optional directory where every page received is saved as JSON, to be
+                       replayed by `scripts/etherscan_stub_server.py`. (str)
+    """
+
+    def __init__(
+        self,
+        api_key: str = ETH_API_KEY,
+        base_url: str = ETHERSCAN_API_URL,
+        calls_per_second: float = ETHERSCAN_CALLS_PER_SECOND,
+        max_concurrency: int = 4,
+        initial_step: int = 5000,
+        max_step: int = 500000,
+        max_retries: int = 8,
+        record_dir: str = None,
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.calls_per_second = calls_per_second
+        self.max_concurrency = max_concurrency
+        self.initial_step = initial_step
+        self.max_step = max_step
+        self.max_retries = max_retries
+        self.record_dir = record_dir
+        self.session = requests.Session()
+        self.session.mount(
+            "http://", HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        )
+        self.session.mount(
+            "https://", HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        )
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self.bucket = TokenBucket(calls_per_second)
+        self.calls = 0
+        self.splits = 0
+        self.failed = []  # Block ranges given up on by the last `fetch_range`
+
+    def close(self):
+        """Releases the HTTP connection pool and the worker threads."""
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+    def _get(self, params: dict) -> dict:
+        """Sends one request through the pooled session (blocking, runs in the executor)."""
+        response = self.session.get(self.base_url, params=params, timeout=30)
+        if response.status_code == 429:
+            raise RateLimitError(response.text)
+        if response.status_code >= 500:
+            raise TransientError(f"HTTP error: {response.status_code}, response: {response.text}")
+        if response.status_code != 200:
+            raise ValueError(
+                f"HTTP error: {response.status_code}, response: {response.text}"
+            )
+        return response.json()
+
+    async def fetch_page(
+        self, contract_address: str, start_block: int, end_block: int, sort: str = "asc"
+    ):
+        """
+        Fetches the transfers of a contract between two blocks (inclusive), in one call.
+
+        :param sort: Order of the transfers, "asc" or "desc". (str)
+        :return: The transactions, at most `MAX_RESULTS`. (list)
+        :raise ValueError: If the API keeps answering with an error.
+        """
+        params = {
+            "chainid": 1,
+            "module": "account",
+            "action": "tokentx",
+            "contractaddress": contract_address,
+            "startblock": start_block,
+            "endblock": end_block,
+            "page": 1,
+            "offset": MAX_RESULTS,
+            "sort": sort,
+            "apikey": self.api_key,
+        }
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            self.calls += 1
+            try:
+                data = await loop.run_in_executor(self.executor, self._get, params)
+                if "rate limit" in str(data.get("result", "")).lower():
+                    raise RateLimitError(data["result"])
+                self.bucket.succeeded()
+                if data.get("status") == "1" and "result" in data:
+                    self._record(contract_address, start_block, end_block, data)
+                    return data["result"]
+                if data.get("message") == "No transactions found":
+                    return []
+                raise ValueError(
+                    f"Error retrieving transactions: {data.get('message', 'Unknown error')}"
+                )
+            except (RateLimitError, TransientError, requests.RequestException) as e:
+                if isinstance(e, RateLimitError):  # The current rate is too high
+                    self.bucket.slow_down()
+                    logger.warning(f"Rate limit reached, slowing down to {self.bucket.rate} calls/s.")
+                else:
+                    logger.warning(f"Blocks {start_block}-{end_block}, attempt {attempt + 1}: {e}")
+                if attempt == self.max_retries:
+                    raise ValueError(
+                        f"Giving up on blocks {start_block}-{end_block}: {e}"
+                    ) from e
+                await asyncio.sleep(2**attempt / self.calls_per_second)
+
+    async def fetch_block(self, contract_address: str, block: int, first: list = None):
+        """
+        Fetches the transfers of a block holding `MAX_RESULTS` of them or more. The API caps a
+        query at `MAX_RESULTS` rows whatever the paging, so the block is read from both ends;
+        the two pages overlap when together they hold every transfer of the block.
+
+        :param first: The page of the block already fetched in ascending order, if any. (list)
+        :return: The transactions of the block. (list)
+        :raise ValueError: If the pages do not overlap: the block holds more than
+                           `2 * MAX_RESULTS` transfers and some of them cannot be fetched.
+        """
+        if first is None:
+            first = await self.fetch_page(contract_address, block, block)
+        if len(first) < MAX_RESULTS:
+            return first
+        last = await self.fetch_page(contract_address, block, block, sort="desc")
+
+        def key(tx):
+            return tx.get("hash"), tx.get("logIndex")
+
+        seen = {key(tx) for tx in first}
+        if not any(key(tx) in seen for tx in last):
+            raise ValueError(
+                f"Block {block} holds more than {2 * MAX_RESULTS} transfers, which the API cannot return."
+            )
+        return first + [tx for tx in reversed(last) if key(tx) not in seen]
+
+    def _record(self, contract_address, start_block, end_block, data):
+        """Saves a page received from the API for later replay."""
+        if not self.record_dir:
+            return
+        os.makedirs(self.record_dir, exist_ok=True)
+        path = os.path.join(
+            self.record_dir, f"{contract_address}_{start_block}_{end_block}.json"
+        )
+        with open(path, "w") as f:
+            json.dump(data, f)
+
+    async def fetch_range(self, contract_address: str, start_block: int, end_block: int):
+        """
+        Fetches every transfer of a contract between two blocks (inclusive).
+
+        :return: The transactions, sorted by block number. (list)
+        """
+        self.failed = []
+        step = self.initial_step
+        next_start = start_block
+        pending = []  # Ranges to refetch after a split
+        results = []
+
+        def next_range():
+            nonlocal next_start
+            if pending:
+                return pending.pop()
+            if next_start > end_block:
+                return None
+            block_range = (next_start, min(next_start + step - 1, end_block))
+            next_start = block_range[1] + 1
+            return block_range
+
+        in_flight = 0
+
+        async def process(low, high):
+            nonlocal step
+            try:
+                txs = await self.fetch_page(contract_address, low, high)
+            except ValueError as e:
+                logger.error(f"Error fetching transactions for blocks {low}-{high}: {e}")
+                self.failed.append((low, high))
+                return
+            if len(txs) >= MAX_RESULTS and high > low:
+                middle = (low + high) // 2
+                pending.extend([(middle + 1, high), (low, middle)])
+                step = max(1, min(step, high - low + 1) // 2)
+                self.splits += 1
+                return
+            if len(txs) >= MAX_RESULTS:
+                try:
+                    txs = await self.fetch_block(contract_address, low, first=txs)
+                except ValueError as e:
+                    logger.error(str(e))
+                    self.failed.append((low, high))
+                    return
+            elif len(txs) < MAX_RESULTS // 4:
+                step = min(self.max_step, step * 2)
+            results.append((low, txs))
+
+        async def worker():
+            nonlocal in_flight
+            while True:
+                block_range = next_range()
+                if block_range is None:
+                    if not in_flight:
+                        return
+                    await asyncio.sleep(0.05)  # An in-flight range may still be split
+                    continue
+                in_flight += 1
+                try:
+                    await process(*block_range)
+                finally:
+                    in_flight -= 1
+
+        await asyncio.gather(*(worker() for _ in range(self.max_concurrency)))
+        results.sort(key=lambda item: item[0])
+        return [tx for _, txs in results for tx in txs]
+
+
+def fetch_contract_transactions(
+    contract_address: str,
+    start_block: int,
+    end_block: int,
+    fetcher: EtherscanFetcher = None,
+    **kwargs,
+):
+    """
+    Fetches every transfer of a contract between two blocks with an `EtherscanFetcher`.
+
+    :param contract_address: The Ethereum contract address to fetch transactions for. (str)
+    :param start_block: The starting block number for the range. (int)
+    :param end_block: The ending block number for the range. (int)
+    :param fetcher: The fetcher of the contract, reused across calls; a new one, closed on
+                    return, is built from `kwargs` when not given. (EtherscanFetcher)
+    :param kwargs: Options of the `EtherscanFetcher`.
+    :return: A list of transactions that occurred within the given block range. (list)
+    :raise ValueError: If some block ranges could not be fetched, so that callers never
+                       record a partially fetched range as ingested.
+    """
+    owned = fetcher is None
+    fetcher = EtherscanFetcher(**kwargs) if owned else fetcher
+    calls, splits = fetcher.calls, fetcher.splits
+    try:
+        transactions = asyncio.run(
+            fetcher.fetch_range(contract_address, start_block, end_block)
+        )
+        logger.info(
+            f"{len(transactions)} transactions fetched in {fetcher.calls - calls} calls "
+            f"({fetcher.splits - splits} splits, {fetcher.bucket.rate:g} calls/s)."
+        )
+        if fetcher.failed:
+            raise ValueError(
+                f"{len(fetcher.failed)} block ranges could not be fetched: {sorted(fetcher.failed)}"
+            )
+        return transactions
+    finally:
+        if owned:
+            fetcher.close()
@@ -1,7 +1,9 @@
 import logging
 from datetime import datetime
 
-from pymongo import UpdateOne
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
 
 from ..mongodb_handler import get_mongo_collection
 
@@ -13,6 +15,7 @@ def upsert_transactions(
     Adds transactions to a time-series collection.
     Does not reinsert transactions that are already present.
     Uses a bulk approach for optimized performance.
+    The indexes are created once by `setup_transactions_collection`.
 
     :param protocol_name: The name of the protocol for the contract. (str)
     :param contract_type: The type of the contract. (str)
@@ -22,16 +25,11 @@ def upsert_transactions(
 
     :return: None
 
-    :raise Exception: If there is an error during the upsert operation in MongoDB.
+    :raise ValueError: If there is an error during the upsert operation in MongoDB.
     """
     transactions_collection = get_mongo_collection(
         db_name="defi_db", collection_name="transactions"
     )
-    transactions_collection.create_index(
-        [("transaction_hash", 1)]
-    )  # Index by transaction hash
-    transactions_collection.create_index([("timestamp", 1)])  # Index by timestamp
-
     bulk_operations = []
 
     for tx in transactions:
@@ -99,3 +97,165 @@ def upsert_transactions(
             logging.info(f"{result.upserted_count} new transactions added to MongoDB.")
         except Exception as e:
             logging.error(f"Error inserting transactions into MongoDB: {e}")
+            raise ValueError(f"Error inserting transactions into MongoDB: {e}") from e
+
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def setup_transactions_collection(collection=None):
+    """
+    Creates the indexes of the transactions collection. Meant to run once before an ingestion,
+    not on every batch.
+
+    :param collection: Optional transactions collection. Defaults to `defi_db.transactions`.
+    :return: The transactions collection. (Collection)
+    """
+    if collection is None:
+        collection = get_mongo_collection(
+            db_name="defi_db", collection_name="transactions"
+        )
+    collection.create_index(
+        [("transaction_hash", ASCENDING)], unique=True
+    )  # Dedup key of the insert-only path
+    collection.create_index([("timestamp", ASCENDING)])
+    collection.create_index([("metadata.contract_id", ASCENDING)])
+    collection.create_index(
+        [("metadata.protocol_name", ASCENDING), ("timestamp", ASCENDING)]
+    )  # Per protocol time ranges, used by the partitioned export
+    return collection
+
+
+def load_known_hashes(contract_id: str = None, collection=None) -> set:
+    """
+    Loads the hashes of the transactions already stored, to skip them before inserting.
+
+    :param contract_id: Optional contract to restrict the hashes to, which bounds the size of the set. (str)
+    :param collection: Optional transactions collection. Defaults to `defi_db.transactions`.
+    :return: The set of stored transaction hashes. (set)
+    """
+    if collection is None:
+        collection = get_mongo_collection(
+            db_name="defi_db", collection_name="transactions"
+        )
+    query = {} if contract_id is None else {"metadata.contract_id": contract_id}
+    cursor = collection.find(query, {"_id": 0, "transaction_hash": 1}).batch_size(
+        100000
+    )
+    return {doc["transaction_hash"] for doc in cursor if "transaction_hash" in doc}
+
+
+def _optional_float(transactions: list, key: str, scale: float = 1.0) -> list:
+    """Parses a numeric field of the whole batch at once, None where the key is missing."""
+    values = np.array([tx.get(key) for tx in transactions], dtype=np.float64) / scale
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def build_transaction_documents(
+    protocol_name, contract_type, contract_id, blockchain, transactions
+) -> list:
+    """
+    Builds the documents of the transactions collection from Etherscan records, parsing
+    the numeric fields of the whole batch at once with NumPy.
+    See `upsert_transactions` for the meaning of the fields.
+
+    :param protocol_name: The name of the protocol for the contract. (str)
+    :param contract_type: The type of the contract. (str)
+    :param contract_id: The unique identifier for the contract. (str)
+    :param blockchain: The blockchain platform (e.g., "ethereum"). (str)
+    :param transactions: A list of transaction records from the Etherscan API. (list)
+    :return: The transaction documents. (list)
+    """
+    if not transactions:
+        return []
+    timestamps = (
+        np.array([tx["timeStamp"] for tx in transactions], dtype=np.int64)
+        .astype("datetime64[s]")
+        .tolist()
+    )
+    values = _optional_float(transactions, "value", 10**18)
+    gas = _optional_float(transactions, "gas")
+    gas_used = _optional_float(transactions, "gasUsed")
+    metadata = {
+        "protocol_name": protocol_name,
+        "type": contract_type,
+        "blockchain": blockchain,
+        "contract_id": contract_id,
+    }
+    return [
+        {
+            "timestamp": timestamps[i],
+            "metadata": dict(metadata),
+            "from": tx["from"],
+            "tx_hash": tx["hash"],
+            "transaction_hash": tx["hash"],  # Dedup key, read by the users extraction
+            "to": tx["to"],
+            "value (ETH)": values[i],
+            "gas": gas[i],
+            "gas_used": gas_used[i],
+            "is_error": tx.get("isError", "0"),
+            "error_code": tx.get("errCode", ""),
+            "trace_id": tx.get("traceId", ""),
+        }
+        for i, tx in enumerate(transactions)
+    ]
+
+
+def insert_transactions(
+    protocol_name,
+    contract_type,
+    contract_id,
+    blockchain,
+    transactions,
+    known_hashes: set = None,
+    collection=None,
+    batch_size: int = 50000,
+):
+    """
+    Insert-only fast path of `upsert_transactions`.
+    Skips the transactions whose hash is in `known_hashes` (or repeated in the batch) and inserts
+    the others with unordered `insert_many`. The unique index on `transaction_hash` catches the
+    duplicates the set missed, which are ignored.
+
+    :param protocol_name: The name of the protocol for the contract. (str)
+    :param contract_type: The type of the contract. (str)
+    :param contract_id: The unique identifier for the contract. (str)
+    :param blockchain: The blockchain platform (e.g., "ethereum"). (str)
+    :param transactions: A list of transaction records from the Etherscan API. (list)
+    :param known_hashes: Hashes already stored, see `load_known_hashes`; updated in place. (set)
+    :param collection: Optional transactions collection. Defaults to `defi_db.transactions`.
+    :param batch_size: Number of documents per `insert_many` call. (int)
+    :return: The number of inserted transactions. (int)
+    :raise ValueError: If an insertion fails for another reason than a duplicate hash.
+    """
+    if collection is None:
+        collection = get_mongo_collection(
+            db_name="defi_db", collection_name="transactions"
+        )
+    known_hashes = set() if known_hashes is None else known_hashes
+
+    new_transactions = []
+    for tx in transactions:
+        if tx["hash"] not in known_hashes:
+            known_hashes.add(tx["hash"])
+            new_transactions.append(tx)
+    documents = build_transaction_documents(
+        protocol_name, contract_type, contract_id, blockchain, new_transactions
+    )
+
+    inserted = 0
+    for i in range(0, len(documents), batch_size):
+        try:
+            result = collection.insert_many(documents[i : i + batch_size], ordered=False)
+            inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in errors):
+                logging.error(f"Error inserting transactions into MongoDB: {e}")
+                raise ValueError(f"Error inserting transactions into MongoDB: {e}") from e
+            inserted += e.details.get("nInserted", 0)
+
+    logging.info(
+        f"{inserted} new transactions added to MongoDB ({len(transactions) - len(new_transactions)} known skipped)."
+    )
+    return inserted
@@ -1,51 +1,64 @@
 import logging
+import math
+import os
+import pickle
+import resource
+import shutil
 import time
+import tracemalloc
 import uuid
+import zlib
 from collections import defaultdict
+from itertools import chain, islice
 from multiprocessing import Pool, cpu_count
 
-from .load import load_users_data
-from .transform import transform_to_user_data
+import numpy as np
+
+from .load import FLUSH_BATCH_SIZE, chunk_data, load_users_data, flush_users_data
+from .transform import UserTransactions, transform_to_user_data, reduce_user_data
+from ..config import USERS_MAX_ADDRESS_TRANSACTIONS, USERS_MEMORY_BUDGET_MB, USERS_SPILL_DIR
 from ..mongodb_handler import get_mongo_collection
 
+TRANSACTIONS_PROJECTION = {
+    "_id": 0,
+    "from": 1,
+    "transaction_hash": 1,
+    "to": 1,
+    "value (ETH)": 1,
+    "gas_used": 1,
+    "timestamp": 1,
+    "metadata.protocol_name": 1,
+    "metadata.type": 1,
+    "metadata.blockchain": 1,
+    "metadata.contract_id": 1,
+}
+
 
-def process_transactions_batch(transactions: list) -> dict:
+def process_transactions_batch(transactions: list) -> UserTransactions:
     """
     Processes a batch of transactions and returns transformed user data.
 
     This function processes a list of transactions, aggregates user data, and
-    returns a dictionary mapping user addresses to their corresponding transformed
-    data. The data transformation includes transaction counts, amounts sent/received,
-    and protocol usage.
+    returns their columnar user data. The user data includes transaction counts,
+    amounts sent/received, and protocol usage, and merges with the user data of
+    other batches.
 
     :param transactions: List of transaction records, where each record contains
                          transaction details such as 'from', 'to', 'value (ETH)', etc.
     :type transactions: list[dict]
 
-    :return: A dictionary mapping user addresses to their corresponding user data.
-    :rtype: dict
+    :return: The columnar user data of the batch.
+    :rtype: UserTransactions
 
     :raises ValueError: If the transactions list is empty or contains invalid data.
     """
     batch_id = str(uuid.uuid4())
     start_time = time.time()
-    user_data = {}
 
-    transformed_data = transform_to_user_data(
+    user_data = transform_to_user_data(
         transactions
     )  # Transform the input transactions into user-specific data
 
-    for (
-        address,
-        data,
-    ) in (
-        transformed_data.items()
-    ):  # Update user data with the transformed data, aggregating by address
-        if address not in user_data:
-            user_data[address] = data
-        else:
-            user_data[address].update(data)
-
     processing_time = time.time() - start_time
     logging.info(
         f"Batch {batch_id}: Processed {len(transactions)} transactions in {processing_time:.2f} seconds."
@@ -53,7 +66,300 @@ def process_transactions_batch(transactions: list) -> dict:
     return user_data
 
 
-def extract_users() -> None:
+def address_partition(address, n_partitions: int, salt: int = 0) -> int:
+    """
+    Returns the partition owning an address.
+
+    Uses a CRC32 of the address rather than `hash()`, which is salted per process,
+    so that the parent and every worker agree on the owner. A different `salt` gives
+    the independent hash used to split an oversized partition.
+    """
+    return zlib.crc32(str(address).encode(), salt) % n_partitions
+
+
+def owned_by(address, owners: tuple) -> bool:
+    """
+    Whether an address belongs to the partition reached through `owners`, a tuple of
+    (partition, n_partitions, salt, excluded hot addresses) splits.
+    """
+    return all(
+        address not in excluded and address_partition(address, n, salt) == k
+        for k, n, salt, excluded in owners
+    )
+
+
+def measure_side_footprint(sample: list) -> float:
+    """
+    Measures the peak bytes allocated per (user, transaction) side while a worker builds, finalizes
+    and flushes the users of a sample of transactions, documents chunk included.
+
+    :param sample: A batch of transactions read from the cursor.
+    :return: The peak bytes per side, a conservative estimate of what a partition holds per side.
+    """
+    tracemalloc.start()
+    try:
+        users_data = UserTransactions.from_transactions(sample).finalize()
+        for _ in chunk_data(users_data.items(), FLUSH_BATCH_SIZE):
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / max(1, 2 * len(sample))
+
+
+def partition_capacity(num_workers: int, memory_budget_mb: int, side_footprint: float) -> int:
+    """Returns the number of sides a worker holds within its share of the memory budget."""
+    return max(1, int(memory_budget_mb * 1024**2 / num_workers / side_footprint))
+
+
+def partition_count(n_transactions: int, capacity: int, num_workers: int) -> int:
+    """
+    Returns the number of address partitions of `capacity` sides on average.
+
+    Each transaction is held twice (sender and receiver side); partitions that end up
+    larger than `capacity` under skew are split after spilling (see `plan_partitions`).
+    """
+    return max(num_workers, math.ceil(2 * n_transactions / capacity))
+
+
+def spill_transactions(
+    cursor, n_partitions: int, spill_dir: str, batch_size: int, first_batch: list = ()
+) -> tuple:
+    """
+    Reads the cursor in fixed-size batches and spills each transaction to the
+    partitions owning its sender and its receiver.
+
+    :param cursor: The MongoDB cursor over the transactions.
+    :param n_partitions: The number of address partitions.
+    :param spill_dir: The directory receiving one pickle stream per partition.
+    :param batch_size: The number of transactions held in memory at once.
+    :param first_batch: Transactions already read from the cursor, spilled first.
+    :return: A tuple (number of transactions read, list of (path, owners, None, sides) partition tasks).
+    """
+    os.makedirs(spill_dir, exist_ok=True)
+    paths = [os.path.join(spill_dir, f"partition_{k}.pkl") for k in range(n_partitions)]
+    batches = chain([list(first_batch)], chunk_data(cursor, batch_size))
+    total, sides = _spill(batches, paths, lambda address: address_partition(address, n_partitions))
+    owners = [((k, n_partitions, 0, frozenset()),) for k in range(n_partitions)]
+    return total, list(zip(paths, owners, [None] * n_partitions, sides.tolist()))
+
+
+def _spill(batches, paths: list, route) -> tuple:
+    """
+    Appends every transaction of the batches to the files of the owners of its sides.
+
+    :param route: Maps an address to the index of its file, or None when it is not owned.
+    :return: A tuple (number of transactions read, number of sides spilled per file).
+    """
+    files = [open(path, "wb") for path in paths]
+    sides = np.zeros(len(paths), dtype=np.int64)
+    total = 0
+    try:
+        for batch in batches:
+            groups = defaultdict(list)
+            for tx in batch:
+                owners = [route(tx["from"]), route(tx["to"])]
+                for owner in owners:
+                    if owner is not None:
+                        sides[owner] += 1
+                for owner in set(owners) - {None}:
+                    groups[owner].append(tx)
+            for owner, transactions in groups.items():
+                pickle.dump(transactions, files[owner], protocol=pickle.HIGHEST_PROTOCOL)
+            total += len(batch)
+    finally:
+        for f in files:
+            f.close()
+    return total, sides
+
+
+def _read_spill(path: str):
+    """Yields the transaction batches of a spill file."""
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def split_partition(path: str, owners: tuple, sides: int, capacity: int) -> list:
+    """
+    Splits an oversized partition file into partitions of at most `capacity` sides on average.
+
+    The sides of each owned address are counted first. Addresses holding more than half the
+    capacity (routers, exchanges, bridges) get a file of their own, processed in chunks by
+    `process_partition`; the other addresses are spread by a CRC salted with the split depth.
+
+    :return: A list of (path, owners, hot address or None, sides) tasks.
+    """
+    counts = defaultdict(int)
+    for transactions in _read_spill(path):
+        for tx in transactions:
+            for address in (tx["from"], tx["to"]):
+                if owned_by(address, owners):
+                    counts[address] += 1
+    hot = sorted((address for address, count in counts.items() if count > capacity // 2), key=str)
+    hot_index = {address: i for i, address in enumerate(hot)}
+    n_sub = max(2, math.ceil(2 * (sides - sum(counts[address] for address in hot)) / capacity))
+    salt = len(owners)
+    del counts
+
+    def route(address):
+        if address in hot_index:
+            return hot_index[address]
+        if owned_by(address, owners):
+            return len(hot) + address_partition(address, n_sub, salt)
+        return None
+
+    base = os.path.splitext(path)[0]
+    paths = [f"{base}_hot{i}.pkl" for i in range(len(hot))] + [
+        f"{base}_{salt}_{k}.pkl" for k in range(n_sub)
+    ]
+    _, sub_sides = _spill(_read_spill(path), paths, route)
+    os.remove(path)
+    excluded = frozenset(hot)
+    owners_of = [owners] * len(hot) + [owners + ((k, n_sub, salt, excluded),) for k in range(n_sub)]
+    hot_of = hot + [None] * n_sub
+    return list(zip(paths, owners_of, hot_of, sub_sides.tolist()))
+
+
+def plan_partitions(tasks: list, capacity: int) -> list:
+    """
+    Splits the oversized partitions until every partition fits in `capacity` sides, except the
+    files of single hot addresses, which are processed in chunks.
+
+    :param tasks: A list of (path, owners, hot address or None, sides) tasks.
+    :return: The tasks to process, empty partitions removed.
+    """
+    planned, pending = [], list(tasks)
+    while pending:
+        path, owners, hot, sides = pending.pop()
+        if sides == 0:
+            os.remove(path)
+        elif hot is not None or sides <= capacity:
+            planned.append((path, owners, hot, sides))
+        else:
+            logging.info(f"Splitting {os.path.basename(path)}: {sides} sides for a capacity of {capacity}.")
+            pending.extend(split_partition(path, owners, sides, capacity))
+    return planned
+
+
+def _hot_address_data(path: str, address, max_transactions: int) -> UserTransactions:
+    """
+    Builds the user of a hot address chunk by chunk, keeping at most `2 * max_transactions`
+    of its sides in memory; the older sides are only kept summarized (see `UserTransactions.keep_latest`).
+    """
+    users_data = UserTransactions.empty()
+    for transactions in _read_spill(path):
+        users_data = users_data.merge(
+            transform_to_user_data(transactions, owned=lambda other: other == address)
+        )
+        if len(users_data.side_user) > 2 * max_transactions:
+            users_data = users_data.keep_latest(max_transactions)
+    return users_data.keep_latest(max_transactions)
+
+
+def process_partition(args) -> int:
+    """
+    Builds the users of one address partition and flushes them straight to MongoDB.
+
+    The partition file holds every transaction touching the partition's addresses, so the
+    users are complete once it is consumed; only the sides owned by the partition are recorded.
+    Users keep their `max_transactions` most recent transactions (see `UserTransactions.keep_latest`).
+
+    :param args: A tuple (path, owners, hot address or None, sides, max_transactions).
+    :return: The number of users flushed.
+    """
+    path, owners, hot, sides, max_transactions = args
+    start_time = time.time()
+
+    if hot is not None:
+        users_data = _hot_address_data(path, hot, max_transactions)
+    else:
+        users_data = reduce_user_data(
+            transform_to_user_data(transactions, owned=lambda address: owned_by(address, owners))
+            for transactions in _read_spill(path)
+        )
+        if len(users_data) and np.diff(users_data.offsets).max() > max_transactions:
+            users_data = users_data.keep_latest(max_transactions)
+    flushed = flush_users_data(users_data)
+    os.remove(path)
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logging.info(
+        f"Partition {os.path.basename(path)} ({sides} sides): {flushed} users flushed in {time.time() - start_time:.2f} seconds (peak RSS {peak_rss_mb:.0f} MB)."
+    )
+    return flushed
+
+
+def extract_users_streaming(
+    batch_size: int = 100000,
+    num_workers: int = None,
+    memory_budget_mb: int = USERS_MEMORY_BUDGET_MB,
+    spill_dir: str = USERS_SPILL_DIR,
+    max_transactions: int = USERS_MAX_ADDRESS_TRANSACTIONS,
+) -> None:
+    """
+    Extracts user data from the transactions collection with a bounded memory footprint.
+
+    The cursor is read once in batches of `batch_size` transactions, each transaction being
+    spilled to disk under the partitions (CRC32 of the address) of its sender and receiver.
+    The bytes held per (user, transaction) side are measured on the first batch, which gives
+    the capacity of a partition within `memory_budget_mb`; partitions left larger than their
+    capacity by skewed addresses are split again, and each address too large to share a
+    partition is processed alone, chunk by chunk. Workers then build one partition at a time,
+    so each address is owned by exactly one worker, and flush the finished users to MongoDB
+    before moving on.
+
+    A user document keeps the `max_transactions` most recent transactions of its address
+    (flagged `transactions_truncated` with the count before the cut), which bounds the memory
+    of a hot address and keeps its document under the 16 MB BSON limit. Its counts, totals,
+    first_seen and protocol counts still cover all of its transactions.
+
+    :param batch_size: Number of transactions read from the cursor at once. (int)
+    :param num_workers: Number of worker processes, defaults to the CPU count. (int)
+    :param memory_budget_mb: Peak memory allowed to the workers, in MB. (int)
+    :param spill_dir: Directory receiving the partition files. (str)
+    :param max_transactions: Most recent transactions kept per address. (int)
+    :raises Exception: If there is an error connecting to MongoDB or processing the transactions.
+    """
+    num_workers = num_workers or cpu_count()
+    transactions_collection = get_mongo_collection(
+        db_name="defi_db", collection_name="transactions"
+    )
+
+    with transactions_collection.find(
+        {},  # All transactions
+        TRANSACTIONS_PROJECTION,
+        no_cursor_timeout=True,
+        batch_size=batch_size,
+    ) as cursor:
+        first_batch = list(islice(cursor, batch_size))
+        side_footprint = measure_side_footprint(first_batch)
+        capacity = partition_capacity(num_workers, memory_budget_mb, side_footprint)
+        if 2 * max_transactions > capacity:
+            max_transactions = max(1, capacity // 2)
+            logging.warning(f"Transactions kept per address lowered to {max_transactions} to fit the memory budget.")
+        n_partitions = partition_count(
+            transactions_collection.estimated_document_count(), capacity, num_workers
+        )
+        logging.info(
+            f"Streaming user extraction: {n_partitions} partitions of {capacity} sides "
+            f"({side_footprint:.0f} B per side measured), {num_workers} workers, budget {memory_budget_mb} MB."
+        )
+        total, tasks = spill_transactions(cursor, n_partitions, spill_dir, batch_size, first_batch)
+    logging.info(f"{total} transactions spilled to {spill_dir}.")
+
+    tasks = [task + (max_transactions,) for task in plan_partitions(tasks, capacity)]
+    with Pool(processes=num_workers, maxtasksperchild=1) as pool:
+        total_users = sum(pool.imap_unordered(process_partition, tasks))
+
+    shutil.rmtree(spill_dir, ignore_errors=True)
+    logging.info(f"User data extraction completed for {total_users} users.")
+
+
+def extract_users(streaming: bool = True, **kwargs) -> None:
     """
     Extracts user data from the transactions collection in MongoDB.
 
@@ -61,8 +367,13 @@ def extract_users() -> None:
     it in parallel batches, and aggregates user data. The user data is then
     loaded into the system for further analysis or storage.
 
+    :param streaming: Whether to use the bounded-memory streaming extraction
+                      (see `extract_users_streaming`, which receives `kwargs`).
     :raises Exception: If there is an error connecting to MongoDB or processing the transactions.
     """
+    if streaming:
+        return extract_users_streaming(**kwargs)
+
     logging.info("Starting to extract user data from transactions collection.")
     transactions_collection = get_mongo_collection(
         db_name="defi_db", collection_name="transactions"
@@ -74,18 +385,7 @@ def extract_users() -> None:
         logging.info("MongoDB session started.")
         with transactions_collection.find(
             {},  # All transactions
-            {
-                "from": 1,
-                "transaction_hash": 1,
-                "to": 1,
-                "value (ETH)": 1,
-                "gas_used": 1,
-                "timestamp": 1,
-                "metadata.protocol_name": 1,
-                "metadata.type": 1,
-                "metadata.blockchain": 1,
-                "metadata.contract_id": 1,
-            },
+            TRANSACTIONS_PROJECTION,
             no_cursor_timeout=True,
             session=session,
         ) as cursor:
@@ -110,19 +410,12 @@ def extract_users() -> None:
             ) as pool:  # Use multiprocessing to process the batches in parallel
                 results = pool.map(process_transactions_batch, batches)
 
-            total_users_data = {}
-
-            for result in results:  # Aggregate the user data from all batches
-                for address, data in result.items():
-                    if address not in total_users_data:
-                        total_users_data[address] = data
-                    else:
-                        total_users_data[address].update(data)
-
-            final_user_data = defaultdict(lambda: None, total_users_data)
+            final_user_data = reduce_user_data(
+                results
+            )  # Merge the user data of all batches as a tree
 
         logging.info(
             f"User data extraction completed for {len(final_user_data)} users."
         )
-        load_users_data(dict(final_user_data))
+        load_users_data(final_user_data)
         logging.info("User data loading completed.")
@@ -1,5 +1,6 @@
 import logging
 import time
+from itertools import islice
 from multiprocessing import Pool, cpu_count
 
 from pymongo import UpdateOne
@@ -10,6 +11,8 @@ from ..mongodb_handler import get_mongo_collection
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+FLUSH_BATCH_SIZE = 10000  # Users flushed to MongoDB at once by a worker
+
 
 def load_batch(batch_data: list, db_name: str, collection_name: str) -> None:
     """
@@ -38,12 +41,13 @@ def load_batch(batch_data: list, db_name: str, collection_name: str) -> None:
             logging.error(f"Failed to insert batch: {e}")
 
 
-def chunk_data(data: list, chunk_size: int) -> list:
+def chunk_data(data, chunk_size: int):
     """
-    Splits data into chunks of a specified size.
+    Splits data (any iterable, consumed lazily) into chunks of a specified size.
     """
-    for i in range(0, len(data), chunk_size):
-        yield data[i : i + chunk_size]
+    iterator = iter(data)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
 
 
 def process_chunk(chunk_data_tuple):
@@ -55,35 +59,56 @@ def process_chunk(chunk_data_tuple):
     load_batch(chunk, db_name, collection_name)
 
 
-def load_users_data(users_data: dict) -> None:
+def load_users_data(users_data) -> None:
     """
     Loads user data into MongoDB with reduced multiprocessing.
 
-    :param users_data: A dictionary where keys are user addresses and values are
-                        the corresponding user data.
+    Documents are materialized lazily from `users_data.items()`, at most two chunks per
+    process being in flight at once.
+
+    :param users_data: A mapping (or `UserTransactions`) whose items are user addresses
+                        and the corresponding user documents.
     """
     BATCH_SIZE = 10000
-    user_data_list = list(users_data.items())
-    data_chunks = list(chunk_data(user_data_list, BATCH_SIZE))
+    num_batches = -(-len(users_data) // BATCH_SIZE)
 
-    logging.info(
-        f"Preparing to load {len(users_data)} users in {len(data_chunks)} batches."
-    )
+    logging.info(f"Preparing to load {len(users_data)} users in {num_batches} batches.")
 
     db_name = "defi_db"
     collection_name = "users"
 
-    # Prepare the chunks as tuples (chunk, db_name, collection_name)
-    chunk_data_tuples = [(chunk, db_name, collection_name) for chunk in data_chunks]
+    # Prepare the chunks as tuples (chunk, db_name, collection_name), window by window
+    chunk_data_tuples = (
+        (chunk, db_name, collection_name)
+        for chunk in chunk_data(users_data.items(), BATCH_SIZE)
+    )
 
     # Multiprocessing - Process chunks in parallel
     with Pool(processes=cpu_count()) as pool:
-        logging.info(f"Starting to process {len(data_chunks)} chunks in parallel...")
-        for _ in tqdm(
-            pool.imap(process_chunk, chunk_data_tuples),
-            total=len(data_chunks),
-            desc="Processing batches",
-        ):
-            pass
+        logging.info(f"Starting to process {num_batches} chunks in parallel...")
+        with tqdm(total=num_batches, desc="Processing batches") as pbar:
+            for window in chunk_data(chunk_data_tuples, 2 * cpu_count()):
+                pool.map(process_chunk, window)
+                pbar.update(len(window))
 
     logging.info("All user data has been processed and inserted into MongoDB.")
+
+
+def flush_users_data(
+    users_data, db_name: str = "defi_db", collection_name: str = "users"
+) -> int:
+    """
+    Loads user data into MongoDB from the calling process, batch by batch.
+
+    Meant for pool workers (which cannot spawn a pool of their own) flushing the users
+    they own as soon as they are complete.
+
+    :param users_data: A mapping (or `UserTransactions`) whose items are user addresses
+                        and the corresponding user documents.
+    :param db_name: The name of the MongoDB database.
+    :param collection_name: The name of the MongoDB collection.
+    :return: The number of users flushed.
+    """
+    for chunk in chunk_data(users_data.items(), FLUSH_BATCH_SIZE):
+        load_batch(chunk, db_name, collection_name)
+    return len(users_data)
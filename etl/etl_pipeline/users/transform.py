@@ -1,95 +1,504 @@
 import json
-from collections import defaultdict
+import os
 
+import numpy as np
 
-def default_user_data() -> dict:
+
+class Vocabulary:
     """
-    Returns a dictionary with default user data.
+    Append-only dictionary encoding of hashable values (None included) into int64 codes.
+
+    Accumulators built in the same process share its vocabularies (see `process_vocabularies`),
+    so their codes agree and merging them only concatenates integer columns.
     """
-    return {
-        "address": None,
-        "sent_count": 0,
-        "received_count": 0,
-        "total_sent (ETH)": 0.0,
-        "total_received (ETH)": 0.0,
-        "first_seen": None,
-        "last_seen": None,
-        "protocols_used": defaultdict(default_protocol_data),
-        "protocol_types": defaultdict(int),
-        "transactions": [],
-    }
 
+    def __init__(self, values=()):
+        self.values = []  # value of each code
+        self.codes = {}
+        self.encode(values)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def encode(self, values) -> np.ndarray:
+        """Returns the codes of the values, adding the new ones."""
+        codes, known = self.codes, self.values
+
+        def code(value):
+            found = codes.get(value)
+            if found is None:
+                found = codes[value] = len(known)
+                known.append(value)
+            return found
+
+        return np.fromiter(map(code, values), dtype=np.int64, count=len(values))
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Returns the values of the codes as an object array."""
+        values = np.empty(len(codes), dtype=object)
+        for i, code in enumerate(codes.tolist()):  # element-wise, tuples must not be broadcast
+            values[i] = self.values[code]
+        return values
+
+
+_PROCESS_VOCABULARIES = {}  # pid -> (addresses, protocols)
+
+
+def process_vocabularies() -> tuple:
+    """Returns the (addresses, protocols) vocabularies of the current process, forked children getting their own."""
+    return _PROCESS_VOCABULARIES.setdefault(os.getpid(), (Vocabulary(), Vocabulary()))
+
+
+def _sort_key(value) -> str:
+    """Total order on vocabulary entries (addresses or protocol tuples), tolerant to None."""
+    return str(value)
 
-def default_protocol_data() -> dict:
+
+def _canonical_ranks(vocabulary: Vocabulary, codes: np.ndarray) -> tuple:
+    """
+    Returns the distinct codes in the canonical order of their values and, for each of `codes`,
+    its rank in that order.
+    """
+    used, inverse = np.unique(codes, return_inverse=True)
+    order = np.argsort([_sort_key(value) for value in vocabulary.decode(used)], kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return used[order], rank[inverse]
+
+
+def _recode(own: Vocabulary, target: Vocabulary, codes: np.ndarray) -> np.ndarray:
+    """Returns the codes of `own` in the `target` vocabulary."""
+    if own is target:
+        return codes
+    used, inverse = np.unique(codes, return_inverse=True)
+    return target.encode(own.decode(used))[inverse].astype(codes.dtype)
+
+
+def _group_dropped(dropped: dict) -> dict:
     """
-    Returns a dictionary with default protocol data.
+    Groups summaries of dropped sides by (user, protocol, is_sender): counts and values are added,
+    `first` is the earliest timestamp and `last`, `last_hash` the timestamp and hash of the latest side.
     """
+    order = np.lexsort((dropped["last_hash"], dropped["last"], dropped["is_sender"], dropped["protocol"], dropped["user"]))
+    dropped = {name: column[order] for name, column in dropped.items()}
+    if not len(order):
+        return dropped
+    keys = [dropped["user"], dropped["protocol"], dropped["is_sender"]]
+    starts = np.flatnonzero(np.concatenate([[True], np.any([key[1:] != key[:-1] for key in keys], axis=0)]))
+    ends = np.append(starts[1:], len(order)) - 1
     return {
-        "count": 0,
-        "blockchain": None,
-        "contract_id": None,
+        "user": dropped["user"][starts],
+        "protocol": dropped["protocol"][starts],
+        "is_sender": dropped["is_sender"][starts],
+        "count": np.add.reduceat(dropped["count"], starts),
+        "value": np.add.reduceat(dropped["value"], starts),
+        "first": np.minimum.reduceat(dropped["first"], starts),
+        "last": dropped["last"][ends],
+        "last_hash": dropped["last_hash"][ends],
     }
 
 
-def transform_to_user_data(transactions: list) -> defaultdict:
+def _count_protocol(protocols_used: dict, protocol_types: dict, protocol: tuple, count: int) -> None:
+    """Adds `count` sides of a (protocol_name, type, blockchain, contract_id) protocol to the user counts."""
+    name, type_, blockchain, contract_id = protocol
+    if name:
+        entry = protocols_used.setdefault(name, {"count": 0})
+        entry["count"] += count
+        entry["blockchain"] = blockchain
+        entry["contract_id"] = contract_id
+    if type_:
+        protocol_types[type_] = protocol_types.get(type_, 0) + count
+
+
+class UserTransactions:
     """
-    Transforms a batch of transactions into user data with transaction details.
+    Columnar, mergeable accumulator of the transactions of a set of addresses.
+
+    Transactions are stored once as NumPy columns (hash as fixed-width bytes, timestamp in
+    microseconds, value, gas and an int32 code of (protocol_name, type, blockchain, contract_id)).
+    Each side of a transaction is a row of (user code, transaction index, is_sender). Codes index
+    the vocabularies of the process, so merging two accumulators of the same process concatenates
+    the integer columns; accumulators of other processes are re-encoded once, when received.
+    `finalize` sorts the sides in a canonical order and builds CSR offsets, so that the
+    transactions of the `u`-th user of `addresses` are the rows `offsets[u]:offsets[u + 1]` and
+    the output does not depend on how the batches were split or merged. User documents are only
+    materialized by `items`.
+    The sides cut by `keep_latest` are kept summarized in `dropped`, columns of one row per
+    (user, protocol, is_sender): their count, value, first and last timestamps and the hash of the
+    latest one. The scalar fields and protocol counts of the users still cover every side.
     """
-    users_data = defaultdict(default_user_data)
-
-    for tx in transactions:
-        if isinstance(tx, str):
-            tx = json.loads(tx)
-
-        from_address = tx["from"]
-        to_address = tx["to"]
-        value_eth = tx["value (ETH)"]
-        timestamp = tx["timestamp"]
-        gas_used = tx["gas_used"]  # Extract gas used
-        protocol_name = tx.get("metadata", {}).get("protocol_name", None)
-        protocol_type = tx.get("metadata", {}).get("type", None)
-        protocol_blockchain = tx.get("metadata", {}).get("blockchain", None)
-        protocol_contract_id = tx.get("metadata", {}).get("contract_id", None)
-
-        def update_user(address, is_sender):
-            user = users_data[address]
-            if user["address"] is None:
-                user["address"] = address
-            user["last_seen"] = (
-                max(user["last_seen"], timestamp) if user["last_seen"] else timestamp
+
+    def __init__(
+        self,
+        vocabularies,
+        tx_hash,
+        timestamp,
+        value,
+        gas_used,
+        protocol,
+        side_user,
+        side_tx,
+        side_is_sender,
+        dropped=None,
+    ):
+        self.vocabularies = vocabularies  # (addresses, protocols)
+        self.tx_hash = tx_hash
+        self.timestamp = timestamp
+        self.value = value
+        self.gas_used = gas_used
+        self.protocol = protocol  # int32 protocol code of each transaction
+        self.side_user = side_user  # int64 address code of each side
+        self.side_tx = side_tx
+        self.side_is_sender = side_is_sender
+        self.dropped = dropped  # summaries of the sides cut by `keep_latest`, user and protocol codes
+        self.addresses = None  # address of each user, canonical order, set by `finalize`
+        self.side_rank = None  # user of each side, index into `addresses`
+        self.offsets = None
+        self.dropped_rank = None  # user of each `dropped` row, index into `addresses`
+
+    @classmethod
+    def empty(cls) -> "UserTransactions":
+        """Returns an accumulator without any transaction."""
+        return cls.from_transactions([])
+
+    @classmethod
+    def from_transactions(cls, transactions: list, owned=None) -> "UserTransactions":
+        """
+        Builds the accumulator of a batch of transactions.
+
+        :param transactions: List of transaction records (dicts or JSON strings).
+        :param owned: Optional predicate on an address; when given, only the sides of the
+                      transactions whose address is owned are recorded.
+        """
+        records = [json.loads(tx) if isinstance(tx, str) else tx for tx in transactions]
+        n = len(records)
+        addresses, protocols = vocabularies = process_vocabularies()
+
+        protocol = protocols.encode(
+            [
+                (
+                    metadata.get("protocol_name", None),
+                    metadata.get("type", None),
+                    metadata.get("blockchain", None),
+                    metadata.get("contract_id", None),
+                )
+                for metadata in (tx.get("metadata", {}) for tx in records)
+            ]
+        ).astype(np.int32)
+        side_user = addresses.encode([tx["from"] for tx in records] + [tx["to"] for tx in records])
+        side_tx = np.concatenate([np.arange(n), np.arange(n)])
+        side_is_sender = np.arange(2 * n) < n
+
+        if owned is not None:
+            codes = np.unique(side_user)
+            owned_codes = codes[[owned(address) for address in addresses.decode(codes)]]
+            keep = np.isin(side_user, owned_codes)
+            side_user, side_tx, side_is_sender = side_user[keep], side_tx[keep], side_is_sender[keep]
+            used, side_tx = np.unique(side_tx, return_inverse=True)
+            records = [records[i] for i in used]
+            protocol = protocol[used]
+
+        return cls(
+            vocabularies=vocabularies,
+            tx_hash=np.array(
+                [tx["transaction_hash"] or "" for tx in records], dtype="S"
+            ),
+            timestamp=np.array(
+                [tx["timestamp"] for tx in records], dtype="datetime64[us]"
+            ),
+            value=np.array(
+                [tx["value (ETH)"] for tx in records], dtype=np.float64
+            ),
+            gas_used=np.array([tx["gas_used"] for tx in records], dtype=np.float64),
+            protocol=protocol,
+            side_user=side_user,
+            side_tx=side_tx.astype(np.int64),
+            side_is_sender=side_is_sender,
+        )
+
+    def __len__(self) -> int:
+        """Number of users."""
+        return len(self.finalize().addresses)
+
+    def __getstate__(self) -> dict:
+        """
+        Pickles the accumulator with vocabularies of its own codes only, rather than the
+        vocabularies of the whole process; the receiving process re-encodes them on merge.
+        """
+        state = dict(self.__dict__)
+        vocabularies = []
+        for vocabulary, name, column in zip(self.vocabularies, ("side_user", "protocol"), ("user", "protocol")):
+            codes = state[name]
+            dropped = self.dropped[column] if self.dropped is not None else codes[:0]
+            used, inverse = np.unique(np.concatenate([codes, dropped]), return_inverse=True)
+            vocabularies.append(Vocabulary(vocabulary.decode(used)))
+            state[name] = inverse[: len(codes)].astype(codes.dtype)
+            if self.dropped is not None:
+                state["dropped"] = dict(state["dropped"], **{column: inverse[len(codes) :].astype(dropped.dtype)})
+        state["vocabularies"] = tuple(vocabularies)
+        return state
+
+    def _codes_in(self, vocabularies) -> tuple:
+        """Returns the side_user and protocol codes and the `dropped` summaries of the accumulator in other vocabularies."""
+        (own_addresses, own_protocols), (addresses, protocols) = self.vocabularies, vocabularies
+        dropped = self.dropped
+        if dropped is not None:
+            dropped = dict(
+                dropped,
+                user=_recode(own_addresses, addresses, dropped["user"]),
+                protocol=_recode(own_protocols, protocols, dropped["protocol"]),
             )
-            user["first_seen"] = (
-                min(user["first_seen"], timestamp) if user["first_seen"] else timestamp
+        return (
+            _recode(own_addresses, addresses, self.side_user),
+            _recode(own_protocols, protocols, self.protocol),
+            dropped,
+        )
+
+    def merge(self, other: "UserTransactions") -> "UserTransactions":
+        """
+        Returns the accumulator of the transactions of both accumulators, in the vocabularies of
+        this one: a concatenation of the columns when both share them.
+        """
+        side_user, protocol, dropped = other._codes_in(self.vocabularies)
+        if self.dropped is not None and dropped is not None:
+            dropped = {name: np.concatenate([self.dropped[name], dropped[name]]) for name in dropped}
+        return UserTransactions(
+            vocabularies=self.vocabularies,
+            tx_hash=np.concatenate([self.tx_hash, other.tx_hash]),
+            timestamp=np.concatenate([self.timestamp, other.timestamp]),
+            value=np.concatenate([self.value, other.value]),
+            gas_used=np.concatenate([self.gas_used, other.gas_used]),
+            protocol=np.concatenate([self.protocol, protocol]),
+            side_user=np.concatenate([self.side_user, side_user]),
+            side_tx=np.concatenate([self.side_tx, other.side_tx + len(self.tx_hash)]),
+            side_is_sender=np.concatenate([self.side_is_sender, other.side_is_sender]),
+            dropped=dropped if dropped is not None else self.dropped,
+        )
+
+    def finalize(self) -> "UserTransactions":
+        """
+        Sorts users and sides in a canonical order and builds the CSR offsets.
+
+        Sides are ordered by user, then by timestamp, hash, side, value, gas and protocol,
+        users and protocols by their value, whatever their codes.
+        """
+        if self.offsets is not None:
+            return self
+
+        addresses, protocols = self.vocabularies
+        n_sides = len(self.side_user)
+        dropped_user = self.dropped["user"] if self.dropped is not None else self.side_user[:0]
+        users, ranks = _canonical_ranks(addresses, np.concatenate([self.side_user, dropped_user]))
+        self.side_rank, self.dropped_rank = ranks[:n_sides], ranks[n_sides:]
+        self.addresses = addresses.decode(users)
+        _, protocol_rank = _canonical_ranks(protocols, self.protocol)
+
+        tx = self.side_tx
+        order = np.lexsort(
+            (
+                protocol_rank[tx],
+                self.gas_used[tx],
+                self.value[tx],
+                self.side_is_sender,
+                self.tx_hash[tx],
+                self.timestamp[tx],
+                self.side_rank,
             )
-            if is_sender:
-                user["sent_count"] += 1
-                user["total_sent (ETH)"] += value_eth
-            else:
-                user["received_count"] += 1
-                user["total_received (ETH)"] += value_eth
-            if protocol_name:
-                protocols = user["protocols_used"][protocol_name]
-                protocols["count"] += 1
-                protocols["blockchain"] = protocol_blockchain
-                protocols["contract_id"] = protocol_contract_id
-            if protocol_type:
-                user["protocol_types"][protocol_type] += 1
-
-            user["transactions"].append(
-                {
-                    "transaction_hash": tx["transaction_hash"],
-                    "timestamp": timestamp,
-                    "value (ETH)": value_eth,
-                    "is_sender": is_sender,
-                    "gas_used": gas_used,
-                    "protocol_name": protocol_name,
-                    "protocol_type": protocol_type,
-                    "blockchain": protocol_blockchain,
-                    "contract_id": protocol_contract_id,
+        )
+        self.side_user = self.side_user[order]
+        self.side_rank = self.side_rank[order]
+        self.side_tx = self.side_tx[order]
+        self.side_is_sender = self.side_is_sender[order]
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(self.side_rank, minlength=len(users)))]
+        )
+        return self
+
+    def keep_latest(self, max_sides: int) -> "UserTransactions":
+        """
+        Keeps the `max_sides` most recent sides of each user (canonical order) and the transactions
+        they refer to. The other sides are added to the `dropped` summaries, which are older than
+        any kept side.
+        """
+        self.finalize()
+        keep = self.offsets[1:][self.side_rank] - np.arange(len(self.side_rank)) <= max_sides
+        drop, tx = ~keep, self.side_tx[~keep]
+        dropped = {
+            "user": self.side_user[drop],
+            "protocol": self.protocol[tx],
+            "is_sender": self.side_is_sender[drop],
+            "count": np.ones(len(tx), dtype=np.int64),
+            "value": np.nan_to_num(self.value[tx]),
+            "first": self.timestamp[tx],
+            "last": self.timestamp[tx],
+            "last_hash": self.tx_hash[tx],
+        }
+        if self.dropped is not None:
+            dropped = {name: np.concatenate([self.dropped[name], column]) for name, column in dropped.items()}
+        used, side_tx = np.unique(self.side_tx[keep], return_inverse=True)
+        return UserTransactions(
+            vocabularies=self.vocabularies,
+            tx_hash=self.tx_hash[used],
+            timestamp=self.timestamp[used],
+            value=self.value[used],
+            gas_used=self.gas_used[used],
+            protocol=self.protocol[used],
+            side_user=self.side_user[keep],
+            side_tx=side_tx,
+            side_is_sender=self.side_is_sender[keep],
+            dropped=_group_dropped(dropped),
+        ).finalize()
+
+    def user_statistics(self) -> dict:
+        """
+        Computes the per-user scalar fields in one vectorized pass over the CSR layout.
+
+        :return: A dictionary of arrays indexed like `addresses`: sent_count, received_count,
+                 total_sent, total_received, first_seen, last_seen and sides_seen, the dropped
+                 sides included.
+        """
+        self.finalize()
+        starts, ends = self.offsets[:-1], self.offsets[1:]
+        values = np.nan_to_num(self.value[self.side_tx])
+        is_sender = self.side_is_sender
+        timestamps = self.timestamp[self.side_tx]
+
+        def per_user(weights):
+            if not len(self):
+                return np.zeros(0)
+            return np.add.reduceat(weights, starts)  # every user has at least one side
+
+        stats = {
+            "sent_count": per_user(is_sender.astype(np.int64)),
+            "received_count": per_user((~is_sender).astype(np.int64)),
+            "total_sent": per_user(np.where(is_sender, values, 0.0)),
+            "total_received": per_user(np.where(is_sender, 0.0, values)),
+            "first_seen": timestamps[starts] if len(self) else timestamps,
+            "last_seen": timestamps[ends - 1] if len(self) else timestamps,
+            "sides_seen": ends - starts,
+        }
+        if self.dropped is not None and len(self.dropped_rank):
+            dropped, rank = self.dropped, self.dropped_rank
+            sent, count = dropped["is_sender"], dropped["count"]
+            for name, weights in [
+                ("sent_count", np.where(sent, count, 0)),
+                ("received_count", np.where(sent, 0, count)),
+                ("total_sent", np.where(sent, dropped["value"], 0.0)),
+                ("total_received", np.where(sent, 0.0, dropped["value"])),
+                ("sides_seen", count),
+            ]:
+                stats[name] = stats[name] + np.bincount(rank, weights, minlength=len(self)).astype(stats[name].dtype)
+            np.minimum.at(stats["first_seen"], rank, dropped["first"])
+            np.maximum.at(stats["last_seen"], rank, dropped["last"])
+        return stats
+
+    def items(self, chunk_size: int = 10000):
+        """
+        Yields (address, document) pairs in the `users` collection format.
+
+        Documents are built from the CSR slices `chunk_size` users at a time, so only one
+        chunk of Python objects is alive at once. Users cut by `keep_latest` are flagged with
+        `transactions_truncated` and their number of transactions before the cut, `transactions_seen`;
+        their counts, totals, first_seen and protocols still cover the dropped sides.
+        """
+        stats = self.user_statistics()
+        protocols = self.vocabularies[1].values
+        dropped_offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        if self.dropped is not None:
+            order = np.lexsort((self.dropped["last_hash"], self.dropped["last"], self.dropped_rank))
+            dropped_offsets = np.searchsorted(self.dropped_rank[order], np.arange(len(self) + 1))
+            dropped_codes = self.dropped["protocol"][order].tolist()
+            dropped_counts = self.dropped["count"][order].tolist()
+
+        for first in range(0, len(self), chunk_size):
+            last = min(first + chunk_size, len(self))
+            lo, hi = self.offsets[first], self.offsets[last]
+            tx = self.side_tx[lo:hi]
+            hashes = [h.decode() or None for h in self.tx_hash[tx].tolist()]
+            timestamps = self.timestamp[tx].tolist()
+            values = [None if v != v else v for v in self.value[tx].tolist()]
+            gas = [None if g != g else g for g in self.gas_used[tx].tolist()]
+            codes = self.protocol[tx].tolist()
+            is_sender = self.side_is_sender[lo:hi].tolist()
+
+            for user in range(first, last):
+                protocols_used, protocol_types, transactions = {}, {}, []
+                for j in range(dropped_offsets[user], dropped_offsets[user + 1]):  # Older than the kept sides
+                    _count_protocol(protocols_used, protocol_types, protocols[dropped_codes[j]], dropped_counts[j])
+                for i in range(self.offsets[user] - lo, self.offsets[user + 1] - lo):
+                    name, type_, blockchain, contract_id = protocols[codes[i]]
+                    if name:  # Inlined `_count_protocol`, once per side
+                        entry = protocols_used.setdefault(name, {"count": 0})
+                        entry["count"] += 1
+                        entry["blockchain"] = blockchain
+                        entry["contract_id"] = contract_id
+                    if type_:
+                        protocol_types[type_] = protocol_types.get(type_, 0) + 1
+                    transactions.append(
+                        {
+                            "transaction_hash": hashes[i],
+                            "timestamp": timestamps[i],
+                            "value (ETH)": values[i],
+                            "is_sender": is_sender[i],
+                            "gas_used": gas[i],
+                            "protocol_name": name,
+                            "protocol_type": type_,
+                            "blockchain": blockchain,
+                            "contract_id": contract_id,
+                        }
+                    )
+
+                address = self.addresses[user]
+                document = {
+                    "address": address,
+                    "sent_count": int(stats["sent_count"][user]),
+                    "received_count": int(stats["received_count"][user]),
+                    "total_sent (ETH)": float(stats["total_sent"][user]),
+                    "total_received (ETH)": float(stats["total_received"][user]),
+                    "first_seen": stats["first_seen"][user].tolist(),
+                    "last_seen": stats["last_seen"][user].tolist(),
+                    "protocols_used": protocols_used,
+                    "protocol_types": protocol_types,
+                    "transactions": transactions,
                 }
-            )
+                if stats["sides_seen"][user] > len(transactions):
+                    document["transactions_truncated"] = True
+                    document["transactions_seen"] = int(stats["sides_seen"][user])
+                yield address, document
 
-        update_user(from_address, is_sender=True)
-        update_user(to_address, is_sender=False)
 
-    return users_data
+def merge_user_data(left: UserTransactions, right: UserTransactions) -> UserTransactions:
+    """Merges two batches of user transactions."""
+    return left.merge(right)
+
+
+def reduce_user_data(batches: list) -> UserTransactions:
+    """Reduces a list of user transactions batches pairwise, as a balanced tree of merges."""
+    batches = list(batches)
+    if not batches:
+        return UserTransactions.empty()
+    while len(batches) > 1:
+        merged = [
+            merge_user_data(batches[i], batches[i + 1])
+            for i in range(0, len(batches) - 1, 2)
+        ]
+        if len(batches) % 2:
+            merged.append(batches[-1])
+        batches = merged
+    return batches[0].finalize()
+
+
+def transform_to_user_data(
+    transactions: list, users_data: UserTransactions = None, owned=None
+) -> UserTransactions:
+    """
+    Transforms a batch of transactions into columnar user data.
+
+    :param transactions: List of transaction records (dicts or JSON strings).
+    :param users_data: Optional user data to merge the batch into.
+    :param owned: Optional predicate on an address; when given, only the sides of the
+                  transactions whose address is owned are recorded.
+    :return: The `UserTransactions` of the batch (merged into `users_data` if given).
+    """
+    batch = UserTransactions.from_transactions(transactions, owned)
+    return batch if users_data is None else users_data.merge(batch)
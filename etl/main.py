@@ -13,6 +13,7 @@ def run_etl():
         protocols=False,
         contracts=False,
         transactions=False,
+        incremental=False,
         users=False,
         price=False,
         market=False,
@@ -3,12 +3,16 @@ import pandas as pd
 import numpy as np
 import json
 
+from ..utils.feature_matrix import FeatureMatrix
+
 BASE_PATH = 'src/frontend/layouts/data'
 
 
 def load_predictions(features_path, predictions_path):
     """ Load the predictions and features dataframes and merge them """
-    users = feather.read_table(features_path).to_pandas()
+    matrix = FeatureMatrix.load(features_path)
+    users = matrix.to_frame()
+    users.insert(0, 'address', matrix.addresses())
     result = feather.read_table(predictions_path).to_pandas()
     df = pd.merge(users, result, on='address', how='left')
 
@@ -6,6 +6,7 @@ import matplotlib.pyplot as plt
 from .calculate_score import performances_scores
 from .checks import check_scores, analyze_distribution
 from ...utils.hf_hub import upload_dataset
+from ...utils.feature_matrix import FeatureMatrix
 
 FEATURES_PATH = 'data/features/features_standardised.arrow'
 RESULTS_PATH = 'data/clustering/kmeans/kmeans_predictions.arrow'
@@ -13,7 +14,9 @@ SCORES_PATH = 'src/frontend/layouts/data/users_scored.arrow'
 
 def merge_data():
     """ Merge the features and results dataframes """
-    users = feather.read_table(FEATURES_PATH).to_pandas()
+    matrix = FeatureMatrix.load(FEATURES_PATH)
+    users = matrix.to_frame()
+    users.insert(0, 'address', matrix.addresses())
     results = feather.read_table(RESULTS_PATH).to_pandas()
     features = pd.merge(users, results, on='address', how='left')
 
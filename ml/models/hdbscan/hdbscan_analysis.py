@@ -5,6 +5,8 @@ import numpy as np
 from optuna.pruners import MedianPruner
 from sklearn.metrics import silhouette_samples
 
+from ml.utils.clustering_metrics import stratified_sample
+
 
 def objective(trial, x_train):
     """
@@ -45,8 +47,7 @@ def objective(trial, x_train):
     )
     model.fit(x_train)
 
-    sample_size = min(10000, x_train.shape[0])
-    sample_indices = np.random.choice(x_train.shape[0], sample_size, replace=False)
+    sample_indices = stratified_sample(model.labels_, 10000, random_state=42)
 
     x_sample = x_train[sample_indices]
     labels_sample = model.labels_[sample_indices]
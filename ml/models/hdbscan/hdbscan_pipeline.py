@@ -7,13 +7,13 @@ import pyarrow as pa
 import pyarrow.feather as feather
 import hdbscan
 import warnings
-from sklearn.decomposition import PCA
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from ml.models.hdbscan.hdbscan_analysis import optimize_hyperparams
 from ml.utils.splitting import splitting
 from ml.utils.hf_hub import upload_model
+from ml.utils.projection import load_projection
 
 warnings.filterwarnings("ignore", message=".*'force_all_finite' was renamed to 'ensure_all_finite'.*")
 
@@ -37,7 +37,10 @@ class HDBSCANPipeline:
         self.y_all = None
         self.best_params = {}
         self.model = None
+        self.pca = None
+        self.n_components = 28
         self.model_path = "models/hdbscan/DeFI-HDBSCAN.pkl"
+        self.pca_path = "models/hdbscan/DeFI-HDBSCAN-PCA.pkl"
         self.optuna_results_path = "models/hdbscan/optuna_study_results.json"
         self.predictions_path = "data/results/hdbscan_predictions.arrow"
 
@@ -66,8 +69,8 @@ class HDBSCANPipeline:
         """Reduce the dimensions of the dataset with PCA"""
         if self.reduce_dimensions:
             print("\n3. Reduce dimensions\n---------------------------------")
-            pca = PCA(n_components=28)
-            self.x_all = pca.fit_transform(self.x_all)
+            self.pca = load_projection(self.dataset.matrix, self.n_components)
+            self.x_all = self.pca.transform(self.x_all.to_numpy())
             print(f"Dimensions reduced successfully: {self.x_all.shape}")
         else:
             print("\n3. No dimension reduction\n---------------------------------")
@@ -109,8 +112,11 @@ class HDBSCANPipeline:
         print("Model trained successfully")
 
     def save(self):
-        """Save the trained HDBSCAN model"""
+        """Save the trained HDBSCAN model and the PCA projection it is trained on"""
         print("\n7. Save model\n---------------------------------")
+        if self.pca is not None:
+            print(f"Saving PCA projection to {self.pca_path}")
+            joblib.dump(self.pca, self.pca_path)
         print(f"Saving model to {self.model_path}")
         return joblib.dump(self.model, self.model_path)
 
@@ -139,6 +145,8 @@ class HDBSCANPipeline:
         """Upload the trained model to Hugging Face Hub"""
         print("\n11. Upload model to HF\n---------------------------------")
         upload_model(self.model_path, "DeFI-HDBSCAN.pkl")
+        if self.pca is not None:
+            upload_model(self.pca_path, "DeFI-HDBSCAN-PCA.pkl")
 
 
 if __name__ == "__main__":
@@ -1,86 +1,207 @@
 import os
 import json
+import hashlib
 import optuna
 import numpy as np
+import pandas as pd
 from tqdm import tqdm
 from joblib import Parallel, delayed
+from multiprocessing import get_context
+from optuna.pruners import MedianPruner
+from optuna.storages import JournalStorage, RDBStorage
+from optuna.storages.journal import JournalFileBackend
+from optuna.study import MaxTrialsCallback
+from optuna.trial import TrialState
+from threadpoolctl import threadpool_limits
 from matplotlib import pyplot as plt
-from sklearn.metrics import davies_bouldin_score, calinski_harabasz_score, silhouette_score
-from sklearn.cluster import MiniBatchKMeans, KMeans
-from sklearn.utils import resample
+from sklearn.metrics import davies_bouldin_score, calinski_harabasz_score
+from sklearn.metrics.pairwise import euclidean_distances
+from sklearn.cluster import MiniBatchKMeans
 
-def compute_inertia(k, x_train):
+from ml.utils.clustering_metrics import sampled_silhouette, simplified_silhouette
+
+SWEEP_CACHE_FILE = "tmp/kmeans_sweep.json"
+SWEEP_PARAMETERS = {"random_state": 42, "batch_size": 4096, "silhouette_sample_size": 10000}
+SWEEP_SCORES = ["inertia", "silhouette", "simplified_silhouette", "davies_bouldin", "calinski_harabasz"]
+STUDY_STORAGE = "tmp/optuna_kmeans.log"  # Journal file, written by concurrent processes under a file lock
+SQLITE_TIMEOUT = 60  # Seconds a process waits for the lock of a SQLite study before failing
+SEARCH_SPACE = ["n_clusters", "init", "batch_size", "max_iter", "tol"]
+OBJECTIVE_RUNGS = (10_000, 100_000)  # Subsample sizes of the pruned steps of a trial, before the full data
+OBJECTIVE_WEIGHTS = {"silhouette": 1.0, "calinski_harabasz": 1.0, "davies_bouldin": 1.0}
+
+
+def array_hash(x):
     """
-    Computes the inertia (sum of squared distances to the nearest centroid) for a given number of clusters.
+    BLAKE2 hash of the shape, dtype and values of an array, to key cached results on the data.
     :param:
-        k (int): Number of clusters.
-        x_train (ndarray): Training data.
+        x (ndarray): Data.
+    :return:
+        str: Hex digest.
+    """
+    digest = hashlib.blake2b(f"{x.shape}:{x.dtype}".encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(x).data)
+    return digest.hexdigest()
+
+
+def count_unique_rows(x):
+    """
+    Approximate number of distinct rows: the distinct 64-bit hashes of the rows, exact up to hash collisions.
+    Replaces np.unique(x, axis=0), a lexicographic sort of every row.
+    :param:
+        x (ndarray): Data.
     :return:
-        float: Inertia value.
+        int: Number of distinct row hashes.
     """
-    kmeans = MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=100)
-    kmeans.fit(x_train)
-    return kmeans.inertia_
+    hashes = np.zeros(len(x), dtype=np.uint64)
+    for j in range(x.shape[1]):
+        hashes ^= np.ascontiguousarray(x[:, j], dtype=np.float64).view(np.uint64)
+        hashes *= np.uint64(0x9E3779B97F4A7C15)
+        hashes ^= hashes >> np.uint64(29)
+    return len(np.unique(hashes))
 
 
-def compute_silhouette_score(k, x_train):
+def next_centroids(x_sample, centroids, rng):
     """
-    Computes the silhouette score for a given number of clusters with subsampling.
+    Warm-start centroids for k + 1 clusters: the k centroids plus a point of the sample, chosen as in greedy
+    k-means++ among candidates drawn with a probability proportional to their squared distance to the nearest
+    centroid, as the candidate that lowers the inertia of the sample most.
     :param:
+        x_sample (ndarray): Sample of the data.
+        centroids (ndarray): Centroids of the k clusters.
+        rng (Generator): Random generator.
+    :return:
+        ndarray: Initial centroids of the k + 1 clusters.
+    """
+    distances = euclidean_distances(x_sample, centroids, squared=True).min(axis=1)
+    total = distances.sum()
+    n_candidates = 2 + int(np.log(len(centroids) + 1))
+    candidates = rng.choice(len(x_sample), n_candidates, p=distances / total if total > 0 else None)
+    candidate_distances = euclidean_distances(x_sample[candidates], x_sample, squared=True)
+    best = candidates[np.argmin(np.minimum(candidate_distances, distances).sum(axis=1))]
+    return np.vstack([centroids, x_sample[best]])
+
+
+def fit_k(x, k, init, random_state=42, batch_size=4096, silhouette_sample_size=10000):
+    """
+    Fits MiniBatchKMeans once for k clusters and scores its labels on the data.
+    :param:
+        x (ndarray): Training data.
         k (int): Number of clusters.
-        x_train (ndarray): Training data.
+        init (str or ndarray): "k-means++" or initial centroids.
+        random_state (int): Seed of the fit and of the silhouette sample.
+        batch_size (int): Size of the mini-batches.
+        silhouette_sample_size (int): Size of the stratified sample of the exact silhouette.
     :return:
-        float: Silhouette score (0 if insufficient clusters are found).
+        dict: Inertia, silhouette, simplified silhouette, Davies-Bouldin and Calinski-Harabasz scores, and the centroids.
     """
-    kmeans = KMeans(n_clusters=k, random_state=42, n_init=10)
-    kmeans.fit(x_train)
+    kmeans = MiniBatchKMeans(n_clusters=k, init=init, n_init=1, random_state=random_state, batch_size=batch_size)
+    kmeans.fit(x)
+    labels = kmeans.labels_
+
+    n_clusters = len(np.unique(labels))
+    if n_clusters < 2:
+        print(f"Warning: only {n_clusters} clusters found for k={k}")
+        silhouette = simplified = 0
+    else:
+        silhouette = sampled_silhouette(x, labels, silhouette_sample_size, random_state)
+        simplified = simplified_silhouette(x, labels, kmeans.cluster_centers_)
+
+    several = n_clusters > 1
+    return {
+        "inertia": float(kmeans.inertia_),
+        "silhouette": float(silhouette),
+        "simplified_silhouette": float(simplified),
+        "davies_bouldin": float(davies_bouldin_score(x, labels)) if several else np.nan,
+        "calinski_harabasz": float(calinski_harabasz_score(x, labels)) if several else np.nan,
+        "centroids": kmeans.cluster_centers_.tolist(),
+    }
+
+
+def load_sweep_cache(cache_file):
+    """Cached k-sweep results by key, empty if there are none."""
+    try:
+        with open(cache_file, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
 
-    sample_size = min(10000, x_train.shape[0])
-    sample_indices = np.random.choice(x_train.shape[0], sample_size, replace=False)
 
-    x_sample = x_train[sample_indices]
-    labels_sample = kmeans.labels_[sample_indices]
+def sweep_kmeans(x, k_range, features_hash=None, warm_start=True, cache_file=SWEEP_CACHE_FILE, parameters=None):
+    """
+    Fits each k of the range once and scores the labels with every metric. With `warm_start`, k + 1 starts
+    from the centroids of k; otherwise the fits run in parallel. Results are cached per (features hash, k).
+    :param:
+        x (ndarray): Training data.
+        k_range (range): Numbers of clusters.
+        features_hash (str, optional): Hash of the features file the data comes from. Defaults to the hash of the data.
+        warm_start (bool, optional): Whether to start each k from the centroids of the previous one. Defaults to True.
+        cache_file (str, optional): JSON file of the cached results. Defaults to SWEEP_CACHE_FILE.
+        parameters (dict, optional): Overrides of SWEEP_PARAMETERS.
+    :return:
+        pd.DataFrame: Inertia, silhouette, simplified silhouette, Davies-Bouldin and Calinski-Harabasz scores, indexed by k.
+    """
+    parameters = {**SWEEP_PARAMETERS, **(parameters or {})}
+    features_hash = features_hash or array_hash(x)
+    rng = np.random.default_rng(parameters["random_state"])
+    sample_rows = rng.choice(len(x), min(parameters["silhouette_sample_size"], len(x)), replace=False)
+
+    def key(k):
+        return f"{features_hash}:{x.shape}:{k}:{warm_start}:{sorted(parameters.items())}"
+
+    cache = load_sweep_cache(cache_file)
+    missing = [k for k in k_range if not set(SWEEP_SCORES) <= cache.get(key(k), {}).keys()]
+    print(f"K-means sweep: {len(k_range) - len(missing)} cached, {len(missing)} to fit")
+
+    if missing and warm_start:
+        centroids = None
+        for k in tqdm(k_range, desc="K-means sweep"):
+            if k in missing:
+                previous = centroids is not None and len(centroids) == k - 1
+                seeded = np.random.default_rng([parameters["random_state"], k])  # Same start whatever is cached
+                init = next_centroids(x[sample_rows], centroids, seeded) if previous else "k-means++"
+                cache[key(k)] = fit_k(x, k, init, **parameters)
+            centroids = np.asarray(cache[key(k)]["centroids"])
+    elif missing:
+        results = Parallel(n_jobs=-1)(
+            delayed(fit_k)(x, k, "k-means++", **parameters)
+            for k in tqdm(missing, desc="K-means sweep")
+        )
+        cache.update({key(k): result for k, result in zip(missing, results)})
 
-    if len(np.unique(labels_sample)) < 2:
-        print(f"Warning: only {len(np.unique(labels_sample))} clusters found for k={k}")
-        return 0
+    if missing:
+        os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+        with open(cache_file, "w") as f:
+            json.dump(cache, f)
 
-    return np.mean(silhouette_score(x_sample, labels_sample))
+    scores = pd.DataFrame([cache[key(k)] for k in k_range], index=pd.Index(k_range, name="k"))
+    return scores.drop(columns="centroids")
 
 
-def analyze_kmeans(x_train, dataset_name):
+def analyze_kmeans(x_train, dataset_name, features_hash=None, warm_start=True):
     """
     Analyzes K-Means clustering for different values of k and visualizes the results.
     :param:
         x_train (ndarray): Training data.
         dataset_name (str): Identifier for the dataset (used in output file naming).
+        features_hash (str, optional): Hash of the features file, to reuse cached results. Defaults to the hash of the data.
+        warm_start (bool, optional): Whether to start each k from the centroids of the previous one. Defaults to True.
     :return:
         int: Optimal number of clusters based on silhouette score.
     """
     k_range = range(2, 11)
+    x_train = np.asarray(x_train)
 
     print("Dataset statistics:")
     print("- Shape:", x_train.shape)
-    print(
-        "- Unique values:", np.unique(x_train, axis=0).shape[0], "/", x_train.shape[0]
-    )
+    print("- Unique values (hashed):", count_unique_rows(x_train), "/", x_train.shape[0])
     print("- Feature variance:", np.var(x_train, axis=0))
     print("- NaN values present:", np.any(np.isnan(x_train)))
     print("- Inf values present:", np.any(np.isinf(x_train)))
 
-    inertia = Parallel(n_jobs=-1)(
-        delayed(compute_inertia)(k, x_train)
-        for k in tqdm(k_range, desc="Calculating inertia")
-    )
-
-    try:
-        silhouette_scores = Parallel(n_jobs=-1)(
-            delayed(compute_silhouette_score)(k, x_train)
-            for k in tqdm(k_range, desc="Calculating silhouette scores")
-        )
-    except (ValueError, IndexError, RuntimeError) as e:
-        print(f"Error during silhouette score calculation: {e}")
-        silhouette_scores = [0] * len(k_range)
+    scores = sweep_kmeans(x_train, k_range, features_hash=features_hash, warm_start=warm_start)
+    inertia = scores["inertia"].to_numpy()
+    silhouette_scores = scores["silhouette"].to_numpy()
+    print(scores.to_string())
 
     fig, ax = plt.subplots(1, 2, figsize=(12, 5))
 
@@ -104,26 +225,87 @@ def analyze_kmeans(x_train, dataset_name):
     return k_range[np.argmax(silhouette_scores)]
 
 
-def measure_performances(data, labels):
-    """ Measure the performances of clustering algorithms """
-
+def measure_performances(data, labels, silhouette="sampled", centroids=None, sample_size=10000, random_state=42):
+    """
+    Measure the performances of clustering algorithms.
+    :param:
+        data (ndarray): Clustered data.
+        labels (ndarray): Cluster of each row.
+        silhouette (str, optional): "sampled" for the exact silhouette on a seeded sample stratified by cluster,
+            "simplified" for the simplified silhouette on all the rows. Defaults to "sampled".
+        centroids (ndarray, optional): Centroids of the clusters for the simplified silhouette. Defaults to the cluster means.
+        sample_size (int, optional): Size of the sample of the exact silhouette. Defaults to 10000.
+        random_state (int, optional): Seed of the sample. Defaults to 42.
+    :return:
+        tuple: Davies-Bouldin index, Calinski-Harabasz index and silhouette score.
+    """
+    data, labels = np.asarray(data), np.asarray(labels)
     db_index = davies_bouldin_score(data, labels)
     ch_index = calinski_harabasz_score(data, labels)
 
-    data_sample, labels_sample = resample(data, labels, n_samples=10000, random_state=42)
-    silhouette_avg = silhouette_score(data_sample, labels_sample)
+    if silhouette == "simplified":
+        silhouette_avg = simplified_silhouette(data, labels, centroids)
+    elif silhouette == "sampled":
+        silhouette_avg = sampled_silhouette(data, labels, sample_size, random_state)
+    else:
+        raise ValueError(f"Unknown silhouette: {silhouette}")
 
     return db_index, ch_index, silhouette_avg
 
 
-def objective(x, trial):
+def normalized_score(db_index, ch_index, silhouette_avg, n_rows, n_clusters, weights=None):
+    """
+    Weighted sum of the clustering scores, each mapped to [0, 1] with 1 best, so that no score dominates and
+    scores of different subsample sizes compare.
+    :param:
+        db_index (float): Davies-Bouldin index, mapped to 1 / (1 + db).
+        ch_index (float): Calinski-Harabasz index, mapped to the share of the variance between clusters, which
+            it is a ratio of: ch (k - 1) / (ch (k - 1) + n - k). Unlike the raw index it does not grow with n.
+        silhouette_avg (float): Silhouette score, mapped to (s + 1) / 2.
+        n_rows (int): Number of clustered rows.
+        n_clusters (int): Number of clusters.
+        weights (dict, optional): Weights of the "silhouette", "calinski_harabasz" and "davies_bouldin" scores.
+            Defaults to OBJECTIVE_WEIGHTS.
+    :return:
+        float: Normalized score.
+    """
+    weights = weights or OBJECTIVE_WEIGHTS
+    between = ch_index * (n_clusters - 1)
+    scores = {
+        "silhouette": (silhouette_avg + 1) / 2,
+        "calinski_harabasz": between / (between + n_rows - n_clusters),
+        "davies_bouldin": 1 / (1 + db_index),
+    }
+    return sum(weights[name] * score for name, score in scores.items()) / sum(weights.values())
+
+
+def subsample_rungs(n_rows, sizes=OBJECTIVE_RUNGS, random_state=42):
+    """
+    Nested subsamples a trial is evaluated on before the full data: the first rows of one seeded permutation.
+    :param:
+        n_rows (int): Number of rows of the data.
+        sizes (tuple, optional): Sizes of the subsamples; those not smaller than the data are skipped.
+        random_state (int, optional): Seed of the permutation. Defaults to 42.
+    :return:
+        list: Row positions of each subsample, then None for the full data.
+    """
+    order = np.random.default_rng(random_state).permutation(n_rows)
+    return [np.sort(order[:size]) for size in sizes if size < n_rows] + [None]
+
+
+def objective(x, trial, silhouette="simplified", rungs=None, weights=None):
     """
     Objective function for Optuna hyperparameter optimization of MiniBatchKMeans.
+    The trial is fitted on growing subsamples, each starting from the centroids of the previous one, and its
+    normalized score is reported at each step so that the pruner stops unpromising trials before the full data.
     :param:
         x (ndarray): Training data.
         trial (optuna.Trial): Optuna trial instance.
+        silhouette (str, optional): Silhouette of `measure_performances`. Defaults to "simplified", over all the rows.
+        rungs (list, optional): Row positions of the subsamples, None for the full data. Defaults to `subsample_rungs`.
+        weights (dict, optional): Weights of the normalized scores. Defaults to OBJECTIVE_WEIGHTS.
     :return:
-        float: performance score of the clustering result.
+        float: Normalized performance score of the clustering result on the full data.
     """
     # Define the search space
     n_clusters = trial.suggest_int("n_clusters", 2, 10)
@@ -132,67 +314,140 @@ def objective(x, trial):
     max_iter = trial.suggest_int("max_iter", 100, 500)
     tol = trial.suggest_float("tol", 1e-6, 1e-2, log=True)
 
-    # Define the model with the hyperparameters
-    kmeans = MiniBatchKMeans(
-        n_clusters=n_clusters,
-        init=init,
-        batch_size=batch_size,
-        max_iter=max_iter,
-        tol=tol,
-        random_state=42,
-    )
-    # Measure the performances
-    labels = kmeans.fit_predict(x)
-    db_index, ch_index, silhouette_avg = measure_performances(data=x, labels=labels)
+    x = np.asarray(x)
+    rungs = subsample_rungs(len(x)) if rungs is None else rungs
+    for step, rows in enumerate(rungs):
+        x_step = x if rows is None else x[rows]
+
+        # Define the model with the hyperparameters, from the centroids of the previous subsample
+        kmeans = MiniBatchKMeans(
+            n_clusters=n_clusters,
+            init=init if step == 0 else kmeans.cluster_centers_,
+            n_init=1,
+            batch_size=batch_size,
+            max_iter=max_iter,
+            tol=tol,
+            random_state=42,
+        )
+        # Measure the performances
+        labels = kmeans.fit_predict(x_step)
+        if len(np.unique(labels)) < 2:
+            raise optuna.TrialPruned(f"Only one cluster found with {len(x_step)} rows")
+        db_index, ch_index, silhouette_avg = measure_performances(
+            data=x_step, labels=labels, silhouette=silhouette, centroids=kmeans.cluster_centers_
+        )
+        score = normalized_score(db_index, ch_index, silhouette_avg, len(x_step), n_clusters, weights)
+
+        if rows is not None:
+            trial.report(score, step)
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+    return score
 
-    # Define the weights
-    x = trial.suggest_float("silhouette_weight", 0.1, 1.0)
-    y = trial.suggest_float("ch_weight", 0.1, 1.0)
-    z = trial.suggest_float("db_weight", 0.1, 1.0)
 
-    # Return the weighted sum of the performances with the trial parameters
-    return (x * silhouette_avg) + (y * ch_index) - (z * db_index)
+def study_storage(storage):
+    """
+    Storage of a study: a database URL, with a lock timeout for SQLite so that concurrent workers wait for each
+    other rather than fail with "database is locked", or else the path of a journal file.
+    :param:
+        storage (str): Database URL or journal file path.
+    :return:
+        optuna.storages.BaseStorage: Storage of the study.
+    """
+    if "://" in storage:
+        if not storage.startswith("sqlite:///"):
+            return RDBStorage(storage)
+        os.makedirs(os.path.dirname(storage[len("sqlite:///") :]) or ".", exist_ok=True)
+        return RDBStorage(storage, engine_kwargs={"connect_args": {"timeout": SQLITE_TIMEOUT}})
+    os.makedirs(os.path.dirname(storage) or ".", exist_ok=True)
+    return JournalStorage(JournalFileBackend(storage))
+
+
+def _set_worker_data(x, rungs):
+    """Data of the trials of a worker process, inherited from the parent process."""
+    global _worker_data
+    _worker_data = (x, rungs)
+
+
+def _optimize_worker(storage, study_name, n_trials, silhouette, threads):
+    """
+    Runs trials of the shared study in a worker process until the study has `n_trials` finished trials, with at
+    most `threads` BLAS and OpenMP threads so that the workers do not oversubscribe the CPUs.
+    """
+    x, rungs = _worker_data
+    study = optuna.load_study(study_name=study_name, storage=study_storage(storage))
+    with threadpool_limits(limits=threads):
+        study.optimize(
+            lambda trial: objective(x, trial, silhouette, rungs),
+            n_trials=n_trials,
+            callbacks=[MaxTrialsCallback(n_trials, states=(TrialState.COMPLETE, TrialState.PRUNED))],
+        )
 
 
 def optimize_hyperparams(
-    x, n_trials=50, save_path="models/kmeans/optuna_kmeans_results.json"
+    x,
+    n_trials=50,
+    save_path="models/kmeans/optuna_kmeans_results.json",
+    silhouette="simplified",
+    storage=STUDY_STORAGE,
+    study_name="minibatch_kmeans_optimization",
+    workers=None,
 ):
     """
     Optimizes MiniBatchKMeans hyperparameters using Optuna and saves the results.
+    The study is stored in a journal file or a database, so that worker processes run trials concurrently and an
+    interrupted study resumes where it stopped: `n_trials` counts the finished trials of all the runs of the study.
+    The best parameters of previous results are evaluated again as a first trial of a new study, and only scores of
+    the study, all normalized, are compared and saved. Errors of the study are raised, so that stale results are
+    never saved.
     :param:
         x (ndarray): Training data.
         n_trials (int, optional): Number of optimization trials. Defaults to 50.
         save_path (str, optional): Path to save optimization results. Defaults to "models/kmeans/optuna_kmeans_results.json".
+        silhouette (str, optional): Silhouette of the objective, "simplified" or "sampled". Defaults to "simplified".
+        storage (str, optional): Journal file path or database URL of the study. Defaults to STUDY_STORAGE.
+        study_name (str, optional): Name of the study in the database. Defaults to "minibatch_kmeans_optimization".
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
     :return:
-        dict: Best parameters and corresponding silhouette score.
+        dict: Best parameters and corresponding normalized score.
     """
-    best_params, best_value = {}, float("-inf")
-
+    previous_params = {}
     if os.path.exists(save_path):
         try:
             with open(save_path, "r") as f:
-                saved_results = json.load(f)
-                best_params = saved_results.get("best_params", {})
-                best_value = saved_results.get("best_value", float("-inf"))
+                previous_params = json.load(f).get("best_params", {})
                 print("Loaded previous optimization results...")
         except Exception as e:
             print(f"Error loading results: {e}")
 
     study = optuna.create_study(
-        direction="maximize", study_name="minibatch_kmeans_optimization"
+        direction="maximize",
+        study_name=study_name,
+        storage=study_storage(storage),
+        load_if_exists=True,
+        pruner=MedianPruner(n_startup_trials=5, n_warmup_steps=0, interval_steps=1),
     )
-
-    if best_params:
-        study.enqueue_trial(best_params)
-
-    try:
-        study.optimize(lambda trial: objective(x, trial), n_trials=n_trials)
-        best_params = study.best_params
-        best_value = study.best_value
-    except Exception as e:
-        print(f"Optimization error: {e}")
-
-    results = {"best_params": best_params, "best_value": best_value}
+    finished = len(study.get_trials(deepcopy=False, states=(TrialState.COMPLETE, TrialState.PRUNED)))
+    print(f"Study {study_name}: {finished} finished trials in {storage}")
+
+    if previous_params and not study.trials:  # Scored again, on the normalized scale of the study
+        study.enqueue_trial({name: value for name, value in previous_params.items() if name in SEARCH_SPACE})
+
+    x = np.asarray(x)
+    rungs = subsample_rungs(len(x))
+    workers = min(workers or os.cpu_count() or 1, max(n_trials - finished, 1))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    if finished >= n_trials:
+        pass
+    elif workers == 1:
+        _set_worker_data(x, rungs)
+        _optimize_worker(storage, study_name, n_trials, silhouette, threads)
+    else:
+        # Forked workers inherit the data instead of receiving a copy
+        with get_context("fork").Pool(workers, initializer=_set_worker_data, initargs=(x, rungs)) as pool:
+            pool.starmap(_optimize_worker, [(storage, study_name, n_trials, silhouette, threads)] * workers)
+
+    results = {"best_params": study.best_params, "best_value": study.best_value}
 
     try:
         with open(save_path, "w") as f:
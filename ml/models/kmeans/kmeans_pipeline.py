@@ -2,16 +2,18 @@ import json
 import os
 import sys
 import joblib
+import numpy as np
 import pandas as pd
 import pyarrow as pa
 import pyarrow.feather as feather
-from sklearn.cluster import KMeans
-from sklearn.decomposition import PCA
+from sklearn.cluster import KMeans, MiniBatchKMeans
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
 from kmeans_analysis import analyze_kmeans, optimize_hyperparams, measure_performances
+from ml.utils.clustering_metrics import stratified_sample
 from ml.utils.splitting import splitting
 from ml.utils.hf_hub import upload_model
+from ml.utils.projection import load_projection
 from ml.interpreter.comparison import clusters_analysis
 from ml.interpreter.scoring.kpi import compute_scoring
 from src.backend.analyzer import plotter
@@ -23,10 +25,17 @@ class KMeansPipeline:
     :param reduce_dimensions: Whether to reduce the dimensions of the dataset with PCA.
     :param optimization: Whether to optimize hyperparameters using Optuna.
     :param upload: Whether to upload the trained model to Hugging Face Hub.
+    :param streaming: Whether to train and predict over batches of rows of the memory-mapped features file,
+        instead of the whole matrix in memory. The model is then a MiniBatchKMeans, initialized once and updated
+        batch by batch, instead of the KMeans with 10 initializations fitted on the whole matrix, so its clusters
+        may differ; the analysis and the optimization run on a seeded sample of `analysis_rows` rows.
+    :param batch_rows: Number of rows of a batch in streaming mode.
+    :param epochs: Number of passes over the batches to train the model in streaming mode.
     """
 
     def __init__(
-        self, analyse=False, reduce_dimensions=True, optimization=False, upload=False, no_graph=False
+        self, analyse=False, reduce_dimensions=True, optimization=False, upload=False, no_graph=False,
+        streaming=True, batch_rows=65536, epochs=3,
     ):
         """Initialize the KMeans pipeline"""
         self.analyse = analyse
@@ -34,15 +43,25 @@ class KMeansPipeline:
         self.optimization = optimization
         self.upload = upload
         self.no_graph = no_graph
+        self.streaming = streaming
+        self.batch_rows = batch_rows
+        self.epochs = epochs
+        self.evaluation_rows = 100_000  # Rows of the stratified sample the streamed model is evaluated on
+        self.analysis_rows = 200_000  # Rows of the sample analysed and optimized on in streaming mode
         self.dataset = None
+        self.features = None
         self.x_all = None
         self.y_all = None
+        self.pca = None
+        self.n_components = 28
+        self.pca_method = "covariance"
         self.best_k = 4
         self.model = None
         self.clusters = None
         self.features_path = f"data/features/features.arrow"
         self.predictions_path = f"data/clustering/kmeans/kmeans_predictions.arrow"
         self.model_path = f"src/frontend/layouts/data/DeFI-Kmeans.pkl"
+        self.pca_path = f"src/frontend/layouts/data/DeFI-Kmeans-PCA.pkl"
         self.optuna_results_path = "src/frontend/layouts/data/optuna_study_results.json"
         self.performance_path = f"src/frontend/layouts/data/kmeans_performance.json"
 
@@ -68,22 +87,51 @@ class KMeansPipeline:
         """Load data and split into training and testing sets"""
         print("1. Splitting\n---------------------------------")
         self.dataset = splitting()
-        self.x_all = self.dataset["all"][0]
-        self.y_all = self.dataset["all"][1]
+        self.features = self.dataset.matrix
+        if not self.streaming:
+            self.load_in_memory()
+
+    def load_in_memory(self):
+        """Materialize the features of all the addresses, reduced if the PCA is fitted"""
+        if self.x_all is None:
+            self.x_all, self.y_all = self.dataset["all"]
+            if self.pca is not None:
+                self.x_all = self.pca.transform(self.x_all.to_numpy())
+
+    def analysis_data(self):
+        """Features the analysis and the optimization run on, reduced if the PCA is fitted: a seeded sample of rows in streaming mode"""
+        if not self.streaming:
+            self.load_in_memory()
+            return self.x_all
+        # No clusters yet to stratify by: a uniform sample, the same for every step
+        rows = np.arange(len(self.features))
+        if self.analysis_rows < len(rows):
+            rows = np.sort(np.random.default_rng(42).choice(rows, self.analysis_rows, replace=False))
+        x = self.features.to_numpy(rows, fill_value=0)
+        print(f"(on a sample of {len(rows)} rows)")
+        return x if self.pca is None else self.pca.transform(x)
+
+    def batches(self, starts=None):
+        """Features of consecutive rows, reduced if the PCA is fitted, one batch at a time"""
+        for start, x in self.features.iter_batches(self.batch_rows, starts, fill_value=0):
+            yield start, x if self.pca is None else self.pca.transform(x)
 
     def analyze(self):
         """Analyze the dataset to determine the optimal number of clusters"""
         print("\n2. Analyse\n---------------------------------")
-        self.best_k = analyze_kmeans(self.x_all, set="train")
+        self.best_k = analyze_kmeans(
+            self.analysis_data(), dataset_name="train", features_hash=self.dataset.matrix.content_hash
+        )
         print(f"Optimal number of clusters (train): {self.best_k}")
 
     def reduce(self):
         """Reduce the dimensions of the dataset with PCA"""
         if self.reduce_dimensions:
             print("\n3. Reduce dimensions\n---------------------------------")
-            pca = PCA(n_components=28)
-            self.x_all = pca.fit_transform(self.x_all)
-            print(f"Dimensions reduced successfully: {self.x_all.shape}")
+            self.pca = load_projection(self.features, self.n_components, self.pca_method, batch_rows=self.batch_rows)
+            if self.x_all is not None:
+                self.x_all = self.pca.transform(self.x_all.to_numpy())
+            print(f"Dimensions reduced successfully: {(len(self.features), self.pca.n_components_)}")
         else:
             print("\n3. No dimension reduction\n---------------------------------")
 
@@ -110,7 +158,7 @@ class KMeansPipeline:
         """Optimize hyperparameters using Optuna"""
         print("\n5. Optimizing hyperparameters\n---------------------------------")
         results = optimize_hyperparams(
-            self.x_all, n_trials=500, save_path=self.optuna_results_path
+            self.analysis_data(), n_trials=500, save_path=self.optuna_results_path
         )
         self.best_k = results["best_params"]["n_clusters"]
         print(f"Optimal number of clusters (all): {self.best_k}")
@@ -118,13 +166,26 @@ class KMeansPipeline:
     def train_model(self):
         """Train the KMeans model"""
         print("\n6. Train\n---------------------------------")
+        if self.streaming:
+            self.model = MiniBatchKMeans(n_clusters=self.best_k, random_state=42, batch_size=self.batch_rows)
+            rng = np.random.default_rng(42)
+            starts = np.arange(0, len(self.features), self.batch_rows)
+            for epoch in range(self.epochs):
+                for _, x in self.batches(rng.permutation(starts)):
+                    if len(x) >= self.best_k:  # partial_fit rejects a batch of fewer rows than clusters, e.g. a short last batch
+                        self.model.partial_fit(x)
+            print(f"Model trained successfully on {len(starts)} batches x {self.epochs} epochs")
+            return
         self.model = KMeans(n_clusters=self.best_k, random_state=42, n_init=10)
         self.model.fit(self.x_all)
         print("Model trained successfully")
 
     def save(self):
-        """Save the Kmeans trained model"""
+        """Save the Kmeans trained model and the PCA projection it is trained on"""
         print("\n7. Save model\n---------------------------------")
+        if self.pca is not None:
+            print(f"Saving PCA projection to {self.pca_path}")
+            joblib.dump(self.pca, self.pca_path)
         print(f"Saving model to {self.model_path}")
         return joblib.dump(self.model, self.model_path)
 
@@ -137,6 +198,9 @@ class KMeansPipeline:
     def predict(self):
         """Predict the clusters for all addresses and save the results"""
         print("\n9. Predict\n---------------------------------")
+        if self.streaming:
+            self.predict_batches()
+            return
         self.clusters = self.model.predict(self.x_all)
         results = pd.DataFrame({"address": self.y_all, "cluster": self.clusters})
         print(f"Predictions: {results.shape[0]} rows clustered")
@@ -146,17 +210,41 @@ class KMeansPipeline:
         feather.write_feather(table, self.predictions_path)
         print(f"Predictions saved successfully to {self.predictions_path}")
 
+    def predict_batches(self):
+        """Predict the clusters batch by batch, appending each batch to the predictions file"""
+        self.clusters = np.empty(len(self.features), dtype=np.int32)
+        schema = pa.schema([("address", pa.string()), ("cluster", pa.int32())])
+        with pa.OSFile(self.predictions_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+            for start, x in self.batches():
+                clusters = self.model.predict(x).astype(np.int32)
+                self.clusters[start : start + len(clusters)] = clusters
+                addresses = self.features.address_slice(start, len(clusters))
+                writer.write_batch(pa.record_batch([addresses, pa.array(clusters)], schema=schema))
+        print(f"Predictions: {len(self.clusters)} rows clustered")
+
+        print("\n10. Save predictions\n---------------------------------")
+        print(f"Predictions saved successfully to {self.predictions_path}")
+
     def upload_model(self):
         """Upload the trained model to Hugging Face Hub"""
         print("\n11. Upload model to HF\n---------------------------------")
         upload_model(self.model_path, "DeFI-Kmeans.pkl")
+        if self.pca is not None:
+            upload_model(self.pca_path, "DeFI-Kmeans-PCA.pkl")
 
     def analyse_results(self):
         """Analyze the results of the KMeans clustering"""
         print("\n12. Analyzing results\n---------------------------------")
 
         print("\nPerformances:\n")
-        db_index, ch_index, silhouette_avg = measure_performances(data=self.x_all, labels=self.clusters)
+        if self.streaming:
+            rows = stratified_sample(self.clusters, self.evaluation_rows, random_state=42)
+            x_sample = self.features.to_numpy(rows, fill_value=0)
+            x_sample = x_sample if self.pca is None else self.pca.transform(x_sample)
+            print(f"(on a stratified sample of {len(rows)} rows)")
+            db_index, ch_index, silhouette_avg = measure_performances(data=x_sample, labels=self.clusters[rows])
+        else:
+            db_index, ch_index, silhouette_avg = measure_performances(data=self.x_all, labels=self.clusters)
         print(f"--> Davies-Bouldin Index: {db_index}")
         print(f"--> Calinski-Harabasz Index: {ch_index}")
         print(f"--> Silhouette Avg: {silhouette_avg}")
@@ -1,70 +1,122 @@
 import os
+from multiprocessing import Pool
 
 import numpy as np
 import pandas as pd
-import pyarrow as pa
-import pyarrow.feather as feather
 
-from scipy.stats import kurtosis, skew, normaltest, boxcox
+from scipy.stats import normaltest
 
+from ml.processing.moments import Moments, Reservoir
+from ml.processing.standardizer import Standardizer
+from ml.utils.feature_matrix import FEATURES_DTYPE, FeatureMatrix, write_feature_matrix
 
-def analyze_df(df, csv_out):
-    """Analyze the distribution of numeric columns in a DataFrame, define a standardisation method associated and save the results to a CSV file."""
+
+ANALYSIS_CHUNK_ROWS = 1 << 20  # Rows of a column whose moments are computed at once
+
+
+def column_statistics(values, chunk_rows=ANALYSIS_CHUNK_ROWS, sample_size=None, random_state=None):
+    """
+    Normality p-value, skewness, kurtosis and positivity of a column, in one pass over chunks of its values.
+    The p-value is computed from the moments of all the values, or on a reservoir sample of `sample_size` values if set.
+    """
+    moments = Moments()
+    reservoir = Reservoir(sample_size, random_state) if sample_size else None
+    for start in range(0, len(values), chunk_rows):
+        chunk = values[start : start + chunk_rows]
+        moments.update(chunk)
+        if reservoir is not None:
+            reservoir.update(chunk)
+
+    if reservoir is not None:
+        sample = reservoir.sample()
+        p_val = normaltest(sample)[1] if len(sample) > 7 else np.nan
+    else:
+        p_val = moments.normaltest() if moments.n > 7 else np.nan
+    skew_val = moments.skewness() if moments.n > 1 else np.nan
+    kurt_val = moments.kurtosis() if moments.n > 1 else np.nan
+    all_positive = moments.missing == 0 and moments.minimum > 0
+    return p_val, skew_val, kurt_val, all_positive
+
+
+def _analyze_column(task):
+    """Statistics of one column in a worker process, or the error raised."""
+    col, values, chunk_rows, sample_size, random_state = task
+    try:
+        return col, column_statistics(values, chunk_rows, sample_size, random_state), None
+    except ValueError as e:
+        return col, None, e
+
+
+def analyze_df(df, csv_out, workers=None, sample_size=None, random_state=42, chunk_rows=ANALYSIS_CHUNK_ROWS):
+    """
+    Analyze the distribution of numeric columns in a DataFrame, define a standardisation method associated and save the results to a CSV file.
+    Columns are analyzed in parallel by `workers` processes; `sample_size` runs the normality test on a reservoir sample of each column.
+    """
     if not isinstance(df, pd.DataFrame):
         raise ValueError("Input is not a DataFrame.")
 
     numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
     results = []
 
-    for idx, col in enumerate(numeric_cols):
-        try:
-            col_data = df[col].dropna()
-            p_val = normaltest(col_data)[1] if len(col_data) > 7 else np.nan
-            norm_status = "Not-normal" if p_val < 0.05 else "Normal"
-            skew_val = skew(col_data) if len(col_data) > 1 else np.nan
-            kurt_val = kurtosis(col_data) if len(col_data) > 1 else np.nan
-
-            skew_desc = (
-                "Symmetric"
-                if abs(skew_val) < 0.5
-                else ("Positively skewed" if skew_val > 0 else "Negatively skewed")
-            )
-            kurt_desc = (
-                "Mesokurtic (Normal)"
-                if 2.5 <= kurt_val <= 3.5
-                else ("Leptokurtic" if kurt_val > 3.5 else "Platykurtic")
-            )
-
-            if norm_status == "Normal":
-                standardization = "Z-score"
-            elif abs(skew_val) < 0.5:  # Faible asymétrie
-                standardization = "Min-Max"
-            elif skew_val > 1:  # Asymétrie positive forte
-                standardization = "Log" if (df[col] > 0).all() else "Box-Cox"
-            elif skew_val < -1:  # Asymétrie négative forte
-                standardization = "Log Inverse" if (df[col] > 0).all() else "Box-Cox"
-            elif kurt_val > 3.5:  # Kurtosis élevée, queues épaisses
-                standardization = "Box-Cox"
-            elif kurt_val < 2.5:  # Kurtosis faible, queues légères
-                standardization = "Min-Max"
-            else:
-                standardization = "None"
-
-            results.append(
-                [
-                    col,
-                    norm_status,
-                    p_val,
-                    skew_val,
-                    skew_desc,
-                    kurt_val,
-                    kurt_desc,
-                    standardization,
-                ]
-            )
-
-        except ValueError as e:
-            print(f"Error on {col}: {e}")
+    def tasks():
+        for col in numeric_cols:
+            values = df[col].to_numpy()
+            if values.dtype.kind not in "fiu":
+                values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            yield col, values, chunk_rows, sample_size, random_state
+
+    workers = min(workers or os.cpu_count() or 1, max(len(numeric_cols), 1))
+    if workers == 1:
+        statistics = [_analyze_column(task) for task in tasks()]
+    else:
+        with Pool(workers) as pool:
+            statistics = list(pool.imap(_analyze_column, tasks()))
+
+    for col, column_stats, error in statistics:
+        if error is not None:
+            print(f"Error on {col}: {error}")
+            continue
+        p_val, skew_val, kurt_val, all_positive = column_stats
+        norm_status = "Not-normal" if p_val < 0.05 else "Normal"
+
+        skew_desc = (
+            "Symmetric"
+            if abs(skew_val) < 0.5
+            else ("Positively skewed" if skew_val > 0 else "Negatively skewed")
+        )
+        kurt_desc = (
+            "Mesokurtic (Normal)"
+            if 2.5 <= kurt_val <= 3.5
+            else ("Leptokurtic" if kurt_val > 3.5 else "Platykurtic")
+        )
+
+        if norm_status == "Normal":
+            standardization = "Z-score"
+        elif abs(skew_val) < 0.5:  # Faible asymétrie
+            standardization = "Min-Max"
+        elif skew_val > 1:  # Asymétrie positive forte
+            standardization = "Log" if all_positive else "Box-Cox"
+        elif skew_val < -1:  # Asymétrie négative forte
+            standardization = "Log Inverse" if all_positive else "Box-Cox"
+        elif kurt_val > 3.5:  # Kurtosis élevée, queues épaisses
+            standardization = "Box-Cox"
+        elif kurt_val < 2.5:  # Kurtosis faible, queues légères
+            standardization = "Min-Max"
+        else:
+            standardization = "None"
+
+        results.append(
+            [
+                col,
+                norm_status,
+                p_val,
+                skew_val,
+                skew_desc,
+                kurt_val,
+                kurt_desc,
+                standardization,
+            ]
+        )
 
     df_results = pd.DataFrame(
         results,
@@ -86,36 +138,7 @@ def standardize_df(df, csv_in):
     """Standardize the numeric columns in a DataFrame based on the standardization method defined in a CSV file."""
     if not isinstance(df, pd.DataFrame):
         raise ValueError("Input is not a DataFrame.")
-    try:
-        std_info = pd.read_csv(csv_in)
-    except (FileNotFoundError, pd.errors.EmptyDataError) as e:
-        raise ValueError(f"Error loading standardization file: {e}") from e
-
-    df_transformed = df.copy()
-
-    for idx, row in std_info.iterrows():
-        col, method = row["Variable"], row["Standardization"]
-        if col in df_transformed.columns and pd.api.types.is_numeric_dtype(
-            df_transformed[col]
-        ):
-            if method == "Z-score":
-                df_transformed[col] = (
-                    df_transformed[col] - df_transformed[col].mean()
-                ) / df_transformed[col].std()
-            elif method == "Min-Max":
-                df_transformed[col] = (
-                    df_transformed[col] - df_transformed[col].min()
-                ) / (df_transformed[col].max() - df_transformed[col].min())
-            elif method == "Log":
-                df_transformed[col] = np.log1p(np.maximum(df_transformed[col], 0))
-            elif method == "Log Inverse":
-                df_transformed[col] = np.log1p(np.maximum(-df_transformed[col], 0))
-            elif method == "Box-Cox":
-                df_transformed[col], _ = boxcox(
-                    df_transformed[col] - df_transformed[col].min() + 1
-                )
-
-    return df_transformed
+    return Standardizer.from_csv(csv_in).fit(df).transform(df)
 
 
 def standardisation_process():
@@ -126,8 +149,9 @@ def standardisation_process():
     os.makedirs(config_path, exist_ok=True)
 
     print("1.Loading data\n-------------------------------------")
-    table = feather.read_table("data/features/features.arrow")
-    df = table.to_pandas()
+    features = FeatureMatrix.load("data/features/features.arrow")
+    df = features.to_frame()
+    df.insert(0, "address", features.addresses())
     print("Data loaded successfully\n")
 
     print("2. Analyzing data\n-------------------------------------")
@@ -135,7 +159,9 @@ def standardisation_process():
     print("Data analyzed successfully\n")
 
     print("3. Standardizing data\n-------------------------------------")
-    df_std = standardize_df(df, csv_in="config/to_standardize_stats.csv")
+    standardizer = Standardizer.from_csv("config/to_standardize_stats.csv").fit(df)
+    standardizer.save("config/standardizer.csv")  # Applied as is to the features of new addresses
+    df_std = standardizer.transform(df, dtype=FEATURES_DTYPE)
     print("Data standardized successfully\n")
 
     print("4. Analyzing standardized data\n-------------------------------------")
@@ -143,6 +169,5 @@ def standardisation_process():
     print("Data analyzed successfully\n")
 
     print("5. Saving standardized data\n-------------------------------------")
-    table = pa.Table.from_pandas(df_std)
-    feather.write_feather(table, "data/features/features_standardised.arrow")
+    write_feature_matrix(df_std, "data/features/features_standardised.arrow", median_mode=features.median_mode)
     print("Data saved successfully\n")
@@ -0,0 +1,290 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from ml.processing.quantile_sketch import GroupedCounts, GroupedQuantileSketch
+
+DAY_WIDTH = 1 << 17  # Days since 1970 in the (group, day) keys of the active days
+UNITS = {"eth": "value_eth", "gas": "gas_used"}  # Unit of the features -> transactions column
+SIDES = [("from", "sent"), ("to", "received")]  # Group 2 * row + side, as the arrow engine
+TRANSACTION_FEATURES = [
+    feature
+    for _, prefix in SIDES
+    for feature in [
+        f"{statistic}_{prefix}_{unit}"
+        for unit in UNITS
+        for statistic in ["min", "avg", "med", "max", "std"]
+    ]
+    + [
+        f"avg_gas_efficiency_{prefix}",
+        f"peak_hour_{prefix}",
+        f"peak_count_{prefix}",
+        f"tx_frequency_{prefix}",
+    ]
+]  # Columns of `aggregate_transactions` derived from the store, in order
+
+
+def group_moments(groups: np.ndarray, values: np.ndarray, n_groups: int) -> dict:
+    """Per-group count, sum, sum of squared deviations, min and max ignoring NaN, for values grouped by each row of `groups` (-1 for no group)."""
+    n = len(values)
+    valid = ~np.isnan(values)
+    keys = np.concatenate(
+        [(grouping * n + np.arange(n))[valid & (grouping >= 0)] for grouping in groups]
+    )
+    keys.sort()
+    count = np.bincount(keys // n, minlength=n_groups)
+    grouped = values[keys % n]
+    del keys
+
+    moments = {
+        "count": count,
+        "sum": np.zeros(n_groups),
+        "m2": np.zeros(n_groups),
+        "min": np.full(n_groups, np.nan),
+        "max": np.full(n_groups, np.nan),
+    }
+    filled = count > 0
+    if filled.any():
+        starts = (np.cumsum(count) - count)[filled]
+        sizes = count[filled]
+        sums = np.add.reduceat(grouped, starts)
+        moments["sum"][filled] = sums
+        moments["m2"][filled] = np.add.reduceat((grouped - np.repeat(sums / sizes, sizes)) ** 2, starts)
+        moments["min"][filled] = np.minimum.reduceat(grouped, starts)
+        moments["max"][filled] = np.maximum.reduceat(grouped, starts)
+    return moments
+
+
+def merge_moments(left: dict, right: dict) -> dict:
+    """Combine the moments of the same groups over two sets of values (Chan et al. parallel variance)."""
+    count = left["count"] + right["count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = right["sum"] / right["count"] - left["sum"] / left["count"]
+        m2 = left["m2"] + right["m2"] + delta**2 * left["count"] * right["count"] / count
+    return {
+        "count": count,
+        "sum": left["sum"] + right["sum"],
+        "m2": np.where((left["count"] > 0) & (right["count"] > 0), m2, left["m2"] + right["m2"]),
+        "min": np.fmin(left["min"], right["min"]),
+        "max": np.fmax(left["max"], right["max"]),
+    }
+
+
+def moments_statistics(moments: dict) -> dict:
+    """Min, mean, max and sample std of each group from its moments, NaN for groups without values."""
+    count = moments["count"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {
+            "min": moments["min"],
+            "mean": np.where(count > 0, moments["sum"] / count, np.nan),
+            "max": moments["max"],
+            "std": np.where(count > 1, np.sqrt(moments["m2"] / (count - 1)), np.nan),
+        }
+
+
+class FeatureStore:
+    """
+    Sufficient statistics of the transactions features of each address, sent and received: moments
+    of the values and gas, gas efficiency sums, hour histograms, active days and median sketches.
+    Deltas of new transactions fold in without the history, and the features of any address are
+    derived from its statistics alone.
+    """
+
+    def __init__(self, median_error: float = 0.01):
+        self.median_error = median_error
+        self.addresses = pd.Index([], dtype=object)  # Row of each address, append-only
+        self.rows = np.empty(0, dtype=np.int64)  # Transactions of each group
+        self.moments = {unit: group_moments(np.empty((2, 0), dtype=np.int64), np.empty(0), 0) for unit in UNITS}
+        self.efficiency = {"count": np.empty(0, dtype=np.int64), "sum": np.empty(0)}
+        self.hours = GroupedCounts(24)
+        self.days = GroupedCounts(DAY_WIDTH)
+        self.sketches = {unit: GroupedQuantileSketch(median_error) for unit in UNITS}
+        self.min_timestamp = None
+        self.max_timestamp = None
+
+    @property
+    def n_groups(self) -> int:
+        return 2 * len(self.addresses)
+
+    @property
+    def total_days(self) -> int:
+        """Days between the first and last transaction, as in `aggregate_transactions`."""
+        if self.min_timestamp is None:
+            return 1
+        return (self.max_timestamp - self.min_timestamp).days or 1
+
+    def _grow(self, n_groups: int) -> None:
+        """Extend the per-group arrays with empty statistics for new addresses."""
+        added = n_groups - len(self.rows)
+        empty = group_moments(np.empty((2, 0), dtype=np.int64), np.empty(0), added)
+        self.rows = np.concatenate([self.rows, np.zeros(added, dtype=np.int64)])
+        for unit in UNITS:
+            self.moments[unit] = {
+                name: np.concatenate([self.moments[unit][name], empty[name]]) for name in empty
+            }
+        self.efficiency = {
+            "count": np.concatenate([self.efficiency["count"], np.zeros(added, dtype=np.int64)]),
+            "sum": np.concatenate([self.efficiency["sum"], np.zeros(added)]),
+        }
+
+    def fold(self, transactions: pd.DataFrame) -> pd.Index:
+        """Add a delta of transactions, with the cleaned columns of `aggregate_transactions`; return the addresses it touched."""
+        if transactions.empty:
+            return pd.Index([], dtype=object)
+        timestamp = pd.to_datetime(transactions["timestamp"])
+        if timestamp.dt.tz is not None:
+            timestamp = timestamp.dt.tz_localize(None)
+        has_time = timestamp.notna().to_numpy()
+        ticks = timestamp.to_numpy("datetime64[ns]").view(np.int64)
+        if has_time.any():
+            first, last = timestamp.min(), timestamp.max()
+            self.min_timestamp = first if self.min_timestamp is None else min(self.min_timestamp, first)
+            self.max_timestamp = last if self.max_timestamp is None else max(self.max_timestamp, last)
+
+        touched = pd.Index(pd.concat([transactions["from"], transactions["to"]]).dropna().unique())
+        self.addresses = self.addresses.append(touched.difference(self.addresses, sort=False))
+        self._grow(self.n_groups)
+        groups = np.stack(
+            [
+                np.where(rows >= 0, 2 * rows + side, -1)
+                for side, rows in enumerate(
+                    self.addresses.get_indexer(transactions[column]) for column, _ in SIDES
+                )
+            ]
+        )
+
+        self.rows += np.bincount(groups[groups >= 0], minlength=self.n_groups)
+        for unit, column in UNITS.items():
+            values = transactions[column].to_numpy(np.float64, na_value=np.nan)
+            self.moments[unit] = merge_moments(
+                self.moments[unit], group_moments(groups, values, self.n_groups)
+            )
+            self.sketches[unit].update(groups, values)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            efficiency = (
+                transactions["value_eth"].to_numpy(np.float64, na_value=np.nan)
+                / transactions["gas_used"].to_numpy(np.float64, na_value=np.nan)
+            )
+        counted = (groups >= 0) & ~np.isnan(efficiency)
+        self.efficiency["count"] += np.bincount(groups[counted], minlength=self.n_groups)
+        self.efficiency["sum"] += np.bincount(
+            groups[counted],
+            weights=np.broadcast_to(efficiency, counted.shape)[counted],
+            minlength=self.n_groups,
+        )
+        timed = np.where(has_time, groups, -1)
+        self.hours.add(timed, np.where(has_time, ticks // 3_600_000_000_000 % 24, 0))
+        self.days.add(timed, np.where(has_time, ticks // 86_400_000_000_000, 0))
+        return touched
+
+    def _sides(self, addresses):
+        """For each side, the group of each address and whether it has transactions on that side."""
+        position = self.addresses.get_indexer(pd.Index(addresses, dtype=object))
+        known = position >= 0
+        for side, (group_col, prefix) in enumerate(SIDES):
+            groups = np.where(known, 2 * position + side, -1)
+            found = known.copy()
+            found[known] = self.rows[groups[known]] > 0
+            yield group_col, prefix, groups[found], found
+
+    @staticmethod
+    def _take(values: np.ndarray, found: np.ndarray) -> np.ndarray:
+        """Values of the found addresses, NaN for the others."""
+        column = np.full(len(found), np.nan)
+        column[found] = values
+        return column
+
+    def tx_frequency(self, addresses) -> pd.DataFrame:
+        """`tx_frequency_sent` and `tx_frequency_received` of addresses, which depend on the span of all transactions."""
+        days = self.days.group_sizes(self.n_groups)
+        return pd.DataFrame(
+            {
+                f"tx_frequency_{prefix}": self._take(days[groups], found) / self.total_days
+                for _, prefix, groups, found in self._sides(addresses)
+            }
+        )
+
+    def features(self, addresses) -> pd.DataFrame:
+        """Transactions features of addresses, with the columns of `aggregate_transactions`; NaN for addresses without transactions on a side."""
+        addresses = pd.Series(pd.Index(addresses, dtype=object))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            efficiency = self.efficiency["sum"] / self.efficiency["count"]
+
+        features = {}
+        for group_col, prefix, groups, found in self._sides(addresses):
+            features[group_col] = addresses.where(found)
+            for unit in UNITS:  # Only the groups of the addresses are read
+                statistics = moments_statistics(
+                    {name: values[groups] for name, values in self.moments[unit].items()}
+                )
+                statistics["avg"] = statistics.pop("mean")
+                statistics["med"] = self.sketches[unit].select(groups).median(len(groups))
+                for statistic in ["min", "avg", "med", "max", "std"]:
+                    features[f"{statistic}_{prefix}_{unit}"] = self._take(statistics[statistic], found)
+            peak_hour, peak_count = self.hours.select(groups).mode(len(groups))
+            features[f"avg_gas_efficiency_{prefix}"] = self._take(efficiency[groups], found)
+            features[f"peak_hour_{prefix}"] = self._take(peak_hour, found)
+            features[f"peak_count_{prefix}"] = self._take(peak_count, found)
+            features[f"tx_frequency_{prefix}"] = (
+                self._take(self.days.select(groups).group_sizes(len(groups)), found) / self.total_days
+            )
+        return pd.DataFrame(features)
+
+    def save(self, path: str) -> None:
+        """Write the store to an Arrow IPC file, one row per address and side."""
+        columns = {
+            "address": pa.array(np.repeat(self.addresses.to_numpy(dtype=object), 2), type=pa.string()),
+            "rows": self.rows,
+            "efficiency_count": self.efficiency["count"],
+            "efficiency_sum": self.efficiency["sum"],
+        }
+        for unit in UNITS:
+            for name, values in self.moments[unit].items():
+                columns[f"{unit}_{name}"] = values
+        counts = {"hours": self.hours, "days": self.days}
+        counts.update({f"{unit}_sketch": sketch for unit, sketch in self.sketches.items()})
+        for name, grouped in counts.items():
+            offsets = pa.array(grouped.offsets(self.n_groups), type=pa.int64())
+            columns[f"{name}_buckets"] = pa.LargeListArray.from_arrays(
+                offsets, pa.array(grouped.keys % grouped.width)
+            )
+            columns[f"{name}_counts"] = pa.LargeListArray.from_arrays(offsets, pa.array(grouped.counts))
+        metadata = {
+            "median_error": str(self.median_error),
+            "min_timestamp": "" if self.min_timestamp is None else self.min_timestamp.isoformat(),
+            "max_timestamp": "" if self.max_timestamp is None else self.max_timestamp.isoformat(),
+        }
+        table = pa.table(columns).replace_schema_metadata(metadata)
+        feather.write_feather(table, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureStore":
+        """Read a store written by `save`."""
+        table = feather.read_table(path)
+        metadata = {key.decode(): value.decode() for key, value in table.schema.metadata.items()}
+        store = cls(float(metadata["median_error"]))
+        store.addresses = pd.Index(table["address"].to_numpy()[::2], dtype=object)
+        store.rows = table["rows"].to_numpy()
+        store.efficiency = {
+            "count": table["efficiency_count"].to_numpy(),
+            "sum": table["efficiency_sum"].to_numpy(),
+        }
+        for unit in UNITS:
+            store.moments[unit] = {
+                name: table[f"{unit}_{name}"].to_numpy() for name in ["count", "sum", "m2", "min", "max"]
+            }
+        counts = {"hours": store.hours, "days": store.days}
+        counts.update({f"{unit}_sketch": sketch for unit, sketch in store.sketches.items()})
+        for name, grouped in counts.items():
+            buckets = table[f"{name}_buckets"].combine_chunks()
+            offsets = buckets.offsets.to_numpy()
+            grouped.set_lists(
+                offsets - offsets[0],
+                buckets.flatten().to_numpy(),
+                table[f"{name}_counts"].combine_chunks().flatten().to_numpy(),
+            )
+        for bound in ["min_timestamp", "max_timestamp"]:
+            if metadata[bound]:
+                setattr(store, bound, pd.Timestamp(metadata[bound]))
+        return store
@@ -1,6 +1,52 @@
+import os
+import numpy as np
 import pandas as pd
 import pyarrow as pa
-import pyarrow.feather as feather
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from ml.processing.feature_store import (
+    TRANSACTION_FEATURES,
+    FeatureStore,
+    group_moments,
+    moments_statistics,
+)
+from ml.processing.quantile_sketch import GroupedCounts, GroupedQuantileSketch
+from ml.utils.feature_matrix import write_feature_matrix
+
+TRANSACTIONS_COLUMNS = ["timestamp", "from", "to", "value (ETH)", "gas_used"]
+MEDIAN_ERROR_SAMPLE = 10000  # Groups compared with their exact median by `--report-sample`
+FEATURES_PATH = "data/features/features.arrow"
+FEATURE_STORE_PATH = "data/features/feature_store.arrow"
+MARKET_PROTOCOLS = [
+    "curve_dao",
+    "aave",
+    "tether",
+    "uniswap",
+    "maker",
+    "yearn_finance",
+    "usdc",
+    "dai",
+    "balancer",
+    "harvest_finance",
+    "nftfi",
+]
+EXPOSURE_CHUNK_ROWS = 1_000_000  # Users per matrix product, bounds the copy of their counts
+EXPOSURE_METRICS = {  # Market statistics of each exposure, summed when there are several
+    "total_volume_exposure": "avg_volume",
+    "total_volatility_exposure": "std_close_price",
+    "total_gas_exposure": "avg_gas_used",
+    "total_error_exposure": "avg_error_rate",
+    "total_liquidity_exposure": "avg_total_value_eth",
+    "total_activity_exposure": "avg_nb_tx",
+    "total_user_adoption_exposure": [
+        "avg_nb_unique_receivers",
+        "avg_nb_unique_senders",
+    ],
+    "total_gas_volatility_exposure": "std_gas_used",
+    "total_error_volatility_exposure": "std_value_eth",
+    "total_high_value_exposure": "max_value_eth",
+}
 
 
 def load_data(path) -> pd.DataFrame:
@@ -8,6 +54,18 @@ def load_data(path) -> pd.DataFrame:
     return pd.read_parquet(path, engine="pyarrow")
 
 
+def transactions_dataset(path) -> ds.Dataset:
+    """Open the protocol/month partitioned transactions dataset, or a single parquet file."""
+    if not os.path.exists(path) and os.path.exists(f"{path}.parquet"):
+        path = f"{path}.parquet"
+    return ds.dataset(path, format="parquet", partitioning="hive")
+
+
+def load_transactions(path, columns=None, filter=None) -> pd.DataFrame:
+    """Load transactions from the protocol/month partitioned dataset (or a single parquet file), reading only the needed columns and partitions."""
+    return transactions_dataset(path).to_table(columns=columns, filter=filter).to_pandas()
+
+
 def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
     """Normalize column names to snake_case and remove parentheses."""
     df.columns = (
@@ -65,20 +123,21 @@ def aggregate_users(df: pd.DataFrame) -> pd.DataFrame:
     )
 
 
-def aggregation_metrics(df, total_days, group_col, prefix):
-    """Aggregation metrics calculation for transaction"""
+def aggregation_metrics(df, total_days, group_col, prefix, median_error=None, report_sample=None):
+    """Aggregation metrics calculation for transaction, with sketched medians if `median_error` is set, and their error reported on `report_sample` groups"""
+    median = "median" if median_error is None else "count"  # Placeholder replaced by the sketches
+    grouped = df.groupby(group_col)
     agg_df = (
-        df.groupby(group_col)
-        .agg(
+        grouped.agg(
             **{
                 f"min_{prefix}_eth": ("value_eth", "min"),
                 f"avg_{prefix}_eth": ("value_eth", "mean"),
-                f"med_{prefix}_eth": ("value_eth", "median"),
+                f"med_{prefix}_eth": ("value_eth", median),
                 f"max_{prefix}_eth": ("value_eth", "max"),
                 f"std_{prefix}_eth": ("value_eth", "std"),
                 f"min_{prefix}_gas": ("gas_used", "min"),
                 f"avg_{prefix}_gas": ("gas_used", "mean"),
-                f"med_{prefix}_gas": ("gas_used", "median"),
+                f"med_{prefix}_gas": ("gas_used", median),
                 f"max_{prefix}_gas": ("gas_used", "max"),
                 f"std_{prefix}_gas": ("gas_used", "std"),
                 f"date_nunique_{prefix}": ("date", "nunique"),
@@ -87,6 +146,16 @@ def aggregation_metrics(df, total_days, group_col, prefix):
         )
         .reset_index()
     )
+    if median_error is not None:
+        groups = grouped.ngroup().to_numpy()  # Rows of `agg_df`, -1 without group
+        for unit, column in [("eth", "value_eth"), ("gas", "gas_used")]:
+            values = df[column].to_numpy(np.float64, na_value=np.nan)
+            medians = GroupedQuantileSketch(median_error).update(groups, values).median(len(agg_df))
+            agg_df[f"med_{prefix}_{unit}"] = medians
+            if report_sample:
+                report_median_error(
+                    groups[None], values, medians, f"med_{prefix}_{unit}", median_error, report_sample
+                )
     hour_counts = df.groupby([group_col, "hour"]).size().reset_index(name="count")
     peak = hour_counts.loc[hour_counts.groupby(group_col)["count"].idxmax()]
     peak = peak.rename(
@@ -99,10 +168,215 @@ def aggregation_metrics(df, total_days, group_col, prefix):
     return agg_df
 
 
+def group_statistics(
+    groups: np.ndarray, values: np.ndarray, n_groups: int, median_error: float = None
+) -> dict:
+    """
+    Per-group min, mean, median, max and sample std ignoring NaN, for values grouped by each row of
+    `groups` (-1 for no group), from one sort of the (group, value) pairs into contiguous slices.
+    With `median_error`, rows are only sorted by group and medians come from quantile sketches.
+    """
+    if median_error is not None:  # Rows only need grouping, the sketches give the medians
+        statistics = moments_statistics(group_moments(groups, values, n_groups))
+        statistics["median"] = GroupedQuantileSketch(median_error).update(groups, values).median(n_groups)
+        return statistics
+
+    n = len(values)
+    order = np.argsort(values)  # NaN last
+    valid = ~np.isnan(values[order])
+    keys = np.concatenate(  # (group, rank of the value) packed in one sortable integer
+        [
+            (grouping[order] * n + np.arange(n))[valid & (grouping[order] >= 0)]
+            for grouping in groups
+        ]
+    )
+    keys.sort()
+    counts = np.bincount(keys // n, minlength=n_groups)
+    grouped = values[order][keys % n]
+    del keys, order
+
+    statistics = {name: np.full(n_groups, np.nan) for name in ["min", "mean", "median", "max", "std"]}
+    filled = counts > 0
+    if not filled.any():
+        return statistics
+    starts = (np.cumsum(counts) - counts)[filled]
+    sizes = counts[filled]
+    means = np.add.reduceat(grouped, starts) / sizes
+    squares = np.add.reduceat((grouped - np.repeat(means, sizes)) ** 2, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistics["std"][filled] = np.where(sizes > 1, np.sqrt(squares / (sizes - 1)), np.nan)
+    statistics["mean"][filled] = means
+    statistics["min"][filled] = grouped[starts]  # Slices are sorted by value
+    statistics["median"][filled] = (grouped[starts + (sizes - 1) // 2] + grouped[starts + sizes // 2]) / 2
+    statistics["max"][filled] = grouped[starts + sizes - 1]
+    return statistics
+
+
+def report_median_error(
+    groups: np.ndarray,
+    values: np.ndarray,
+    medians: np.ndarray,
+    feature: str,
+    median_error: float,
+    report_sample: int = MEDIAN_ERROR_SAMPLE,
+) -> dict:
+    """Print and return the relative error of sketched medians against exact ones, on a seeded sample of `report_sample` groups."""
+    filled = np.flatnonzero(~np.isnan(medians))
+    sample = np.random.default_rng(42).choice(filled, min(report_sample, len(filled)), replace=False)
+    sampled = np.zeros(len(medians) + 1, dtype=bool)  # The last one for the -1 groups
+    sampled[sample] = True
+    in_sample = sampled[groups]
+    rows = in_sample.any(axis=0)
+    exact = group_statistics(
+        np.where(in_sample[:, rows], groups[:, rows], -1), values[rows], len(medians)
+    )["median"][sample]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        errors = np.where(exact == 0, np.abs(medians[sample]), np.abs(medians[sample] - exact) / np.abs(exact))
+    report = {
+        "max": float(errors.max()) if len(errors) else 0.0,
+        "mean": float(errors.mean()) if len(errors) else 0.0,
+        "groups": len(sample),
+    }
+    print(
+        f"- {feature}: max relative error {report['max']:.3%}, mean {report['mean']:.3%} "
+        f"(bound {median_error:.3%}) on {report['groups']} groups"
+    )
+    return report
+
+
+def aggregate_transactions_arrow(
+    users: pd.DataFrame, transactions: pd.DataFrame, median_error: float = None, report_sample: int = None
+) -> pd.DataFrame:
+    """Arrow engine of `aggregate_transactions`: sent and received metrics in one pass over dictionary-encoded addresses, with a multi-threaded Arrow group-by for distinct days and efficiency."""
+    if transactions.empty:
+        return users
+
+    timestamp = pd.to_datetime(transactions["timestamp"])
+    if timestamp.dt.tz is not None:
+        timestamp = timestamp.dt.tz_localize(None)  # Wall-clock dates and hours, as `.dt.date`
+    total_days = (timestamp.max() - timestamp.min()).days or 1
+    has_time = timestamp.notna().to_numpy()
+    ticks = timestamp.to_numpy("datetime64[ns]").view(np.int64)
+    day = np.where(has_time, ticks // 86_400_000_000_000, 0)
+    hour = np.where(has_time, ticks // 3_600_000_000_000 % 24, 0)
+    value = transactions["value_eth"].to_numpy(np.float64, na_value=np.nan)
+    gas = transactions["gas_used"].to_numpy(np.float64, na_value=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        efficiency = value / gas
+
+    n = len(transactions)
+    addresses = (
+        pa.table(
+            {
+                "address": pa.chunked_array(
+                    [
+                        pa.array(transactions["from"], from_pandas=True).dictionary_encode(),
+                        pa.array(transactions["to"], from_pandas=True).dictionary_encode(),
+                    ]
+                )
+            }
+        )
+        .unify_dictionaries()["address"]  # One vocabulary without copying the strings of both columns
+    )
+    dictionary = addresses.chunk(0).dictionary
+    n_groups = 2 * len(dictionary)
+    groups = np.empty((2, n), dtype=np.int64)  # Senders, receivers
+    for side, chunk in enumerate(addresses.chunks):
+        key = pc.fill_null(chunk.indices, -1).to_numpy().astype(np.int64)
+        groups[side] = np.where(key >= 0, 2 * key + side, -1)
+    del addresses, key
+
+    present = np.zeros(n_groups, dtype=bool)
+    metrics = {name: np.full(n_groups, np.nan) for name in ["days", "efficiency"]}
+    day = pa.array(day, mask=~has_time)
+    efficiency = pa.array(efficiency, from_pandas=True)
+    for side in range(2):  # One side at a time bounds the hash tables of the group-by
+        grouped = (
+            pa.table(
+                {
+                    "group": pa.array(groups[side], mask=groups[side] < 0),
+                    "day": day,
+                    "efficiency": efficiency,
+                }
+            )
+            .group_by("group", use_threads=True)
+            .aggregate([("day", "count_distinct"), ("efficiency", "mean")])
+            .filter(pc.is_valid(pc.field("group")))
+        )
+        rows = grouped["group"].to_numpy()
+        present[rows] = True
+        metrics["days"][rows] = grouped["day_count_distinct"].to_numpy()
+        metrics["efficiency"][rows] = grouped["efficiency_mean"].to_numpy(zero_copy_only=False)
+    del day, efficiency, grouped
+    for unit, values in [("eth", value), ("gas", gas)]:
+        statistics = group_statistics(groups, values, n_groups, median_error)
+        if median_error is not None and report_sample:
+            for side, prefix in [(0, "sent"), (1, "received")]:
+                side_medians = np.where(np.arange(n_groups) % 2 == side, statistics["median"], np.nan)
+                report_median_error(
+                    groups[side : side + 1],
+                    values,
+                    side_medians,
+                    f"med_{prefix}_{unit}",
+                    median_error,
+                    report_sample,
+                )
+        metrics[f"min_{unit}"] = statistics["min"]
+        metrics[f"avg_{unit}"] = statistics["mean"]
+        metrics[f"med_{unit}"] = statistics["median"]
+        metrics[f"max_{unit}"] = statistics["max"]
+        metrics[f"std_{unit}"] = statistics["std"]
+
+    # Most frequent hour per group, from sparse (group, hour) counts: no dense (groups, 24) histogram
+    hours = GroupedCounts(24).add(np.where(has_time, groups, -1), hour)
+    peak_hour, peak_count = hours.mode(n_groups)
+    del groups
+
+    vocabulary = pd.Index(dictionary.to_pandas())
+    merged_df = users.reset_index(drop=True)
+    position = vocabulary.get_indexer(merged_df["address"])
+    for side, group_col, prefix in [(0, "from", "sent"), (1, "to", "received")]:
+        rows = np.where(position >= 0, 2 * position + side, 0)
+        found = (position >= 0) & present[rows]
+
+        def take(values):
+            return np.where(found, values[rows], np.nan)
+
+        side_df = {
+            group_col: merged_df["address"].where(found),
+            f"min_{prefix}_eth": take(metrics["min_eth"]),
+            f"avg_{prefix}_eth": take(metrics["avg_eth"]),
+            f"med_{prefix}_eth": take(metrics["med_eth"]),
+            f"max_{prefix}_eth": take(metrics["max_eth"]),
+            f"std_{prefix}_eth": take(metrics["std_eth"]),
+            f"min_{prefix}_gas": take(metrics["min_gas"]),
+            f"avg_{prefix}_gas": take(metrics["avg_gas"]),
+            f"med_{prefix}_gas": take(metrics["med_gas"]),
+            f"max_{prefix}_gas": take(metrics["max_gas"]),
+            f"std_{prefix}_gas": take(metrics["std_gas"]),
+            f"avg_gas_efficiency_{prefix}": take(metrics["efficiency"]),
+            f"peak_hour_{prefix}": take(peak_hour.astype(np.float64)),
+            f"peak_count_{prefix}": take(peak_count.astype(np.float64)),
+            f"tx_frequency_{prefix}": take(metrics["days"]) / total_days,
+        }
+        if found.all():  # No missing row, keep the integer dtypes of the pandas engine
+            side_df[f"peak_hour_{prefix}"] = side_df[f"peak_hour_{prefix}"].astype(np.int32)
+            side_df[f"peak_count_{prefix}"] = side_df[f"peak_count_{prefix}"].astype(np.int64)
+        merged_df = pd.concat([merged_df, pd.DataFrame(side_df)], axis=1)
+    return merged_df
+
+
 def aggregate_transactions(
-    users: pd.DataFrame, transactions: pd.DataFrame
+    users: pd.DataFrame,
+    transactions: pd.DataFrame,
+    engine: str = "arrow",
+    median_error: float = None,
+    report_sample: int = None,
 ) -> pd.DataFrame:
-    """Aggregate and enrich users with transactions metrics."""
+    """Aggregate and enrich users with transactions metrics, with the `arrow` or `pandas` engine. Medians are exact unless a relative `median_error` is given; `report_sample` then prints their error on that many sampled groups."""
+    if engine == "arrow":
+        return aggregate_transactions_arrow(users, transactions, median_error, report_sample)
+
     if transactions.empty:
         return users  # Make sure to return the users DataFrame if no transactions are available
 
@@ -120,10 +394,10 @@ def aggregate_transactions(
     total_days = (max_ts - min_ts).days or 1  # Avoid division by zero
 
     tx_sent_agg = aggregation_metrics(
-        transactions, total_days, "from", "sent"
+        transactions, total_days, "from", "sent", median_error, report_sample
     )  # Calculate metrics for sent transactions
     tx_received_agg = aggregation_metrics(
-        transactions, total_days, "to", "received"
+        transactions, total_days, "to", "received", median_error, report_sample
     )  # Calculate metrics for received transactions
 
     merged_df = (  # Merge aggregated data with users
@@ -134,8 +408,26 @@ def aggregate_transactions(
     return merged_df
 
 
-def aggregate_market(merged_df: pd.DataFrame, market: pd.DataFrame) -> pd.DataFrame:
-    """Aggregate and enrich users with market metrics"""
+def median_mode(median_error: float = None) -> str:
+    """Median mode recorded in the metadata of the features file: exact, or sketched with a relative error."""
+    return "exact" if median_error is None else f"sketch:{median_error:g}"
+
+
+def exposure_matrix(market_protocol_stats: pd.DataFrame, dtype=np.float64) -> tuple:
+    """Protocols with market statistics and their protocols x exposure metrics matrix of statistics."""
+    stats = market_protocol_stats.set_index("protocol_name")
+    protocols = [protocol for protocol in MARKET_PROTOCOLS if protocol in stats.index]
+    matrix = np.column_stack(
+        [
+            stats.loc[protocols, cols if isinstance(cols, list) else [cols]].sum(axis=1, skipna=False)
+            for cols in EXPOSURE_METRICS.values()
+        ]
+    )
+    return protocols, matrix.astype(dtype).reshape(len(protocols), len(EXPOSURE_METRICS))
+
+
+def market_statistics(market: pd.DataFrame) -> pd.DataFrame:
+    """Market statistics of each protocol, with cleaned protocol names"""
     market["protocol_name"] = (
         market["protocol_name"]
         .str.strip()
@@ -181,67 +473,36 @@ def aggregate_market(merged_df: pd.DataFrame, market: pd.DataFrame) -> pd.DataFr
         "std_value_eth",
         "max_value_eth",
     ]
+    return market_protocol_stats
+
+
+def aggregate_market(merged_df: pd.DataFrame, market: pd.DataFrame, dtype=np.float64) -> pd.DataFrame:
+    """Aggregate and enrich users with market metrics, computed as `dtype` (float32 halves the memory)"""
+    market_protocol_stats = market_statistics(market)
+    protocols, stats = exposure_matrix(market_protocol_stats, dtype)
+    counts = merged_df[[f"{protocol}_count" for protocol in protocols]]
+    exposures = np.empty((len(merged_df), len(EXPOSURE_METRICS)), dtype=dtype)
+    for start in range(0, len(merged_df), EXPOSURE_CHUNK_ROWS):  # Users x protocols times protocols x metrics
+        rows = slice(start, start + EXPOSURE_CHUNK_ROWS)
+        np.matmul(counts.iloc[rows].to_numpy(dtype=dtype), stats, out=exposures[rows])
+    exposures = pd.DataFrame(
+        exposures, columns=list(EXPOSURE_METRICS), index=merged_df.index, copy=False
+    )
 
-    protocols = [
-        "curve_dao",
-        "aave",
-        "tether",
-        "uniswap",
-        "maker",
-        "yearn_finance",
-        "usdc",
-        "dai",
-        "balancer",
-        "harvest_finance",
-        "nftfi",
-    ]
-
-    exposure_metrics = {
-        "total_volume_exposure": "avg_volume",
-        "total_volatility_exposure": "std_close_price",
-        "total_gas_exposure": "avg_gas_used",
-        "total_error_exposure": "avg_error_rate",
-        "total_liquidity_exposure": "avg_total_value_eth",
-        "total_activity_exposure": "avg_nb_tx",
-        "total_user_adoption_exposure": [
-            "avg_nb_unique_receivers",
-            "avg_nb_unique_senders",
-        ],
-        "total_gas_volatility_exposure": "std_gas_used",
-        "total_error_volatility_exposure": "std_value_eth",
-        "total_high_value_exposure": "max_value_eth",
-    }
-
-    for metric in exposure_metrics.keys():
-        merged_df[metric] = 0.0
-
-    for protocol in protocols:
-        count_col = f"{protocol}_count"
-        stats = market_protocol_stats[
-            market_protocol_stats["protocol_name"] == protocol
-        ]
-
-        if not stats.empty:
-            for metric, market_col in exposure_metrics.items():
-                if isinstance(market_col, list):
-                    merged_df[metric] += merged_df[count_col] * sum(
-                        stats[col].values[0] for col in market_col
-                    )
-                else:
-                    merged_df[metric] += (
-                        merged_df[count_col] * stats[market_col].values[0]
-                    )
-
-    return merged_df
+    return pd.concat(
+        [merged_df.drop(columns=list(EXPOSURE_METRICS), errors="ignore"), exposures], axis=1
+    )
 
 
-def implement_features() -> None:
-    """Main processing pipeline for feature engineering and data splitting."""
+def implement_features(median_error: float = None, report_sample: int = None) -> None:
+    """Main processing pipeline for feature engineering and data splitting; medians are exact unless a relative `median_error` is explicitly given, with their error reported on `report_sample` groups."""
     print("\n ====== Implementing features ====== \n")
 
     print("1. Loading data\n----------------------------------------")
     users = load_data(path="data/processed/users_processed.parquet")
-    transactions = load_data(path="data/raw/transactions.parquet")
+    transactions = load_transactions(
+        path="data/raw/transactions", columns=TRANSACTIONS_COLUMNS
+    )
     market = load_data(path="data/raw/market.parquet")
     print("Data loaded successfully\n")
 
@@ -252,7 +513,9 @@ def implement_features() -> None:
 
     print("3. Processing transactions\n----------------------------------------")
     transactions = clean_column_names(transactions)
-    merged_df = aggregate_transactions(users, transactions)
+    merged_df = aggregate_transactions(
+        users, transactions, median_error=median_error, report_sample=report_sample
+    )
     print("Transactions processed successfully\n")
 
     print("4. Processing market\n----------------------------------------")
@@ -261,12 +524,77 @@ def implement_features() -> None:
     print("Market processed successfully\n")
 
     print("5. Cleaning data\n----------------------------------------")
-    merged_df.drop(columns=["from", "to", "transactions"], inplace=True)
-    merged_df = merged_df.map(lambda x: pd.NA if x is None else x)
-    merged_df = merged_df.fillna(0)
+    merged_df = clean_features(merged_df)
     print("Data cleaned successfully\n")
 
     print("6. Saving data\n----------------------------------------")
-    table = pa.Table.from_pandas(merged_df)
-    feather.write_feather(table, "data/features/features.arrow")
+    write_feature_matrix(merged_df, FEATURES_PATH, median_mode=median_mode(median_error))
     print("Data saved successfully\n")
+
+
+def clean_features(merged_df: pd.DataFrame) -> pd.DataFrame:
+    """Drop the join columns and fill missing features with 0."""
+    merged_df = merged_df.drop(columns=["from", "to", "transactions"], errors="ignore")
+    merged_df = merged_df.map(lambda x: pd.NA if x is None else x)
+    return merged_df.fillna(0)
+
+
+def build_feature_store(
+    path="data/raw/transactions",
+    store_path=FEATURE_STORE_PATH,
+    median_error: float = 0.01,
+    batch_size: int = 1_000_000,
+) -> FeatureStore:
+    """Fold the whole transactions history into a new feature store, one record batch at a time."""
+    print("\n ====== Building the feature store ====== \n")
+    store = FeatureStore(median_error)
+    batches = transactions_dataset(path).to_batches(columns=TRANSACTIONS_COLUMNS, batch_size=batch_size)
+    for batch in batches:
+        store.fold(clean_column_names(batch.to_pandas()))
+    store.save(store_path)
+    print(f"{len(store.addresses)} addresses saved to {store_path}\n")
+    return store
+
+
+def update_features(delta_path, store_path=FEATURE_STORE_PATH) -> None:
+    """
+    Fold a delta of new transactions into the feature store and rewrite the features. The transactions
+    features of every address are derived from the store, so all the medians of the file come from the
+    same sketches rather than exact ones for the untouched addresses and sketched ones for the others.
+    """
+    print("\n ====== Updating features ====== \n")
+
+    print("1. Loading data\n----------------------------------------")
+    store = FeatureStore.load(store_path)
+    delta = load_transactions(path=delta_path, columns=TRANSACTIONS_COLUMNS)
+    users = load_data(path="data/processed/users_processed.parquet")
+    market = load_data(path="data/raw/market.parquet")
+    print("Data loaded successfully\n")
+
+    print("2. Folding transactions\n----------------------------------------")
+    affected = store.fold(clean_column_names(delta))
+    store.save(store_path)
+    print(f"{len(delta)} transactions folded, {len(affected)} addresses affected\n")
+
+    print("3. Processing users\n----------------------------------------")
+    users = clean_column_names(users)
+    users = aggregate_users(users).reset_index(drop=True)
+    print("Users processed successfully\n")
+
+    print("4. Processing transactions\n----------------------------------------")
+    transactions = store.features(users["address"])[TRANSACTION_FEATURES]
+    merged_df = pd.concat([users, transactions], axis=1)
+    print(f"Transactions features of {len(users)} addresses derived from the store\n")
+
+    print("5. Processing market\n----------------------------------------")
+    market = clean_column_names(market)
+    merged_df = aggregate_market(merged_df, market)
+    print("Market processed successfully\n")
+
+    print("6. Cleaning data\n----------------------------------------")
+    merged_df = clean_features(merged_df)
+    print("Data cleaned successfully\n")
+
+    print("7. Saving data\n----------------------------------------")
+    write_feature_matrix(merged_df, FEATURES_PATH, median_mode=median_mode(store.median_error))
+    print(f"Data saved successfully, medians {median_mode(store.median_error)}\n")
@@ -0,0 +1,157 @@
+import numpy as np
+from scipy.stats import chi2
+
+
+class Moments:
+    """
+    Count, mean and central moments up to the fourth of a column, updated chunk by chunk. Moments of
+    different chunks or processes merge with the pairwise formulas of Chan and Pébay, so the result does
+    not depend on how the column was split. NaN values are counted as missing and skipped.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sums of the powers of the deviations from the mean
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.minimum = np.inf
+        self.missing = 0
+
+    @classmethod
+    def of(cls, values: np.ndarray) -> "Moments":
+        """Moments of one chunk of values, computed in float64."""
+        moments = cls()
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        moments.missing = int(missing.sum())
+        if moments.missing:
+            values = values[~missing]
+        moments.n = len(values)
+        if moments.n:
+            with np.errstate(invalid="ignore"):  # Infinite values give NaN moments, as with scipy
+                moments.mean = values.mean()
+                deviations = values - moments.mean
+                squares = deviations * deviations
+                moments.m2 = squares.sum()
+                moments.m3 = (squares * deviations).sum()
+                moments.m4 = (squares * squares).sum()
+            moments.minimum = values.min()
+        return moments
+
+    def merge(self, other: "Moments") -> "Moments":
+        """Adds the moments of other values, in place."""
+        n_a, n_b = self.n, other.n
+        if n_b:
+            n = n_a + n_b
+            with np.errstate(invalid="ignore"):
+                delta = other.mean - self.mean
+                self.m4 += (
+                    other.m4
+                    + delta**4 * n_a * n_b * (n_a * n_a - n_a * n_b + n_b * n_b) / n**3
+                    + 6 * delta**2 * (n_a * n_a * other.m2 + n_b * n_b * self.m2) / n**2
+                    + 4 * delta * (n_a * other.m3 - n_b * self.m3) / n
+                )
+                self.m3 += (
+                    other.m3
+                    + delta**3 * n_a * n_b * (n_a - n_b) / n**2
+                    + 3 * delta * (n_a * other.m2 - n_b * self.m2) / n
+                )
+                self.m2 += other.m2 + delta**2 * n_a * n_b / n
+                self.mean += delta * n_b / n
+            self.n = n
+            self.minimum = min(self.minimum, other.minimum)
+        self.missing += other.missing
+        return self
+
+    def update(self, values: np.ndarray) -> "Moments":
+        """Adds a chunk of values."""
+        return self.merge(Moments.of(values))
+
+    def _constant(self) -> bool:
+        """Whether the variance is zero up to rounding, where scipy gives NaN skewness and kurtosis."""
+        return self.m2 / self.n <= (np.finfo(np.float64).eps * self.mean) ** 2
+
+    def skewness(self) -> float:
+        """Biased sample skewness, as `scipy.stats.skew`."""
+        if self.n == 0 or self._constant():
+            return np.nan
+        return np.sqrt(self.n) * self.m3 / self.m2**1.5
+
+    def kurtosis(self, fisher: bool = True) -> float:
+        """Biased sample kurtosis, as `scipy.stats.kurtosis`: excess kurtosis if `fisher`, else Pearson's."""
+        if self.n == 0 or self._constant():
+            return np.nan
+        return self.n * self.m4 / self.m2**2 - (3 if fisher else 0)
+
+    def normaltest(self) -> float:
+        """p-value of D'Agostino and Pearson's test, as `scipy.stats.normaltest` on the same values."""
+        n = float(self.n) if self.n >= 8 else np.nan
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Skewness test
+            y = self.skewness() * np.sqrt((n + 1) * (n + 3) / (6.0 * (n - 2)))
+            beta2 = 3.0 * (n**2 + 27 * n - 70) * (n + 1) * (n + 3) / ((n - 2.0) * (n + 5) * (n + 7) * (n + 9))
+            w2 = -1 + np.sqrt(2 * (beta2 - 1))
+            delta = 1 / np.sqrt(0.5 * np.log(w2))
+            alpha = np.sqrt(2.0 / (w2 - 1))
+            y = 1.0 if y == 0 else y
+            z_skew = delta * np.log(y / alpha + np.sqrt((y / alpha) ** 2 + 1))
+
+            # Kurtosis test
+            expected = 3.0 * (n - 1) / (n + 1)
+            variance = 24.0 * n * (n - 2) * (n - 3) / ((n + 1) * (n + 1.0) * (n + 3) * (n + 5))
+            x = (self.kurtosis(fisher=False) - expected) / variance**0.5
+            sqrt_beta1 = (
+                6.0 * (n * n - 5 * n + 2) / ((n + 7) * (n + 9)) * (6.0 * (n + 3) * (n + 5) / (n * (n - 2) * (n - 3))) ** 0.5
+            )
+            a = 6.0 + 8.0 / sqrt_beta1 * (2.0 / sqrt_beta1 + (1 + 4.0 / sqrt_beta1**2) ** 0.5)
+            denominator = 1 + x * (2 / (a - 4.0)) ** 0.5
+            term2 = np.nan if denominator == 0 else np.sign(denominator) * ((1 - 2.0 / a) / abs(denominator)) ** (1 / 3)
+            z_kurt = (1 - 2 / (9.0 * a) - term2) / (2 / (9.0 * a)) ** 0.5
+
+        if np.isnan(z_skew) or np.isnan(z_kurt):
+            return np.nan
+        return chi2.sf(z_skew**2 + z_kurt**2, 2)
+
+
+class Reservoir:
+    """
+    Uniform sample without replacement of at most `size` non-NaN values of a column, updated chunk by
+    chunk: every value gets a random key and the sample keeps the values of the `size` smallest keys.
+    Reservoirs of different chunks or processes merge by keeping the smallest keys of both.
+    """
+
+    def __init__(self, size: int, random_state: int = None):
+        if size < 1:
+            raise ValueError(f"size must be positive, got {size}")
+        self.size = size
+        self.rng = np.random.default_rng(random_state)
+        self.keys = np.empty(0, dtype=np.float64)
+        self.values = np.empty(0, dtype=np.float64)
+
+    def _keep_smallest(self, keys: np.ndarray, values: np.ndarray) -> "Reservoir":
+        """Adds keyed values, keeping the `size` smallest keys; values above a full sample's largest key are skipped."""
+        if len(self.keys) == self.size:
+            kept = keys < self.keys.max()
+            keys, values = keys[kept], values[kept]
+        keys = np.concatenate([self.keys, keys])
+        values = np.concatenate([self.values, np.asarray(values, dtype=np.float64)])
+        if len(keys) > self.size:
+            smallest = np.argpartition(keys, self.size - 1)[: self.size]
+            keys, values = keys[smallest], values[smallest]
+        self.keys, self.values = keys, values
+        return self
+
+    def update(self, values: np.ndarray) -> "Reservoir":
+        """Offers a chunk of values to the sample."""
+        values = values[~np.isnan(values)]
+        return self._keep_smallest(self.rng.random(len(values)), values)
+
+    def merge(self, other: "Reservoir") -> "Reservoir":
+        """Adds the sample of an instance of the same size, in place."""
+        if other.size != self.size:
+            raise ValueError("Only reservoirs of the same size can be merged")
+        return self._keep_smallest(other.keys, other.values)
+
+    def sample(self) -> np.ndarray:
+        return self.values
@@ -0,0 +1,167 @@
+import copy
+
+import numpy as np
+
+
+class GroupedCounts:
+    """
+    Counts of (group, bucket) pairs for many groups at once, stored as sorted sparse keys
+    `group * width + bucket`. Counts of the same groups built on different partitions or processes
+    merge by adding, so the result does not depend on how the data was split.
+    """
+
+    def __init__(self, width: int):
+        self.width = width
+        self.keys = np.empty(0, dtype=np.int64)  # group * width + bucket, sorted and unique
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def _parameters(self) -> tuple:
+        """Parameters two instances must share to be merged."""
+        return (type(self), self.width)
+
+    def _merge_sorted(self, keys: np.ndarray, counts: np.ndarray) -> None:
+        """Adds counts of sorted unique keys: existing keys are incremented, new ones inserted in place."""
+        position = np.searchsorted(self.keys, keys)
+        existing = position < len(self.keys)
+        existing[existing] = self.keys[position[existing]] == keys[existing]
+        self.counts[position[existing]] += counts[existing]
+        self.keys = np.insert(self.keys, position[~existing], keys[~existing])
+        self.counts = np.insert(self.counts, position[~existing], counts[~existing])
+
+    def add_sorted_keys(self, keys: np.ndarray) -> "GroupedCounts":
+        """Adds one count per key, from valid keys already sorted."""
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]][: len(keys)])
+        self._merge_sorted(keys[starts], np.diff(np.r_[starts, len(keys)]))
+        return self
+
+    def add(self, groups: np.ndarray, buckets: np.ndarray) -> "GroupedCounts":
+        """Adds one count per (group, bucket) pair, for one or several rows of groups; negative groups are skipped."""
+        keys = (groups.astype(np.int64) * self.width + buckets)[groups >= 0]
+        keys.sort()
+        return self.add_sorted_keys(keys)
+
+    def merge(self, other: "GroupedCounts") -> "GroupedCounts":
+        """Adds the counts of an instance with the same parameters, in place."""
+        if other._parameters() != self._parameters():
+            raise ValueError("Only counts with the same parameters can be merged")
+        self._merge_sorted(other.keys, other.counts)
+        return self
+
+    def group_counts(self, n_groups: int) -> np.ndarray:
+        """Total count of each group."""
+        return np.bincount(self.keys // self.width, weights=self.counts, minlength=n_groups).astype(np.int64)
+
+    def group_sizes(self, n_groups: int) -> np.ndarray:
+        """Number of distinct buckets of each group."""
+        return np.bincount(self.keys // self.width, minlength=n_groups)
+
+    def mode(self, n_groups: int) -> tuple:
+        """Most frequent bucket of each group and its count, ties to the lowest bucket; 0 and 0 for empty groups."""
+        buckets = np.zeros(n_groups, dtype=np.int64)
+        counts = np.zeros(n_groups, dtype=np.int64)
+        if len(self.keys):
+            score = self.counts * self.width + self.width - 1 - self.keys % self.width
+            groups = self.keys // self.width
+            starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+            best = np.maximum.reduceat(score, starts)
+            buckets[groups[starts]] = self.width - 1 - best % self.width
+            counts[groups[starts]] = best // self.width
+        return buckets, counts
+
+    def select(self, groups: np.ndarray) -> "GroupedCounts":
+        """Copy of the counts of the given groups only, renumbered 0 to len(groups) - 1."""
+        starts = np.searchsorted(self.keys, groups.astype(np.int64) * self.width)
+        ends = np.searchsorted(self.keys, (groups.astype(np.int64) + 1) * self.width)
+        sizes = ends - starts
+        index = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        selected = copy.copy(self)
+        renumbered = np.repeat(np.arange(len(groups), dtype=np.int64), sizes)
+        selected.keys = renumbered * self.width + self.keys[index] % self.width
+        selected.counts = self.counts[index]
+        return selected
+
+    def offsets(self, n_groups: int) -> np.ndarray:
+        """Start of the keys of each group and the end of the last one, to split them in per-group lists."""
+        return np.searchsorted(self.keys, np.arange(n_groups + 1, dtype=np.int64) * self.width)
+
+    def set_lists(self, offsets: np.ndarray, buckets: np.ndarray, counts: np.ndarray) -> "GroupedCounts":
+        """Replaces the content by per-group lists of sorted buckets and their counts, split by `offsets`."""
+        groups = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+        self.keys = groups * self.width + buckets
+        self.counts = counts.astype(np.int64)
+        return self
+
+
+class GroupedQuantileSketch(GroupedCounts):
+    """
+    Relative-error quantile sketches (DDSketch) of many groups at once, as sparse (group, bucket)
+    counts. Every quantile estimate is within `relative_error` of the exact value of the same rank,
+    for magnitudes in [1 / max_magnitude, max_magnitude].
+    """
+
+    def __init__(self, relative_error: float = 0.01, max_magnitude: float = 1e20):
+        if not 0 < relative_error < 1:
+            raise ValueError(f"relative_error must be in (0, 1), got {relative_error}")
+        self.relative_error = relative_error
+        self.max_magnitude = max_magnitude
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self.max_index = int(np.ceil(np.log(max_magnitude) / np.log(self.gamma)))
+        super().__init__(4 * self.max_index + 3)  # Negative buckets, zero, positive buckets
+
+    def _parameters(self) -> tuple:
+        return (type(self), self.relative_error, self.max_magnitude)
+
+    def _buckets(self, values: np.ndarray) -> np.ndarray:
+        """Bucket of each value, in the order of the values: negative buckets mirror the positive ones around zero."""
+        with np.errstate(divide="ignore", invalid="ignore"):  # NaN values get an unused bucket
+            index = np.ceil(np.log(np.abs(values)) * (1 / np.log(self.gamma)))
+            np.clip(index, -self.max_index, self.max_index, out=index)
+            index += self.max_index + 1
+            index *= np.sign(values)
+            index += 2 * self.max_index + 1
+            return index.astype(np.int64)
+
+    def _values(self, buckets: np.ndarray) -> np.ndarray:
+        """Estimate of the values of each bucket, within the relative error of any value in it."""
+        zero = 2 * self.max_index + 1
+        index = np.where(buckets > zero, buckets - zero - 1 - self.max_index, self.max_index - buckets)
+        magnitude = 2 * self.gamma ** index.astype(np.float64) / (self.gamma + 1)
+        return np.where(buckets > zero, magnitude, np.where(buckets < zero, -magnitude, 0.0))
+
+    def bucket_keys(self, groups: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        (group, bucket) key of each value, -1 for NaN values and negative groups. Keys sort by group, then value.
+        `groups` can have several rows of groups for the same values, whose buckets are computed once.
+        """
+        valid = (groups >= 0) & ~np.isnan(values)
+        return np.where(valid, groups.astype(np.int64) * self.width + self._buckets(values), -1)
+
+    def update(self, groups: np.ndarray, values: np.ndarray) -> "GroupedQuantileSketch":
+        """Adds values to the sketches of their groups (one or several rows); NaN values and negative groups are skipped."""
+        keys = self.bucket_keys(groups, values)
+        keys = keys[keys >= 0]
+        keys.sort()
+        return self.add_sorted_keys(keys)
+
+    def rank_values(self, ranks: np.ndarray) -> np.ndarray:
+        """Estimate of the value of the given 0-based rank in each group (0 to n_groups - 1), NaN for groups without values."""
+        totals = self.group_counts(len(ranks))
+        filled = (totals > 0) & (ranks < totals)
+        cumulative = np.cumsum(self.counts)
+        offsets = np.cumsum(totals) - totals
+        position = np.searchsorted(cumulative, (offsets + ranks)[filled], side="right")
+        values = np.full(len(ranks), np.nan)
+        values[filled] = self._values(self.keys[position] % self.width)
+        return values
+
+    def quantile(self, q: float, n_groups: int) -> np.ndarray:
+        """Estimate of the lower `q` quantile of each group."""
+        totals = self.group_counts(n_groups)
+        return self.rank_values(np.floor(q * np.maximum(totals - 1, 0)).astype(np.int64))
+
+    def median(self, n_groups: int) -> np.ndarray:
+        """Estimate of the median of each group, averaging the two middle values of even groups as pandas does."""
+        totals = self.group_counts(n_groups)
+        lower = self.rank_values(np.maximum(totals - 1, 0) // 2)
+        upper = self.rank_values(totals // 2)
+        return (lower + upper) / 2
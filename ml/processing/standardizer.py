@@ -0,0 +1,151 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from scipy.special import boxcox as boxcox_transform
+from scipy.stats import boxcox_normmax
+
+CHUNK_ROWS = 65536  # Rows standardized at once
+METHODS = ["Z-score", "Min-Max", "Log", "Log Inverse", "Box-Cox", "None"]
+PARAMETERS = ["Standardization", "Location", "Scale", "Lambda"]
+
+
+def fit_column(values: np.ndarray, method: str) -> tuple:
+    """Location, scale and Box-Cox lambda of a column for its standardization method, from its non-NaN values."""
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.nan, np.nan, np.nan
+    if method == "Z-score":
+        with np.errstate(invalid="ignore"):  # Infinite values give NaN, as with pandas
+            return values.mean(), values.std(ddof=1), np.nan
+    if method == "Min-Max":
+        return values.min(), values.max() - values.min(), np.nan
+    if method == "Box-Cox":
+        location = values.min() - 1  # Shift the values to start at 1
+        shifted = values[np.isfinite(values)] - location
+        if len(shifted) < 2 or np.all(shifted == shifted[0]):
+            return location, 1.0, 1.0  # Constant column: a plain shift
+        return location, 1.0, boxcox_normmax(shifted, method="mle")
+    return 0.0, 1.0, np.nan
+
+
+class Standardizer:
+    """
+    Standardization fitted once and applied to any rows: the method of each column, from the analysis
+    of the distributions, with its fitted location, scale and Box-Cox lambda.
+    Every column of a block of rows is transformed at once, block by block.
+    """
+
+    def __init__(self, methods: dict):
+        unknown = set(methods.values()) - set(METHODS)
+        if unknown:
+            raise ValueError(f"Unknown standardization methods: {sorted(unknown)}")
+        self.params = pd.DataFrame(
+            {"Standardization": pd.Series(methods, dtype=object), "Location": 0.0, "Scale": 1.0, "Lambda": np.nan},
+            columns=PARAMETERS,
+        )
+        self.fitted = False
+
+    @classmethod
+    def from_csv(cls, csv_in: str) -> "Standardizer":
+        """Methods of the columns from the CSV of `analyze_df`."""
+        try:
+            std_info = pd.read_csv(csv_in)
+        except (FileNotFoundError, pd.errors.EmptyDataError) as e:
+            raise ValueError(f"Error loading standardization file: {e}") from e
+        return cls(dict(zip(std_info["Variable"], std_info["Standardization"].fillna("None"))))
+
+    @property
+    def columns(self) -> list:
+        return self.params.index.tolist()
+
+    def fit(self, df: pd.DataFrame) -> "Standardizer":
+        """Fit the parameters of the numeric columns of `df`; the other columns are dropped."""
+        if not isinstance(df, pd.DataFrame):
+            raise ValueError("Input is not a DataFrame.")
+        columns = [
+            col for col in self.columns if col in df.columns and pd.api.types.is_numeric_dtype(df[col])
+        ]
+        self.params = self.params.loc[columns].copy()
+        for col in columns:
+            method = self.params.at[col, "Standardization"]
+            self.params.loc[col, ["Location", "Scale", "Lambda"]] = fit_column(
+                df[col].to_numpy(dtype=np.float64, na_value=np.nan), method
+            )
+        self.fitted = True
+        return self
+
+    def _positions(self, *methods) -> np.ndarray:
+        return np.flatnonzero(self.params["Standardization"].isin(methods).to_numpy())
+
+    def transform_block(self, values: np.ndarray) -> np.ndarray:
+        """Standardize a float64 block of rows of the fitted columns, in place; Box-Cox values below the fitted minimum are clipped to it."""
+        location = self.params["Location"].to_numpy(dtype=np.float64)
+        scale = self.params["Scale"].to_numpy(dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            affine = self._positions("Z-score", "Min-Max")
+            values[:, affine] = (values[:, affine] - location[affine]) / scale[affine]
+            for method, sign in [("Log", 1.0), ("Log Inverse", -1.0)]:
+                log = self._positions(method)
+                values[:, log] = np.log1p(np.maximum(sign * values[:, log], 0))
+            boxcox = self._positions("Box-Cox")
+            values[:, boxcox] = boxcox_transform(  # Unseen rows below the fitted minimum would give NaN
+                np.maximum(values[:, boxcox] - location[boxcox], 1),
+                self.params["Lambda"].to_numpy(dtype=np.float64)[boxcox],
+            )
+        return values
+
+    def transform(self, df: pd.DataFrame, dtype=np.float64, chunk_rows: int = CHUNK_ROWS, workers: int = None) -> pd.DataFrame:
+        """Standardize the fitted columns of `df` as `dtype`, by chunks of rows in parallel threads; the other columns are kept."""
+        if not self.fitted:
+            raise ValueError("The standardizer must be fitted before transforming.")
+        columns = self.columns
+        values = df[columns]
+        result = np.empty((len(df), len(columns)), dtype=dtype)
+
+        def transform_chunk(start):
+            chunk = values.iloc[start : start + chunk_rows].to_numpy(dtype=np.float64, na_value=np.nan)
+            chunk = np.require(chunk, requirements="W")  # A single float64 block converts to a read-only view
+            result[start : start + chunk_rows] = self.transform_block(chunk)
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            list(executor.map(transform_chunk, range(0, len(df), chunk_rows)))
+
+        transformed = pd.DataFrame(result, columns=columns, index=df.index, copy=False)
+        df_transformed = pd.concat([df.drop(columns=columns), transformed], axis=1)
+        if df_transformed.columns.tolist() != df.columns.tolist():
+            df_transformed = df_transformed[df.columns]
+        return df_transformed
+
+    def transform_batches(self, batches, dtype=np.float32) -> Iterator[pa.RecordBatch]:
+        """Standardize a stream of Arrow record batches, e.g. the features of new addresses; the other columns pass through."""
+        if not self.fitted:
+            raise ValueError("The standardizer must be fitted before transforming.")
+        positions = {col: j for j, col in enumerate(self.columns)}
+        for batch in batches:
+            values = np.column_stack(
+                [batch.column(col).to_numpy(zero_copy_only=False).astype(np.float64) for col in self.columns]
+            ).reshape(batch.num_rows, len(self.columns))
+            values = self.transform_block(values).astype(dtype)
+            arrays = [
+                pa.array(values[:, positions[name]]) if name in positions else batch.column(name)
+                for name in batch.schema.names
+            ]
+            yield pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+    def save(self, path: str) -> None:
+        """Write the methods and fitted parameters as CSV."""
+        self.params.to_csv(path, index_label="Variable", encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str) -> "Standardizer":
+        """Read a standardizer written by `save`."""
+        params = pd.read_csv(path, index_col="Variable")
+        params["Standardization"] = params["Standardization"].fillna("None")  # Read as missing by pandas
+        standardizer = cls(params["Standardization"].to_dict())
+        standardizer.params = params[PARAMETERS]
+        standardizer.fitted = True
+        return standardizer
@@ -0,0 +1,149 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+
+FEATURES_DTYPE = np.float32
+CONTENT_HASH_KEY = b"content_hash"
+MEDIAN_MODE_KEY = b"median_mode"  # "exact", or the relative error of sketched medians
+ROW_BLOCK = 16384  # Rows copied at once from the column buffers
+
+
+def content_hash(table: pa.Table) -> str:
+    """BLAKE2 hash of the column names, types and buffers of a table."""
+    digest = hashlib.blake2b(digest_size=16)
+    for name, column in zip(table.column_names, table.columns):
+        digest.update(f"{name}:{column.type}".encode())
+        for chunk in column.chunks:
+            for buffer in chunk.buffers():
+                if buffer is not None:
+                    digest.update(buffer)
+            if pa.types.is_dictionary(chunk.type):
+                for buffer in chunk.dictionary.buffers():
+                    if buffer is not None:
+                        digest.update(buffer)
+    return digest.hexdigest()
+
+
+def feature_table(df: pd.DataFrame, dtype=FEATURES_DTYPE) -> pa.Table:
+    """Compact Arrow table of a features frame: `dtype` feature columns, and the addresses as a dictionary indexed by int32 row ids."""
+    addresses = pa.array(df["address"].astype(str).to_numpy(), pa.string())
+    columns = {"address": pc.dictionary_encode(addresses)}  # Unique addresses: the indices are the row ids
+    for col in df.columns.drop("address"):
+        columns[col] = pa.array(df[col].to_numpy(dtype=dtype, na_value=np.nan))
+    return pa.table(columns)
+
+
+def write_feature_matrix(df: pd.DataFrame, path, dtype=FEATURES_DTYPE, median_mode: str = None) -> None:
+    """
+    Write a features frame as an uncompressed Arrow IPC file of one record batch, which loads memory-mapped
+    without copies. The hash of the content, and how the medians were computed if given, are stored in the
+    schema metadata.
+    """
+    table = feature_table(df, dtype)
+    metadata = {CONTENT_HASH_KEY: content_hash(table)}
+    if median_mode is not None:
+        metadata[MEDIAN_MODE_KEY] = median_mode
+    table = table.replace_schema_metadata(metadata)
+    feather.write_feather(table, path, compression="uncompressed", chunksize=max(table.num_rows, 1))
+
+
+class FeatureMatrix:
+    """
+    Features of the users memory-mapped from an Arrow IPC file: one buffer per feature column and the
+    addresses as a dictionary. Rows are only copied when they are materialized, in the features dtype.
+    """
+
+    def __init__(self, table: pa.Table):
+        if any(column.num_chunks > 1 for column in table.columns):
+            table = table.combine_chunks()  # Files of the previous format have several record batches
+        self.table = table
+        self.columns = [name for name in table.column_names if name != "address"]
+        self._addresses = None
+
+    @classmethod
+    def load(cls, path) -> "FeatureMatrix":
+        """Memory-map a features file; files of the previous format (float64, compressed) are read in memory."""
+        return cls(feather.read_table(path, memory_map=True))
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    @property
+    def content_hash(self) -> str:
+        """Hash of the content, read from the metadata written with the file or computed for other files."""
+        metadata = self.table.schema.metadata or {}
+        if CONTENT_HASH_KEY not in metadata:
+            return content_hash(self.table)
+        return metadata[CONTENT_HASH_KEY].decode()
+
+    @property
+    def median_mode(self) -> str:
+        """How the median features were computed, as recorded with the file; None for files without it."""
+        metadata = self.table.schema.metadata or {}
+        return metadata[MEDIAN_MODE_KEY].decode() if MEDIAN_MODE_KEY in metadata else None
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Common dtype of the feature columns."""
+        return np.result_type(*[field.type.to_pandas_dtype() for field in self.table.select(self.columns).schema])
+
+    def _address_codes(self) -> tuple:
+        """Row ids into the address dictionary and the categorical dtype of the dictionary, built once."""
+        if self._addresses is None:
+            address = self.table["address"].combine_chunks()
+            if not pa.types.is_dictionary(address.type):
+                address = pc.dictionary_encode(address)
+            dtype = pd.CategoricalDtype(pd.Index(address.dictionary, dtype="str"))
+            self._addresses = (address.indices.to_numpy(zero_copy_only=False), dtype)
+        return self._addresses
+
+    def addresses(self, rows: np.ndarray = None) -> pd.Series:
+        """Addresses of the rows as a categorical: int32 row ids into the address dictionary."""
+        codes, dtype = self._address_codes()
+        addresses = pd.Categorical.from_codes(codes if rows is None else codes[rows], dtype=dtype)
+        return pd.Series(addresses, name="address")
+
+    def to_numpy(self, rows: np.ndarray = None, columns: list = None, fill_value: float = None) -> np.ndarray:
+        """Row-major copy of the features of the rows, from the mapped column buffers; NaN replaced by `fill_value` if set."""
+        columns = self.columns if columns is None else columns
+        n_rows = len(self) if rows is None else len(rows)
+        matrix = np.empty((n_rows, len(columns)), dtype=self.dtype)
+        if n_rows == 0:
+            return matrix
+        values = [  # Without nulls, views of the mapped buffers
+            self.table[col].chunk(0).to_numpy(zero_copy_only=False) for col in columns
+        ]
+        block = np.empty((len(columns), ROW_BLOCK), dtype=matrix.dtype)
+        for start in range(0, n_rows, ROW_BLOCK):  # Columns to rows one block at a time, in cache
+            size = min(ROW_BLOCK, n_rows - start)
+            for j, col_values in enumerate(values):
+                block[j, :size] = (
+                    col_values[start : start + size] if rows is None else col_values[rows[start : start + size]]
+                )
+            matrix[start : start + size] = block[:, :size].T
+        if fill_value is not None:
+            np.copyto(matrix, fill_value, where=np.isnan(matrix))
+        return matrix
+
+    def iter_batches(self, batch_rows: int, starts=None, columns: list = None, fill_value: float = None):
+        """
+        Consecutive blocks of `batch_rows` rows as (start, row-major array), copied one block at a time from
+        the mapped buffers; `starts` gives the blocks and their order, all of them in order by default.
+        """
+        starts = range(0, len(self), batch_rows) if starts is None else starts
+        for start in starts:
+            block = FeatureMatrix(self.table.slice(start, batch_rows))
+            yield start, block.to_numpy(columns=columns, fill_value=fill_value)
+
+    def address_slice(self, start: int, size: int) -> pa.Array:
+        """Addresses of consecutive rows as plain strings."""
+        return self.table["address"].slice(start, size).combine_chunks().cast(pa.string())
+
+    def to_frame(self, rows: np.ndarray = None, columns: list = None, fill_value: float = None) -> pd.DataFrame:
+        """Features of the rows as a frame of a single block, which scikit-learn reads without copying."""
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame(self.to_numpy(rows, columns, fill_value), columns=columns, copy=False)
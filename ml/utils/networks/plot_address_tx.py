@@ -6,6 +6,7 @@ import datashader as ds
 import datashader.transfer_functions as tf
 import networkx as nx
 import pandas as pd
+import pyarrow.dataset as pds
 from datashader.utils import export_image
 from datashader.bundling import connect_edges, hammer_bundle
 from datashader.layout import random_layout, circular_layout, forceatlas2_layout
@@ -27,7 +28,9 @@ print(f"\n--> device: {DEVICE} <--\n")
 # Data loading
 start = time.time()
 print("-- Data loading --")
-transactions = pd.read_parquet("data/raw/transactions.parquet", engine='pyarrow')       # Chargement des données
+transactions = pds.dataset("data/raw/transactions", format="parquet", partitioning="hive").to_table(
+    columns=["from", "to", "value (ETH)"]                                                    # Only the graph columns
+).to_pandas()                                                                               # Chargement des données
 transactions = transactions.sample(500000, random_state=42)
 time_taken(start, "Data loading")
 
@@ -0,0 +1,115 @@
+import copy
+import os
+
+import joblib
+import numpy as np
+from sklearn.decomposition import PCA, IncrementalPCA
+
+from ml.utils.feature_matrix import FeatureMatrix
+
+CACHE_DIR = "tmp/projections"
+BATCH_ROWS = 65536  # Rows of a batch of the covariance and incremental fits
+METHODS = ["covariance", "incremental", "randomized", "full"]
+
+
+def projection_path(features_hash: str, method: str, n_components: int = None, cache_dir: str = CACHE_DIR) -> str:
+    """Cache file of the projection fitted on the features of a hash."""
+    return os.path.join(cache_dir, f"pca_{features_hash}_{method}_{n_components or 'all'}.joblib")
+
+
+def covariance_projection(matrix: FeatureMatrix, n_components: int = None, batch_rows: int = BATCH_ROWS) -> PCA:
+    """
+    Exact PCA from the covariance of the features, accumulated in float64 batch by batch on the mapped file,
+    the rows shifted by the mean of the first batch against cancellation. Returns a fitted scikit-learn PCA.
+    """
+    n_features = len(matrix.columns)
+    n_rows, shift, total, scatter = 0, None, np.zeros(n_features), np.zeros((n_features, n_features))
+    for _, x in matrix.iter_batches(batch_rows, fill_value=0):
+        x = x.astype(np.float64)
+        shift = x.mean(axis=0) if shift is None else shift
+        x -= shift
+        n_rows += len(x)
+        total += x.sum(axis=0)
+        scatter += x.T @ x
+    offset = total / n_rows
+    variances, vectors = np.linalg.eigh((scatter - n_rows * np.outer(offset, offset)) / (n_rows - 1))
+    variances, vectors = np.maximum(variances[::-1], 0), vectors[:, ::-1]
+    vectors *= np.sign(vectors[np.argmax(np.abs(vectors), axis=0), np.arange(n_features)])  # Signs of svd_flip
+
+    n_components = n_components or n_features
+    pca = PCA(n_components, svd_solver="covariance_eigh")
+    pca.n_features_in_, pca.n_samples_, pca.n_components_ = n_features, n_rows, n_components
+    pca.mean_ = shift + offset
+    pca.components_ = vectors.T[:n_components]
+    pca.explained_variance_ = variances[:n_components]
+    pca.explained_variance_ratio_ = variances[:n_components] / variances.sum()
+    pca.singular_values_ = np.sqrt(variances[:n_components] * (n_rows - 1))
+    pca.noise_variance_ = variances[n_components:].mean() if n_components < n_features else 0.0
+    return pca
+
+
+def fit_projection(
+    matrix: FeatureMatrix, method: str = "covariance", n_components: int = None,
+    batch_rows: int = BATCH_ROWS, random_state: int = 42,
+):
+    """
+    PCA of the features of a matrix, missing values as 0, on `n_components` components (all of them if None).
+    - covariance: exact, one pass over the mapped file in batches, never the whole matrix in memory.
+    - incremental: IncrementalPCA fitted batch by batch on the mapped file, never the whole matrix in memory;
+      exact, up to rounding, when all the components are kept.
+    - randomized: randomized SVD of the matrix in memory, for a few components.
+    - full: exact SVD of the matrix in memory.
+    """
+    if method == "covariance":
+        pca = covariance_projection(matrix, n_components, batch_rows)
+    elif method == "incremental":
+        pca = IncrementalPCA(n_components=n_components or len(matrix.columns))
+        for _, x in matrix.iter_batches(batch_rows, fill_value=0):
+            if len(x) >= pca.n_components:  # A last batch smaller than the components is skipped
+                pca.partial_fit(x.astype(np.float64, copy=False))
+    elif method == "randomized":
+        if n_components is None:
+            raise ValueError("The randomized method needs a number of components")
+        pca = PCA(n_components, svd_solver="randomized", random_state=random_state).fit(matrix.to_numpy(fill_value=0))
+    elif method == "full":
+        pca = PCA(n_components, svd_solver="full").fit(matrix.to_numpy(fill_value=0).astype(np.float64, copy=False))
+    else:
+        raise ValueError(f"Unknown projection method {method}, expected one of {METHODS}")
+    pca.mean_ = pca.mean_.astype(matrix.dtype)  # Fitted in float64, applied in the dtype of the features
+    pca.components_ = pca.components_.astype(matrix.dtype)
+    return pca
+
+
+def truncate_projection(pca, n_components: int = None):
+    """Projection on the first `n_components` principal components of a fitted PCA, which are those of a smaller fit."""
+    if n_components is None or n_components >= pca.n_components_:
+        return pca
+    truncated = copy.copy(pca)
+    for name in ["components_", "explained_variance_", "explained_variance_ratio_", "singular_values_"]:
+        setattr(truncated, name, getattr(pca, name)[:n_components].copy())
+    truncated.n_components = truncated.n_components_ = n_components
+    return truncated
+
+
+def load_projection(
+    matrix: FeatureMatrix, n_components: int = None, method: str = "covariance",
+    cache_dir: str = CACHE_DIR, batch_rows: int = BATCH_ROWS, random_state: int = 42,
+):
+    """
+    Projection of the features of a matrix on `n_components` principal components, read from the cache of
+    the features hash or fitted and cached. Exact methods fit all the components once, so the fits on fewer
+    components of the pipelines and of the dimensions analysis are truncations of the same cached fit.
+    """
+    fitted_components = n_components if method == "randomized" else None
+    for components in dict.fromkeys([n_components, fitted_components]):  # The exact fit, then the shared one
+        path = projection_path(matrix.content_hash, method, components, cache_dir)
+        if os.path.exists(path):
+            print(f"Projection loaded from {path}")
+            return truncate_projection(joblib.load(path), n_components)
+
+    pca = fit_projection(matrix, method, fitted_components, batch_rows, random_state)
+    path = projection_path(matrix.content_hash, method, fitted_components, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    joblib.dump(pca, path)
+    print(f"Projection fitted and cached to {path}")
+    return truncate_projection(pca, n_components)
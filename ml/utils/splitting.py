@@ -1,73 +1,126 @@
+import os
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from typing import Dict, Tuple
-import pyarrow.feather as feather
-from joblib import dump, load
 
+from ml.utils.feature_matrix import FeatureMatrix
 
-def split_dataframe(
-    df: pd.DataFrame,
+FEATURES_PATH = "data/features/features_standardised.arrow"
+CACHE_FILE = "tmp/cached_splits.npz"
+SPLITS = ["train", "validation", "test"]
+SPLIT_PARAMETERS = {"train_size": 0.7, "validation_size": 0.15, "random_state": 42}
+
+
+def split_indices(
+    n_rows: int,
     train_size: float = 0.7,
     validation_size: float = 0.15,
     random_state: int = None,
-) -> Dict[str, Tuple[pd.DataFrame, pd.Series]]:
-    """Split DataFrame into train/validation/test sets while preserving the 'address' column in separate tuples."""
+) -> Dict[str, np.ndarray]:
+    """Split row positions into train/validation/test index arrays, in the same order as splitting the rows themselves."""
     if not abs((train_size + validation_size) - 0.85) < 1e-6:
         raise ValueError(
             "Train + validation sizes must sum to 0.85 (test size fixed at 0.15)"
         )
 
-    address = df["address"]
-    df = df.drop(columns=["address"])
-
-    train_df, temp_df = train_test_split(
-        df, train_size=train_size, random_state=random_state
+    train, temp = train_test_split(
+        np.arange(n_rows), train_size=train_size, random_state=random_state
     )
     val_test_ratio = validation_size / (1 - train_size)
-    val_df, test_df = train_test_split(
-        temp_df, train_size=val_test_ratio, random_state=random_state
+    validation, test = train_test_split(
+        temp, train_size=val_test_ratio, random_state=random_state
     )
+    return {"train": train, "validation": validation, "test": test}
+
+
+def split_dataframe(
+    df: pd.DataFrame,
+    train_size: float = 0.7,
+    validation_size: float = 0.15,
+    random_state: int = None,
+) -> Dict[str, Tuple[pd.DataFrame, pd.Series]]:
+    """Split DataFrame into train/validation/test sets while preserving the 'address' column in separate tuples."""
+    address = df["address"]
+    df = df.drop(columns=["address"])
 
-    return {
-        "all": (df, address),
-        "train": (train_df, address.loc[train_df.index]),
-        "validation": (val_df, address.loc[val_df.index]),
-        "test": (test_df, address.loc[test_df.index]),
-    }
+    indices = split_indices(len(df), train_size, validation_size, random_state)
+    dataset = {"all": (df, address)}
+    for name, rows in indices.items():
+        dataset[name] = (df.iloc[rows], address.iloc[rows])
+    return dataset
 
 
-def splitting():
-    """Step 1 of pipeline : split the dataset into train, validation, and test sets."""
+class SplitDataset:
+    """
+    Train/validation/test splits as row indices over one memory-mapped feature matrix.
+    `dataset[name]` gives the (features, addresses) of a split, materialized on first access only.
+    """
 
-    cache_file = "tmp/cached_dataset.joblib"
-    try:
-        dataset = load(cache_file)
-        print("Dataset loaded from cache")
-        return dataset
-    except FileNotFoundError:
-        print("No cached dataset found, creating a new one...")
+    def __init__(self, matrix: FeatureMatrix, indices: Dict[str, np.ndarray], fill_value: float = 0):
+        self.matrix = matrix
+        self.indices = indices
+        self.fill_value = fill_value
+        self._splits = {}
 
-    table = feather.read_table("data/features/features_standardised.arrow")
-    df = table.to_pandas()
+    def rows(self, name: str) -> np.ndarray:
+        """Row positions of a split in the feature matrix, None for all rows."""
+        if name != "all" and name not in self.indices:
+            raise KeyError(name)
+        return self.indices.get(name)
 
-    df.fillna(0, inplace=True)
+    def shape(self, name: str) -> Tuple[int, int]:
+        """Shape of the features of a split, without materializing them."""
+        rows = self.rows(name)
+        return (len(self.matrix) if rows is None else len(rows), len(self.matrix.columns))
 
-    dataset = split_dataframe(
-        df=df, train_size=0.7, validation_size=0.15, random_state=42
-    )
-    datasets = ["all", "train", "validation", "test"]
+    def __getitem__(self, name: str) -> Tuple[pd.DataFrame, pd.Series]:
+        if name not in self._splits:
+            rows = self.rows(name)
+            x = self.matrix.to_frame(rows, fill_value=self.fill_value)
+            y = self.matrix.addresses(rows)
+            if rows is not None:  # Keep the row positions as labels, as when splitting a frame
+                x.index = y.index = pd.Index(rows)
+            self._splits[name] = (x, y)
+        return self._splits[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name == "all" or name in self.indices
+
+    def keys(self):
+        return ["all"] + list(self.indices)
+
+
+def load_split_indices(cache_file: str, key: str) -> Dict[str, np.ndarray]:
+    """Cached split indices, None if there are none or they were computed for another features file or parameters."""
+    try:
+        with np.load(cache_file) as cached:
+            if str(cached["key"]) != key:
+                return None
+            return {name: cached[name] for name in SPLITS}
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def splitting():
+    """Step 1 of pipeline : split the dataset into train, validation, and test sets."""
 
-    for data in datasets:
-        x_data, y_data = dataset[data]
-        print(f"- x_{data} shape:", x_data.shape)
-        print(f"- y_{data} shape:", y_data.shape)
-        missing_x = x_data.isnull().sum()
-        missing_x = missing_x[missing_x > 0]
+    features = FeatureMatrix.load(FEATURES_PATH)
+    key = f"{features.content_hash}:{sorted(SPLIT_PARAMETERS.items())}"
 
-        if not missing_x.empty:
-            print(f"- Missing values in x_{data}:")
-            print(missing_x)
+    indices = load_split_indices(CACHE_FILE, key)
+    if indices is not None:
+        print("Split indices loaded from cache")
+    else:
+        print("No cached split indices for these features, creating new ones...")
+        indices = split_indices(len(features), **SPLIT_PARAMETERS)
+        os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+        np.savez(CACHE_FILE, key=key, **indices)
 
-    dump(dataset, cache_file)
+    dataset = SplitDataset(features, indices, fill_value=0)
+    for data in dataset.keys():
+        n_rows, n_cols = dataset.shape(data)
+        print(f"- x_{data} shape:", (n_rows, n_cols))
+        print(f"- y_{data} shape:", (n_rows,))
 
     return dataset
@@ -5,20 +5,19 @@ import matplotlib
 import seaborn as sns
 import matplotlib.pyplot as plt
 import plotly.express as px
-from sklearn.decomposition import PCA
 import logging
 
 logging.basicConfig(level=logging.INFO)
 matplotlib.use("Agg")
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from ml.utils.splitting import splitting
+from ml.utils.projection import load_projection, truncate_projection
 
 
-def apply_pca(x_all, variance_threshold=0.9999966):
-    """Applies PCA and visualizes the principal components with a variance threshold."""
+def apply_pca(matrix, x_all, variance_threshold=0.9999966):
+    """Applies the PCA shared with the pipelines and visualizes the principal components with a variance threshold."""
     print("\nApplying PCA...\n")
-    pca = PCA()
-    x_pca = pca.fit_transform(x_all)
+    pca = load_projection(matrix)
 
     explained_variance_cumsum = np.cumsum(pca.explained_variance_ratio_)
 
@@ -44,8 +43,7 @@ def apply_pca(x_all, variance_threshold=0.9999966):
     logging.info(f"Graphic saved in docs/graphics/pca/pca_variance.png")
     plt.close()
 
-    pca = PCA(n_components=n_components)
-    x_pca = pca.fit_transform(x_all)
+    x_pca = truncate_projection(pca, n_components).transform(x_all.to_numpy())
 
     if n_components >= 3:
         max_points = 100_000
@@ -87,7 +85,7 @@ def reduce_dimensions():
 
     print("\n2. Analyse\n---------------------------------")
     x_all, y_all = dataset["all"][0], dataset["all"][1]
-    x_pca, n_components = apply_pca(x_all)
+    x_pca, n_components = apply_pca(dataset.matrix, x_all)
 
     return {"pca": x_pca}
 
@@ -0,0 +1,81 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.processing.distribution_analysis import analyze_df
+from ml.utils.feature_matrix import FEATURES_DTYPE
+from benchmark_utils import features_frame, print_header, print_section, timed
+
+
+def build_fixture(n_users, n_features, seed):
+    """Build a features frame of normal, skewed and uniform columns with a few missing values."""
+    rng = np.random.default_rng(seed)
+    generators = [
+        lambda size: rng.standard_normal(size),
+        lambda size: rng.lognormal(0, 1, size),
+        lambda size: -rng.lognormal(0, 1, size) + 1,
+        lambda size: rng.uniform(0, 1, size),
+    ]
+    columns = {f"feature_{i}": generators[i % len(generators)](n_users).astype(FEATURES_DTYPE) for i in range(n_features)}
+    return features_frame(columns, missing=rng.integers(0, n_users, n_users // 100))
+
+
+def legacy_analyze_df(df, csv_out):
+    """Previous analyze_df statistics: scipy's tests on each column in turn, in the column dtype."""
+    from scipy.stats import kurtosis, normaltest, skew
+
+    results = []
+    for col in [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]:
+        col_data = df[col].dropna()
+        p_val = normaltest(col_data)[1] if len(col_data) > 7 else np.nan
+        results.append([col, p_val, skew(col_data), kurtosis(col_data), (df[col] > 0).all()])
+    pd.DataFrame(results, columns=["Variable", "p_value", "Skewness", "Kurtosis", "Positive"]).to_csv(csv_out, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the distribution analysis of the features.")
+    parser.add_argument("--users", type=int, default=2_000_000)
+    parser.add_argument("--features", type=int, default=62)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--sample-size", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users x {args.features} features, {os.cpu_count()} CPU")
+    df = build_fixture(args.users, args.features, args.seed)
+    runs = [
+        ("Column by column scipy tests", lambda path: legacy_analyze_df(df, path)),
+        ("Streaming moments, 1 process", lambda path: analyze_df(df, path, workers=1)),
+        (f"Streaming moments, {args.workers} processes", lambda path: analyze_df(df, path, workers=args.workers)),
+        (
+            f"Streaming moments, normality test on {args.sample_size} sampled values",
+            lambda path: analyze_df(df, path, workers=args.workers, sample_size=args.sample_size),
+        ),
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+        for step, (name, run) in enumerate(runs, start=1):
+            print_section(step, name)
+            path = os.path.join(tmp, f"stats_{step}.csv")
+            _, elapsed = timed(run, path)
+            results.append((elapsed, pd.read_csv(path)))
+            print(f"- analyze_df: {elapsed:.2f} s\n")
+
+        (legacy_time, legacy), (serial_time, serial), (parallel_time, parallel), (sampled_time, sampled) = results
+        print(f"- Speed-up, 1 process: x{legacy_time / serial_time:.1f}")
+        print(f"- Speed-up, {args.workers} processes: x{legacy_time / parallel_time:.1f}")
+        print(f"- Speed-up, sampled normality test: x{legacy_time / sampled_time:.1f}")
+        for stat in ["p_value", "Skewness", "Kurtosis"]:
+            difference = np.abs(serial[stat] - legacy[stat]).max()
+            print(f"- Largest absolute difference of the {stat} with scipy: {difference:.1e}")
+        normal = (parallel["Normality"] == "Normal").sum(), (sampled["Normality"] == "Normal").sum()
+        print(f"- Columns found normal, all values / sample: {normal[0]} / {normal[1]}")
+
+
+if __name__ == "__main__":
+    main()
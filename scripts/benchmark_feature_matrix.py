@@ -0,0 +1,83 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.utils.feature_matrix import FeatureMatrix, write_feature_matrix
+from ml.utils.splitting import split_dataframe
+from benchmark_utils import PeakMemory, features_frame, fresh_process_pool, print_header, print_section, timed
+
+
+def build_fixture(n_users, n_features, seed):
+    """Build a standardised features frame with a few missing values."""
+    rng = np.random.default_rng(seed)
+    return features_frame(rng.standard_normal((n_users, n_features)), missing=rng.integers(0, n_users, n_users // 100))
+
+
+def load_legacy(path):
+    """Previous loading: the whole float64 table with Python string addresses."""
+    df = feather.read_table(path).to_pandas()
+    df.fillna(0, inplace=True)
+    return df
+
+
+def load_compact(path):
+    """Compact loading: float32 rows materialized from the mapped file, categorical addresses."""
+    features = FeatureMatrix.load(path)
+    df = features.to_frame(fill_value=0)
+    df.insert(0, "address", features.addresses())
+    return df
+
+
+def run_loader(name, path):
+    """Load, then split, in a fresh process; return wall times, peak memory of each step and a checksum of the features."""
+    with PeakMemory() as memory:
+        df, load_elapsed = timed({"legacy": load_legacy, "compact": load_compact}[name], path)
+        load_peak = memory.current()
+        dataset, split_elapsed = timed(split_dataframe, df=df, train_size=0.7, validation_size=0.15, random_state=42)
+    x_all, address = dataset["all"]
+    checksum = float(np.asarray(x_all, dtype=np.float64).sum())
+    return (load_elapsed, split_elapsed), (load_peak, memory.peak), checksum, address.astype(str).iloc[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the loading and splitting of the feature matrix.")
+    parser.add_argument("--users", type=int, default=2_000_000)
+    parser.add_argument("--features", type=int, default=62)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users x {args.features} features")
+    with tempfile.TemporaryDirectory() as tmp, fresh_process_pool() as pool:
+        df = build_fixture(args.users, args.features, args.seed)
+        paths = {"legacy": os.path.join(tmp, "legacy.arrow"), "compact": os.path.join(tmp, "compact.arrow")}
+        feather.write_feather(pa.Table.from_pandas(df), paths["legacy"])
+        write_feature_matrix(df, paths["compact"])
+        del df
+
+        results = {}
+        for i, name in enumerate(paths, start=1):
+            print_section(i, f"{name} format")
+            elapsed, peaks, checksum, last_address = pool.apply(run_loader, (name, paths[name]))
+            results[name] = (peaks, checksum, last_address)
+            print(f"- File size: {os.path.getsize(paths[name]) / 2**20:,.0f} MB")
+            for step, step_elapsed, (anonymous, mapped) in zip(["Load", "Load and split"], np.cumsum(elapsed), peaks):
+                print(
+                    f"- {step}: {step_elapsed:.2f} s, peak memory {anonymous:,.0f} MB"
+                    f" + {mapped:,.0f} MB of mapped file pages"
+                )
+            print()
+
+        (legacy_peaks, legacy_sum, legacy_address), (peaks, checksum, address) = results.values()
+        for step, legacy_peak, peak in zip(["load", "load and split"], legacy_peaks, peaks):
+            print(f"- Memory reduction of the {step}: {1 - peak.sum() / legacy_peak.sum():.0%} (mapped pages included)")
+        print(f"- Relative difference of the features sum: {abs(checksum - legacy_sum) / abs(legacy_sum):.1e}")
+        print(f"- Same addresses: {address == legacy_address}")
+
+
+if __name__ == "__main__":
+    main()
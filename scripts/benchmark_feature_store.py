@@ -0,0 +1,62 @@
+import os
+import sys
+import argparse
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmark_features_aggregation import build_fixture
+from benchmark_utils import print_header, print_section, timed
+from ml.processing.feature_store import TRANSACTION_FEATURES, FeatureStore
+from ml.processing.features_engineering import aggregate_transactions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a daily refresh with the feature store against a full recompute.")
+    parser.add_argument("--n-tx", type=int, default=5_000_000)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--delta-days", type=int, default=1)
+    parser.add_argument("--median-error", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.n_tx} transactions, {args.users} users")
+    users, transactions = build_fixture(args.n_tx, args.users, args.seed)
+    transactions = transactions.sort_values("timestamp", ignore_index=True)
+    split = transactions["timestamp"].max() - pd.Timedelta(days=args.delta_days)
+    history = transactions[transactions["timestamp"] <= split]
+    delta = transactions[transactions["timestamp"] > split]
+
+    print_section(1, "Building the store from the history")
+    store = FeatureStore(args.median_error)
+    _, elapsed = timed(lambda: [store.fold(history.iloc[i : i + 1_000_000]) for i in range(0, len(history), 1_000_000)])
+    print(f"- Wall time: {elapsed:.2f} s")
+
+    print()
+    print_section(2, f"Refresh with {len(delta)} new transactions")
+
+    def refresh_features():
+        stale = users["address"].isin(store.fold(delta)).to_numpy()
+        return stale, store.features(users["address"][stale]), store.tx_frequency(users["address"])
+
+    (stale, refreshed, frequency), refresh = timed(refresh_features)
+    print(f"- Wall time: {refresh:.2f} s for {stale.sum()} affected users")
+
+    print()
+    print_section(3, "Full recompute")
+    full, recompute = timed(aggregate_transactions, users, transactions.copy(), median_error=args.median_error)
+    print(f"- Wall time: {recompute:.2f} s")
+    print(f"- Speed-up of the refresh: x{recompute / refresh:.0f}")
+
+    expected = full[TRANSACTION_FEATURES][stale].reset_index(drop=True)
+    try:
+        pd.testing.assert_frame_equal(refreshed[TRANSACTION_FEATURES], expected, check_dtype=False, rtol=1e-9)
+        pd.testing.assert_frame_equal(
+            frequency, full[frequency.columns].reset_index(drop=True), check_dtype=False, rtol=1e-9
+        )
+        print("- Refreshed features: identical to the full recompute")
+    except AssertionError as e:
+        print(f"- Refreshed features differ: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.processing.features_engineering import aggregate_transactions
+from ml.processing.quantile_sketch import GroupedQuantileSketch
+from benchmark_utils import PeakMemory, addresses, fresh_process_pool, print_header, print_section, timed
+
+
+def build_fixture(n_tx, n_users, seed):
+    """Build synthetic users and transactions with Zipf-distributed addresses."""
+    rng = np.random.default_rng(seed)
+    users = pd.DataFrame({"address": addresses(n_users), "sent_count": rng.integers(0, 100, n_users)})
+    start = np.datetime64("2023-01-01T00:00:00", "s").astype(np.int64)
+    transactions = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(rng.integers(start, start + 730 * 86400, n_tx), unit="s"),
+            "from": users["address"].to_numpy()[(rng.zipf(1.3, n_tx) - 1) % n_users],
+            "to": users["address"].to_numpy()[(rng.zipf(1.3, n_tx) - 1) % n_users],
+            "value_eth": np.where(rng.random(n_tx) < 0.01, np.nan, np.round(rng.lognormal(0, 2, n_tx), 4)),
+            "gas_used": rng.integers(0, 300000, n_tx).astype(np.float64),
+        }
+    )
+    return users, transactions
+
+
+def run_engine(engine, median_error, n_tx, n_users, seed, output_file):
+    """Run one engine in a fresh process; return wall time and peak memory above the fixture."""
+    users, transactions = build_fixture(n_tx, n_users, seed)
+    with PeakMemory() as memory:
+        result, elapsed = timed(aggregate_transactions, users, transactions, engine=engine, median_error=median_error)
+    result.to_parquet(output_file)
+    return elapsed, memory.peak.sum()
+
+
+def report_median_error(exact, approx, medians, median_error):
+    """Print the relative error of each approximate median feature against the exact one."""
+    for feature in medians:
+        expected, estimate = exact[feature].to_numpy(), approx[feature].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            errors = np.where(expected == 0, np.abs(estimate), np.abs(estimate - expected) / np.abs(expected))
+        print(
+            f"  {feature}: max relative error {np.nanmax(errors):.3%}, mean {np.nanmean(errors):.3%}"
+            f" (bound {median_error:.3%})"
+        )
+
+
+def check_merge(n_tx, n_users, seed, median_error, n_partitions=8):
+    """Sketch the sent values of each partition separately and check the merge equals one sketch of all rows."""
+    users, transactions = build_fixture(n_tx, n_users, seed)
+    groups = pd.Index(users["address"]).get_indexer(transactions["from"])
+    values = transactions["value_eth"].to_numpy()
+    whole = GroupedQuantileSketch(median_error).update(groups, values)
+    merged = GroupedQuantileSketch(median_error)
+    for part in np.array_split(np.random.default_rng(seed).permutation(n_tx), n_partitions):
+        merged.merge(GroupedQuantileSketch(median_error).update(groups[part], values[part]))
+    return np.array_equal(whole.keys, merged.keys) and np.array_equal(whole.counts, merged.counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transactions aggregation engines.")
+    parser.add_argument("--n-tx", type=int, default=5_000_000)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--median-error", type=float, default=0.01, help="Relative error of the approximate medians.")
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.n_tx} transactions, {args.users} users")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, fresh_process_pool() as pool:
+        runs = [("pandas", None), ("arrow", None), ("pandas", args.median_error), ("arrow", args.median_error)]
+        for i, (engine, median_error) in enumerate(runs, start=1):
+            name = engine if median_error is None else f"{engine}-approx"
+            output_file = os.path.join(tmp, f"{name}.parquet")
+            print_section(i, f"{name} engine")
+            elapsed, peak = pool.apply(
+                run_engine, (engine, median_error, args.n_tx, args.users, args.seed, output_file)
+            )
+            results[name] = (elapsed, pd.read_parquet(output_file))
+            print(f"- Wall time: {elapsed:.2f} s")
+            print(f"- Peak memory above fixture: {peak:,.0f} MB\n")
+
+        pandas_time, expected = results["pandas"]
+        arrow_time, actual = results["arrow"]
+        print(f"- Speed-up of the arrow engine: x{pandas_time / arrow_time:.1f}")
+        try:
+            pd.testing.assert_frame_equal(actual, expected, check_dtype=False, rtol=1e-9)
+            print("- Outputs: identical")
+        except AssertionError as e:
+            print(f"- Outputs differ: {e}")
+
+        medians = [column for column in actual.columns if column.startswith("med_")]
+        for engine, exact_time, exact in [("pandas", pandas_time, expected), ("arrow", arrow_time, actual)]:
+            approx_time, approx = results[f"{engine}-approx"]
+            print(f"- Speed-up of approximate medians with the {engine} engine: x{exact_time / approx_time:.1f}")
+            try:
+                pd.testing.assert_frame_equal(
+                    approx.drop(columns=medians), exact.drop(columns=medians), check_dtype=False, rtol=1e-9
+                )
+                print("  Other features: identical")
+            except AssertionError as e:
+                print(f"  Other features differ: {e}")
+            report_median_error(exact, approx, medians, args.median_error)
+        merged = pool.apply(check_merge, (args.n_tx // 10, args.users // 10, args.seed, args.median_error))
+        print(f"- Merged partition sketches equal the single-pass sketch: {merged}")
+
+if __name__ == "__main__":
+    main()
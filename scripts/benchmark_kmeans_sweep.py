@@ -0,0 +1,72 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.models.kmeans.kmeans_analysis import count_unique_rows, sweep_kmeans
+from benchmark_utils import blobs, print_header, print_section, timed
+
+K_RANGE = range(2, 11)
+
+
+def legacy_inertia(k, x):
+    """Previous inertia: one MiniBatchKMeans fit per k."""
+    return MiniBatchKMeans(n_clusters=k, random_state=42, batch_size=100).fit(x).inertia_
+
+
+def legacy_silhouette(k, x):
+    """Previous silhouette: a second, full KMeans fit per k with 10 initializations."""
+    labels = KMeans(n_clusters=k, random_state=42, n_init=10).fit(x).labels_
+    rows = np.random.default_rng(42).choice(len(x), min(10000, len(x)), replace=False)
+    return silhouette_score(x[rows], labels[rows])
+
+
+def legacy_sweep(x):
+    inertia = Parallel(n_jobs=-1)(delayed(legacy_inertia)(k, x) for k in K_RANGE)
+    silhouette = Parallel(n_jobs=-1)(delayed(legacy_silhouette)(k, x) for k in K_RANGE)
+    return np.array(inertia), np.array(silhouette)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the k-sweep of the K-Means analysis.")
+    parser.add_argument("--users", type=int, default=200_000)
+    parser.add_argument("--features", type=int, default=28)
+    parser.add_argument("--clusters", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users x {args.features} features, {os.cpu_count()} CPU")
+    x = blobs(args.users, args.features, args.clusters, args.seed, cluster_std=2.0).astype(np.float32)
+    x[: args.users // 10] = x[0]  # Duplicated rows
+
+    print_section(1, "Unique rows")
+    exact, unique_time = timed(lambda: np.unique(x, axis=0).shape[0])
+    hashed, hashed_time = timed(count_unique_rows, x)
+    print(f"- np.unique(axis=0): {exact} rows in {unique_time:.2f} s")
+    print(f"- Row hashes: {hashed} rows in {hashed_time:.2f} s (x{unique_time / hashed_time:.0f})\n")
+
+    print_section(2, "Previous sweep: MiniBatchKMeans for inertia, KMeans(n_init=10) for silhouette")
+    (legacy_inertia_values, legacy_silhouette_values), legacy_time = timed(legacy_sweep, x)
+    print(f"- {legacy_time:.2f} s, best k by silhouette: {K_RANGE[np.argmax(legacy_silhouette_values)]}\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = os.path.join(tmp, "kmeans_sweep.json")
+        step = 3
+        for warm_start in [False, True]:
+            for run in ["cold cache", "warm cache"]:
+                print_section(step, f"One fit per k, warm start {warm_start}, {run}")
+                scores, elapsed = timed(sweep_kmeans, x, K_RANGE, warm_start=warm_start, cache_file=cache_file)
+                print(f"- {elapsed:.2f} s (x{legacy_time / elapsed:.1f}), best k by silhouette: {scores['silhouette'].idxmax()}")
+                if run == "cold cache":
+                    print(scores.round(3).to_string())
+                print()
+                step += 1
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+import sys
+import argparse
+import logging.config
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../etl")))
+os.makedirs("logs", exist_ok=True)
+from etl_pipeline.market.aggregate import (
+    METRIC_COLUMNS,
+    aggregate_transactions,
+    aggregate_transactions_columnar,
+)
+from benchmark_utils import print_header, print_section, timed
+
+HOUR = 3_600_000_000_000
+START = np.datetime64("2023-01-01T00:00:00", "ns").astype(np.int64)
+
+
+def build_fixture(n_tx, n_protocols, days, n_addresses, seed):
+    """Build a synthetic fixture: hourly market rows and timestamp-sorted transactions per protocol."""
+    rng = np.random.default_rng(seed)
+    weights = rng.dirichlet(np.ones(n_protocols))
+    sizes = np.maximum((weights * n_tx).astype(np.int64), 1)
+    market_starts = START + np.arange(days * 24, dtype=np.int64) * HOUR
+
+    fixture = {}
+    for idx, size in enumerate(sizes):
+        protocol = f"protocol_{idx}"
+        timestamps = np.sort(rng.integers(START, START + days * 24 * HOUR, size))
+        transactions = {
+            "timestamp": timestamps,
+            "from": rng.zipf(1.3, size) % n_addresses,
+            "to": rng.zipf(1.3, size) % n_addresses,
+            "value": np.round(rng.lognormal(0, 2, size), 2),
+            "gas_used": rng.integers(21000, 300000, size).astype(np.float64),
+            "is_error": rng.random(size) < 0.02,
+        }
+        market = pd.DataFrame(
+            {
+                "timestamp": pd.to_datetime(market_starts),
+                "protocol_name": protocol,
+            }
+        )
+        fixture[protocol] = (market, transactions)
+    return fixture
+
+
+def benchmark_columnar(fixture):
+    """Time the single-scan columnar engine over every protocol of the fixture."""
+    return timed(
+        lambda: {
+            protocol: aggregate_transactions_columnar(market, transactions, time_deltas=(1, 24))
+            for protocol, (market, transactions) in fixture.items()
+        }
+    )
+
+
+def to_documents(protocol, transactions):
+    """Convert the fixture columns of a protocol into transaction documents."""
+    frame = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(transactions["timestamp"]).to_pydatetime(),
+            "from": transactions["from"].astype(str),
+            "to": transactions["to"].astype(str),
+            "value (ETH)": transactions["value"],
+            "gas_used": transactions["gas_used"],
+            "is_error": np.where(transactions["is_error"], "1", "0"),
+        }
+    )
+    documents = frame.to_dict("records")
+    for document in documents:
+        document["metadata"] = {"protocol_name": protocol}
+    return documents
+
+
+def benchmark_query(fixture, columnar_results, mongo_uri, legacy_rows):
+    """Time the per-row Mongo aggregation on a sample of rows, extrapolate it and check both paths agree."""
+    from pymongo import MongoClient, ASCENDING
+
+    client = MongoClient(mongo_uri)
+    collection = client["benchmark_db"]["transactions"]
+    collection.drop()
+    collection.create_index([("timestamp", ASCENDING)])
+
+    protocol = max(fixture, key=lambda p: len(fixture[p][1]["timestamp"]))
+    market, transactions = fixture[protocol]
+    documents = to_documents(protocol, transactions)
+    for i in range(0, len(documents), 100000):
+        collection.insert_many(documents[i : i + 100000], ordered=False)
+
+    sample = market.sample(min(legacy_rows, len(market)), random_state=0).reset_index(
+        drop=True
+    )
+    legacy, elapsed = timed(
+        lambda: aggregate_transactions(
+            aggregate_transactions(sample, time_delta=1, collection=collection),
+            time_delta=24,
+            collection=collection,
+        )
+    )
+    collection.drop()
+    client.close()
+
+    expected = columnar_results[protocol].merge(
+        sample[["timestamp", "protocol_name"]], on=["timestamp", "protocol_name"]
+    )
+    expected = expected.set_index("timestamp").loc[legacy["timestamp"]]
+    mismatches = [
+        f"{name}_{delta}h"
+        for name in METRIC_COLUMNS
+        for delta in (1, 24)
+        if not np.allclose(
+            legacy[f"{name}_{delta}h"].astype(float).to_numpy(),
+            expected[f"{name}_{delta}h"].astype(float).to_numpy(),
+            rtol=1e-6,
+            equal_nan=True,
+        )
+    ]
+    total_rows = sum(len(m) for m, _ in fixture.values())
+    return elapsed, elapsed / len(sample) * total_rows, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the market aggregation engines.")
+    parser.add_argument("--n-tx", type=int, default=20_000_000)
+    parser.add_argument("--protocols", type=int, default=11)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--addresses", type=int, default=7_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", default=None, help="Benchmark the query path against this server.")
+    parser.add_argument("--legacy-rows", type=int, default=48)
+    args = parser.parse_args()
+
+    print_header(f"Building fixture: {args.n_tx} transactions")
+    fixture = build_fixture(args.n_tx, args.protocols, args.days, args.addresses, args.seed)
+    total_rows = sum(len(m) for m, _ in fixture.values())
+
+    print_section(1, "Columnar engine")
+    results, elapsed = benchmark_columnar(fixture)
+    print(f"- Wall time: {elapsed:.2f} s")
+    print(f"- Throughput: {args.n_tx / elapsed:,.0f} tx/s, {2 * total_rows / elapsed:,.0f} windows/s")
+
+    if args.mongo_uri:
+        print()
+        print_section(2, "Query engine (per-row `$group`)")
+        sample_time, projected, mismatches = benchmark_query(
+            fixture, results, args.mongo_uri, args.legacy_rows
+        )
+        print(f"- Wall time on {args.legacy_rows} rows: {sample_time:.2f} s")
+        print(f"- Projected wall time on {total_rows} rows: {projected:.0f} s")
+        print(f"- Speed-up: x{projected / elapsed:.0f}")
+        print(f"- Mismatching columns: {mismatches or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
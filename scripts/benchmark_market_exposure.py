@@ -0,0 +1,131 @@
+import os
+import sys
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.processing.features_engineering import (
+    EXPOSURE_METRICS,
+    MARKET_PROTOCOLS,
+    aggregate_market,
+    market_statistics,
+)
+from benchmark_utils import print_header, print_section, timed
+
+MARKET_NAMES = {  # Market names as exported, cleaned by `aggregate_market`
+    "curve_dao": "Curve DAO",
+    "aave": "Aave",
+    "tether": "Tether",
+    "uniswap": "Uniswap",
+    "maker": "Maker",
+    "yearn_finance": "Yearn Finance",
+    "usdc": "USDC",
+    "dai": "DAI",
+    "balancer": "Balancer",
+    "harvest_finance": "Harvest Finance",
+}
+
+
+def build_fixture(n_users, days, seed):
+    """Build users with protocol counts and hourly market rows of the protocols with market data."""
+    rng = np.random.default_rng(seed)
+    users = pd.DataFrame(
+        {
+            f"{protocol}_count": rng.geometric(0.3, n_users) * (rng.random(n_users) < 0.3)
+            for protocol in MARKET_PROTOCOLS
+        }
+    )
+    n_rows = days * 24
+    market = pd.concat(
+        [
+            pd.DataFrame(
+                {
+                    "protocol_name": name,
+                    "volume": rng.lognormal(15, 1, n_rows),
+                    "close_usd": rng.lognormal(0, 1, n_rows),
+                    "avg_gas_used_24h": rng.lognormal(11, 0.5, n_rows),
+                    "error_rate_24h": rng.random(n_rows) * 0.05,
+                    "total_value_eth_24h": rng.lognormal(8, 1, n_rows),
+                    "nb_tx_24h": rng.integers(100, 10000, n_rows).astype(np.float64),
+                    "nb_unique_receivers_24h": rng.integers(10, 1000, n_rows).astype(np.float64),
+                    "nb_unique_senders_24h": rng.integers(10, 1000, n_rows).astype(np.float64),
+                    "std_gas_used_24h": rng.lognormal(10, 0.5, n_rows),
+                    "std_value_eth_24h": rng.lognormal(2, 1, n_rows),
+                    "max_value_eth_24h": rng.lognormal(6, 1, n_rows),
+                }
+            )
+            for name in MARKET_NAMES.values()
+        ],
+        ignore_index=True,
+    )
+    return users, market
+
+
+def legacy_exposures(merged_df, market_protocol_stats):
+    """Reproduce the per protocol and per metric loop of full-column additions."""
+    for metric in EXPOSURE_METRICS.keys():
+        merged_df[metric] = 0.0
+    for protocol in MARKET_PROTOCOLS:
+        stats = market_protocol_stats[market_protocol_stats["protocol_name"] == protocol]
+        if not stats.empty:
+            for metric, market_col in EXPOSURE_METRICS.items():
+                if isinstance(market_col, list):
+                    merged_df[metric] += merged_df[f"{protocol}_count"] * sum(
+                        stats[col].values[0] for col in market_col
+                    )
+                else:
+                    merged_df[metric] += merged_df[f"{protocol}_count"] * stats[market_col].values[0]
+    return merged_df
+
+
+def legacy_aggregate_market(merged_df, market):
+    """Legacy `aggregate_market`: the same market statistics, then the exposures loop."""
+    return legacy_exposures(merged_df, market_statistics(market))
+
+
+def measure(function, *args, **kwargs):
+    """Wall time and peak traced memory of one call, above its inputs."""
+    tracemalloc.start()
+    result, elapsed = timed(function, *args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the market exposure computation.")
+    parser.add_argument("--users", type=int, default=6_900_000)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users")
+    users, market = build_fixture(args.users, args.days, args.seed)
+
+    runs = {
+        "Per-protocol loop": (legacy_aggregate_market, {}),
+        "Matrix product, float64": (aggregate_market, {}),
+        "Matrix product, float32": (aggregate_market, {"dtype": np.float32}),
+    }
+    results = {}
+    for i, (name, (function, kwargs)) in enumerate(runs.items(), start=1):
+        print_section(i, name)
+        result, elapsed, peak = measure(function, users.copy(), market.copy(), **kwargs)
+        results[name] = (elapsed, result[list(EXPOSURE_METRICS)])
+        print(f"- Wall time: {elapsed:.2f} s")
+        print(f"- Peak traced memory: {peak:,.0f} MB\n")
+
+    legacy_time, expected = results["Per-protocol loop"]
+    for name in list(runs)[1:]:
+        elapsed, actual = results[name]
+        expected_values = expected.to_numpy()
+        error = np.max(
+            np.abs(actual.to_numpy(np.float64) - expected_values) / np.maximum(np.abs(expected_values), 1)
+        )
+        print(f"- {name}: x{legacy_time / elapsed:.1f} faster, max relative difference {error:.1e}")
+
+
+if __name__ == "__main__":
+    main()
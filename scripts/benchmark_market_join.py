@@ -0,0 +1,97 @@
+import os
+import sys
+import bisect
+import argparse
+import logging.config
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../etl")))
+os.makedirs("logs", exist_ok=True)
+from etl_pipeline.dataset.wrapped_task import (
+    OUT_OF_RANGE,
+    PROTOCOL_NOT_FOUND,
+    find_closest_snapshots,
+)
+from benchmark_utils import print_header, print_section, timed
+
+HOUR = np.timedelta64(1, "h")
+START = np.datetime64("2023-01-01T00:00:00", "us")
+
+
+def build_fixture(n_tx, n_protocols, days, seed):
+    """Build hourly market snapshots per protocol and transactions spread slightly beyond their range."""
+    rng = np.random.default_rng(seed)
+    snapshots = START + np.arange(days * 24) * HOUR
+    market_data = {
+        f"protocol_{i}": (snapshots, [{"hour": h} for h in range(len(snapshots))])
+        for i in range(n_protocols)
+    }
+    names = np.array(
+        [f"protocol_{i}" for i in range(n_protocols + 1)], dtype=object
+    )  # The last one has no market data
+    protocol_names = names[rng.integers(0, n_protocols + 1, n_tx)]
+    span = int((days * 24 + 48) * 3600 * 1e6)
+    timestamps = START - np.timedelta64(24, "h") + rng.integers(0, span, n_tx).astype(
+        "timedelta64[us]"
+    )
+    return market_data, protocol_names, timestamps
+
+
+def legacy_lookup(keys_by_protocol, protocol_name, timestamp):
+    """Reproduce the per-transaction lookup: range check, then bisect on a key list rebuilt every call."""
+    if protocol_name not in keys_by_protocol:
+        return PROTOCOL_NOT_FOUND
+    sorted_keys = keys_by_protocol[protocol_name]
+    if not (sorted_keys[0] <= timestamp <= sorted_keys[-1]):
+        return OUT_OF_RANGE
+    pos = bisect.bisect_left(sorted_keys, timestamp)
+    keys = list(sorted_keys)
+    if pos == 0:
+        return 0
+    if pos == len(keys):
+        return len(keys) - 1
+    before, after = keys[pos - 1], keys[pos]
+    return pos - 1 if abs(before - timestamp) <= abs(after - timestamp) else pos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the nearest market snapshot join.")
+    parser.add_argument("--n-tx", type=int, default=22_000_000)
+    parser.add_argument("--protocols", type=int, default=11)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--legacy-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    print_header(f"Building fixture: {args.n_tx} transactions")
+    market_data, protocol_names, timestamps = build_fixture(
+        args.n_tx, args.protocols, args.days, args.seed
+    )
+
+    print_section(1, "Vectorized join")
+    positions, elapsed = timed(find_closest_snapshots, market_data, protocol_names, timestamps)
+    print(f"- Wall time: {elapsed:.2f} s")
+    print(f"- Throughput: {args.n_tx / elapsed:,.0f} joins/s")
+
+    print()
+    print_section(2, "Per-transaction lookup")
+    keys_by_protocol = {
+        name: [int(t) for t in index.astype(np.int64)]
+        for name, (index, _) in market_data.items()
+    }
+    sample = np.random.default_rng(args.seed).choice(args.n_tx, args.legacy_rows, replace=False)
+    legacy, legacy_elapsed = timed(
+        lambda: [
+            legacy_lookup(keys_by_protocol, protocol_names[i], int(timestamps[i].astype(np.int64)))
+            for i in sample
+        ]
+    )
+    projected = legacy_elapsed / args.legacy_rows * args.n_tx
+    print(f"- Throughput: {args.legacy_rows / legacy_elapsed:,.0f} joins/s")
+    print(f"- Projected wall time on {args.n_tx} transactions: {projected:.0f} s")
+    print(f"- Speed-up: x{projected / elapsed:.0f}")
+    print(f"- Mismatching joins: {int(np.sum(positions[sample] != np.array(legacy)))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+import optuna
+from optuna.trial import TrialState
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+from sklearn.utils import resample
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.models.kmeans.kmeans_analysis import optimize_hyperparams, study_storage
+from benchmark_utils import blobs, print_header, print_section, timed
+
+
+def legacy_objective(x, trial, components):
+    """Previous objective: full data in every trial, raw scores weighted by trial parameters."""
+    kmeans = MiniBatchKMeans(
+        n_clusters=trial.suggest_int("n_clusters", 2, 10),
+        init=trial.suggest_categorical("init", ["k-means++", "random"]),
+        batch_size=trial.suggest_int("batch_size", 50, 500, step=50),
+        max_iter=trial.suggest_int("max_iter", 100, 500),
+        tol=trial.suggest_float("tol", 1e-6, 1e-2, log=True),
+        random_state=42,
+    )
+    labels = kmeans.fit_predict(x)
+    db_index = davies_bouldin_score(x, labels)
+    ch_index = calinski_harabasz_score(x, labels)
+    silhouette_avg = silhouette_score(*resample(x, labels, n_samples=10000, random_state=42))
+    weights = [trial.suggest_float(name, 0.1, 1.0) for name in ["silhouette_weight", "ch_weight", "db_weight"]]
+    terms = np.array([weights[0] * silhouette_avg, weights[1] * ch_index, -weights[2] * db_index])
+    components.append(np.abs(terms) / np.abs(terms).sum())
+    return terms.sum()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Optuna study of the KMeans hyperparameters.")
+    parser.add_argument("--users", type=int, default=500_000)
+    parser.add_argument("--features", type=int, default=28)
+    parser.add_argument("--clusters", type=int, default=5)
+    parser.add_argument("--trials", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+    print_header(f"Fixture: {args.users} users x {args.features} features, {os.cpu_count()} CPU")
+    x = blobs(args.users, args.features, args.clusters, args.seed, unbalanced=True)
+
+    print_section(1, "Previous study: in memory, every trial on all the rows")
+    components = []
+    study = optuna.create_study(direction="maximize", sampler=optuna.samplers.TPESampler(seed=args.seed))
+    _, legacy_time = timed(study.optimize, lambda trial: legacy_objective(x, trial, components), n_trials=args.trials)
+    share = np.mean(components, axis=0)
+    print(f"- {legacy_time:.1f} s, {legacy_time / args.trials:.2f} s per trial, best n_clusters {study.best_params['n_clusters']}")
+    print(f"- Mean share of the objective: silhouette {share[0]:.1%}, Calinski-Harabasz {share[1]:.1%}, Davies-Bouldin {share[2]:.1%}\n")
+
+    print_section(2, f"Journal study, {args.workers} workers, pruned subsample steps")
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = os.path.join(tmp, "study.log")
+        save_path = os.path.join(tmp, "results.json")
+        results, elapsed = timed(
+            optimize_hyperparams, x, n_trials=args.trials, save_path=save_path, storage=storage, workers=args.workers
+        )
+        study = optuna.load_study(study_name="minibatch_kmeans_optimization", storage=study_storage(storage))
+        pruned = len(study.get_trials(states=(TrialState.PRUNED,)))
+        print(f"- {elapsed:.1f} s, {elapsed / len(study.trials):.2f} s per trial (x{legacy_time / elapsed:.1f})")
+        print(f"- {pruned} of {len(study.trials)} trials pruned before the full data")
+        print(f"- Best n_clusters {results['best_params']['n_clusters']}, normalized score {results['best_value']:.3f}\n")
+
+        print_section(3, "Resuming the finished study")
+        _, elapsed = timed(
+            optimize_hyperparams, x, n_trials=args.trials, save_path=save_path, storage=storage, workers=args.workers
+        )
+        print(f"- {elapsed:.1f} s, {len(study.trials)} trials in the study")
+
+
+if __name__ == "__main__":
+    main()
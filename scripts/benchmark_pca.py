@@ -0,0 +1,70 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+from sklearn.decomposition import PCA
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.utils.feature_matrix import FeatureMatrix, write_feature_matrix
+from ml.utils.projection import load_projection
+from benchmark_utils import features_frame, print_header, print_section, timed
+
+
+def build_fixture(n_users, n_features, seed):
+    """Build a features frame of correlated features with a decaying spectrum and a few missing values."""
+    rng = np.random.default_rng(seed)
+    latent = rng.standard_normal((n_users, n_features)) * 0.85 ** np.arange(n_features)
+    x = latent @ np.linalg.qr(rng.standard_normal((n_features, n_features)))[0] + rng.normal(5.0, 1.0, n_features)
+    return features_frame(x.astype(np.float32), missing=slice(None, None, 100))
+
+
+def subspace_cosine(reference, pca):
+    """Cosine of the largest principal angle between the subspaces of two projections: 1 for the same subspace."""
+    return np.linalg.svd(reference.components_ @ pca.components_.T, compute_uv=False).min()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PCA projection shared by the pipelines.")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--features", type=int, default=62)
+    parser.add_argument("--components", type=int, default=28)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users x {args.features} features, {os.cpu_count()} CPU")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "features.arrow")
+        write_feature_matrix(build_fixture(args.users, args.features, args.seed), path)
+        matrix = FeatureMatrix.load(path)
+        x = matrix.to_numpy(fill_value=0)
+
+        print_section(1, "Previous fits: dimensions analysis (PCA(), then PCA(n)) and one PCA(n) per pipeline")
+        _, analysis_time = timed(lambda: PCA().fit(x) and PCA(args.components).fit(x))
+        legacy, pipeline_time = timed(PCA(args.components).fit, x)
+        legacy_time = analysis_time + 2 * pipeline_time
+        reference = PCA(args.components).fit(x.astype(np.float64))  # Exact fit in float64
+        print(f"- Analysis {analysis_time:.2f} s, pipeline {pipeline_time:.2f} s, {legacy_time:.2f} s for the three of them")
+        print(
+            f"- Explained variance {legacy.explained_variance_ratio_.sum():.6f} (exact {reference.explained_variance_ratio_.sum():.6f}),"
+            f" subspace cosine to the exact fit {subspace_cosine(reference, legacy):.6f}\n"
+        )
+
+        for step, method in enumerate(["covariance", "incremental", "randomized", "full"], start=2):
+            cache_dir = os.path.join(tmp, method)
+            print_section(step, f"{method.capitalize()} projection, cold and warm cache")
+            pca, cold_time = timed(load_projection, matrix, args.components, method, cache_dir=cache_dir)
+            _, warm_time = timed(load_projection, matrix, args.components, method, cache_dir=cache_dir)
+            print(f"- Fit {cold_time:.2f} s for the three of them, cached {warm_time * 1000:.1f} ms")
+            print(
+                f"- Explained variance {pca.explained_variance_ratio_.sum():.6f},"
+                f" subspace cosine to the exact fit {subspace_cosine(reference, pca):.6f}"
+            )
+            if method != "randomized":
+                analysis, analysis_time = timed(load_projection, matrix, method=method, cache_dir=cache_dir)
+                print(f"- All {analysis.n_components_} components for the analysis from the same cache: {analysis_time * 1000:.1f} ms")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from processing_users import (
+    PROTOCOL_TYPES,
+    parse_protocols,
+    process_user_protocols,
+    transform_protocols_column,
+)
+from benchmark_utils import addresses, print_header, print_section, timed
+
+PROTOCOLS = {
+    "Curve DAO": "DEX",
+    "Aave": "Lending",
+    "Tether": "Stablecoin",
+    "Uniswap": "DEX",
+    "Maker": "Lending",
+    "Yearn Finance": "Yield Farming",
+    "USDC": "Stablecoin",
+    "DAI": "Stablecoin",
+    "Balancer": "DEX",
+    "Harvest Finance": "Yield Farming",
+}
+USAGE_TYPE = pa.struct(
+    [("count", pa.int64()), ("blockchain", pa.string()), ("contract_id", pa.string())]
+)
+
+
+def build_fixture(n_users, seed):
+    """Build the protocol columns of users using 1 to 4 protocols, as Parquet maps."""
+    rng = np.random.default_rng(seed)
+    names = np.array(list(PROTOCOLS))
+    sizes = rng.integers(1, 5, n_users)
+    protocol_types, protocols_used = [], []
+    for size, counts in zip(sizes, np.split(rng.geometric(0.3, sizes.sum()), np.cumsum(sizes)[:-1])):
+        used = rng.choice(names, size, replace=False)
+        types = {}
+        for name in used:
+            types[PROTOCOLS[name]] = types.get(PROTOCOLS[name], 0) + 1
+        protocol_types.append(list(types.items()))
+        protocols_used.append(
+            [
+                (name, {"count": int(count), "blockchain": "ethereum", "contract_id": f"0x{name}"})
+                for name, count in zip(used, counts)
+            ]
+        )
+    return pa.table(
+        {
+            "address": pa.array(addresses(n_users), pa.string()),
+            "protocol_types": pa.array(protocol_types, pa.map_(pa.string(), pa.int64())),
+            "protocols_used": pa.array(protocols_used, pa.map_(pa.string(), USAGE_TYPE)),
+        }
+    )
+
+
+def as_json(table):
+    """The same users with JSON string protocol columns, as in the first exports."""
+    users = table.to_pandas()
+    for column in ["protocol_types", "protocols_used"]:
+        users[column] = [json.dumps(dict(x)) for x in users[column]]
+    return users
+
+
+def as_maps(table):
+    """The same users with the protocol columns kept as Arrow maps, as `load_users` reads them."""
+    return table.to_pandas(
+        types_mapper=lambda t: pd.ArrowDtype(t) if pa.types.is_map(t) else None
+    )
+
+
+def legacy_processing(users):
+    """Reproduce the per-row processing: apply per protocol type, eval and iterrows."""
+    users = users.assign(**{f"type_{protocol}": 0 for protocol in PROTOCOL_TYPES})
+    parsed = users["protocol_types"].apply(parse_protocols)
+    for protocol in PROTOCOL_TYPES:
+        users[f"type_{protocol}"] = parsed.apply(lambda x: x.get(protocol, 0))
+    users = users.drop(columns=["protocol_types"])
+    users["protocols_used"] = users["protocols_used"].apply(
+        lambda x: eval(x) if isinstance(x, str) else dict(x) if x is not None else {}
+    )
+    for index, row in users.iterrows():
+        for protocol_name, protocol_data in row["protocols_used"].items():
+            users.at[index, f"{protocol_name}_count"] = int(protocol_data.get("count", 0))
+    return users.drop(columns=["protocols_used"])
+
+
+def vectorized_processing(users, workers):
+    return transform_protocols_column(process_user_protocols(users, workers), workers=workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the users protocol processing.")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--legacy-rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    print_header(f"Building fixture: {args.users} users")
+    table = build_fixture(args.users, args.seed)
+    formats = {"JSON strings": as_json(table), "Parquet maps": as_maps(table)}
+    legacy_sample = table.slice(0, args.legacy_rows)
+    legacy_formats = {
+        "JSON strings": as_json(legacy_sample),
+        "Parquet maps": legacy_sample.to_pandas(),  # Lists of key/value pairs, as pandas reads them
+    }
+
+    for step, (name, users) in enumerate(formats.items(), start=1):
+        print_section(step, name)
+        elapsed = np.inf
+        for workers in sorted({1, args.workers}):
+            _, workers_elapsed = timed(vectorized_processing, users.copy(), workers)
+            elapsed = min(elapsed, workers_elapsed)
+            print(
+                f"- Vectorized, {workers} worker(s): {workers_elapsed:.2f} s ({args.users / workers_elapsed:,.0f} users/s)"
+            )
+
+        legacy, legacy_elapsed = timed(legacy_processing, legacy_formats[name])
+        projected = legacy_elapsed / args.legacy_rows * args.users
+        print(f"- Per-row: {args.legacy_rows / legacy_elapsed:,.0f} users/s")
+        print(f"- Projected per-row wall time on {args.users} users: {projected:.0f} s")
+        print(f"- Speed-up: x{projected / elapsed:.0f}")
+
+        vectorized = vectorized_processing(users.head(args.legacy_rows).copy(), args.workers)
+        same = vectorized.columns.tolist() == legacy.columns.tolist() and vectorized.fillna(0).equals(
+            legacy.fillna(0).astype(vectorized.dtypes.to_dict())
+        )
+        print(f"- Same output as per-row processing: {same}\n")
+
+
+if __name__ == "__main__":
+    main()
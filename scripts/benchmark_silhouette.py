@@ -0,0 +1,68 @@
+import os
+import sys
+import argparse
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import silhouette_score
+from sklearn.utils import resample
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.utils.clustering_metrics import sampled_silhouette, simplified_silhouette
+from benchmark_utils import blobs, print_header, print_section, timed
+
+
+def legacy_choice(x, labels, seed):
+    """Previous sweep silhouette: an unseeded uniform sample, here seeded to measure its spread."""
+    rows = np.random.default_rng(seed).choice(len(x), 10000, replace=False)
+    return silhouette_score(x[rows], labels[rows])
+
+
+def legacy_resample(x, labels, seed):
+    """Previous measure_performances silhouette: a uniform sample with replacement."""
+    x_sample, labels_sample = resample(x, labels, n_samples=10000, random_state=seed)
+    return silhouette_score(x_sample, labels_sample)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the silhouette metrics.")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--features", type=int, default=28)
+    parser.add_argument("--clusters", type=int, default=5)
+    parser.add_argument("--seeds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users x {args.features} features, {os.cpu_count()} CPU")
+    x = blobs(args.users, args.features, args.clusters, args.seed, unbalanced=True).astype(np.float32)
+    model = MiniBatchKMeans(args.clusters, n_init=1, random_state=args.seed, batch_size=4096).fit(x)
+    labels, centroids = model.labels_, model.cluster_centers_
+    print(f"- Cluster sizes: {np.bincount(labels).tolist()}\n")
+
+    print_section(1, "Cost and spread of one score over seeds")
+    for name, metric in [
+        ("Uniform sample, no replacement", legacy_choice),
+        ("Uniform sample, with replacement", legacy_resample),
+        ("Stratified sample", lambda x, labels, seed: sampled_silhouette(x, labels, 10000, seed)),
+    ]:
+        scores, elapsed = [], 0.0
+        for seed in range(args.seeds):
+            score, seconds = timed(metric, x, labels, seed)
+            scores.append(score)
+            elapsed += seconds
+        print(f"- {name}: {elapsed / args.seeds:.2f} s, {np.mean(scores):.4f} +/- {np.std(scores):.4f}")
+    score, elapsed = timed(simplified_silhouette, x, labels, centroids)
+    print(f"- Simplified silhouette of all {len(x)} rows: {elapsed:.2f} s, {score:.4f}, deterministic\n")
+
+    print_section(2, "Choice of k")
+    for k in range(2, 9):
+        model = MiniBatchKMeans(k, n_init=1, random_state=args.seed, batch_size=4096).fit(x)
+        sampled, sampled_time = timed(sampled_silhouette, x, model.labels_)
+        simplified, simplified_time = timed(simplified_silhouette, x, model.labels_, model.cluster_centers_)
+        print(
+            f"- k={k}: exact on the sample {sampled:.4f} ({sampled_time:.2f} s),"
+            f" simplified on all rows {simplified:.4f} ({simplified_time:.2f} s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
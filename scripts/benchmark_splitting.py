@@ -0,0 +1,86 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+import pyarrow as pa
+import pyarrow.feather as feather
+from joblib import dump, load
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.utils.feature_matrix import write_feature_matrix
+from ml.utils.splitting import CACHE_FILE, FEATURES_PATH, split_dataframe, splitting
+from benchmark_feature_matrix import build_fixture
+from benchmark_utils import PeakMemory, fresh_process_pool, print_header, print_section, timed
+
+LEGACY_CACHE_FILE = "tmp/cached_dataset.joblib"
+
+
+def legacy_splitting():
+    """Previous splitting: float64 frames of every split, cached whole with joblib."""
+    try:
+        return load(LEGACY_CACHE_FILE)
+    except FileNotFoundError:
+        pass
+    df = feather.read_table("data/features/features_legacy.arrow").to_pandas()
+    df.fillna(0, inplace=True)
+    dataset = split_dataframe(df=df, train_size=0.7, validation_size=0.15, random_state=42)
+    dump(dataset, LEGACY_CACHE_FILE)
+    return dataset
+
+
+def run_splitting(name, workdir):
+    """Split in a fresh process, then read every split; return wall times, peak memory and a checksum of the train split."""
+    os.chdir(workdir)
+    with PeakMemory() as memory:
+        dataset, split_elapsed = timed({"legacy": legacy_splitting, "indices": splitting}[name])
+        (_, (x_train, y_train)), read_elapsed = timed(lambda: (dataset["all"], dataset["train"]))
+    checksum = float(np.asarray(x_train, dtype=np.float64).sum())
+    return split_elapsed, split_elapsed + read_elapsed, memory.peak, checksum, y_train.astype(str).iloc[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cached train/validation/test splitting.")
+    parser.add_argument("--users", type=int, default=2_000_000)
+    parser.add_argument("--features", type=int, default=62)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users x {args.features} features")
+    with tempfile.TemporaryDirectory() as tmp, fresh_process_pool() as pool:
+        os.makedirs(os.path.join(tmp, "data/features"))
+        os.makedirs(os.path.join(tmp, "tmp"))
+        df = build_fixture(args.users, args.features, args.seed)
+        feather.write_feather(pa.Table.from_pandas(df), os.path.join(tmp, "data/features/features_legacy.arrow"))
+        write_feature_matrix(df, os.path.join(tmp, FEATURES_PATH))
+        del df
+
+        results = {}
+        step = 1
+        for name, cache_file in [("legacy", LEGACY_CACHE_FILE), ("indices", CACHE_FILE)]:
+            for run in ["cold cache", "warm cache"]:
+                print_section(step, f"{name} splitting, {run}")
+                split_elapsed, elapsed, (anonymous, mapped), checksum, first_address = pool.apply(
+                    run_splitting, (name, tmp)
+                )
+                results[name, run] = (split_elapsed, checksum, first_address)
+                print(f"- splitting(): {split_elapsed:.2f} s")
+                print(f"- splitting() and reading the all and train splits: {elapsed:.2f} s")
+                print(f"- Peak memory: {anonymous:,.0f} MB + {mapped:,.0f} MB of mapped file pages")
+                print(f"- Cache file: {os.path.getsize(os.path.join(tmp, cache_file)) / 2**20:,.1f} MB\n")
+                step += 1
+
+        legacy_time, legacy_sum, legacy_address = results["legacy", "warm cache"]
+        split_time, checksum, first_address = results["indices", "warm cache"]
+        print(f"- Speed-up of splitting() with a warm cache: x{legacy_time / split_time:,.0f}")
+        print(f"- Relative difference of the train features sum: {abs(checksum - legacy_sum) / abs(legacy_sum):.1e}")
+        print(f"- Same train rows: {first_address == legacy_address}")
+
+        write_feature_matrix(build_fixture(10, args.features, args.seed + 1), os.path.join(tmp, FEATURES_PATH))
+        os.chdir(tmp)
+        print("\nAfter rewriting the features file:")
+        splitting()
+
+
+if __name__ == "__main__":
+    main()
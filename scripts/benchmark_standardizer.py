@@ -0,0 +1,86 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pyarrow as pa
+from scipy.stats import boxcox
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.processing.standardizer import METHODS, Standardizer
+from ml.utils.feature_matrix import FEATURES_DTYPE
+from benchmark_utils import features_frame, print_header, print_section, timed
+
+
+def build_fixture(n_users, n_features, seed):
+    """Build a raw features frame with a few missing values, and the standardization method of each column."""
+    rng = np.random.default_rng(seed)
+    methods = {f"feature_{i}": METHODS[i % len(METHODS)] for i in range(n_features)}
+    values = rng.lognormal(0, 1, (n_users, n_features)) - rng.uniform(0, 1, n_features)
+    return features_frame(values, missing=rng.integers(0, n_users, n_users // 100)), methods
+
+
+def legacy_standardize(df, methods):
+    """Previous standardize_df: the parameters re-derived and applied one column at a time."""
+    df_transformed = df.copy()
+    for col, method in methods.items():
+        if method == "Z-score":
+            df_transformed[col] = (df_transformed[col] - df_transformed[col].mean()) / df_transformed[col].std()
+        elif method == "Min-Max":
+            df_transformed[col] = (df_transformed[col] - df_transformed[col].min()) / (
+                df_transformed[col].max() - df_transformed[col].min()
+            )
+        elif method == "Log":
+            df_transformed[col] = np.log1p(np.maximum(df_transformed[col], 0))
+        elif method == "Log Inverse":
+            df_transformed[col] = np.log1p(np.maximum(-df_transformed[col], 0))
+        elif method == "Box-Cox":
+            df_transformed[col], _ = boxcox(df_transformed[col] - df_transformed[col].min() + 1)
+    return df_transformed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fitted standardizer against the column by column standardization.")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--features", type=int, default=62)
+    parser.add_argument("--new-users", type=int, default=100_000)
+    parser.add_argument("--batch-rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users x {args.features} features, {os.cpu_count()} CPU")
+    df, methods = build_fixture(args.users, args.features, args.seed)
+    box_cox = [col for col, method in methods.items() if method == "Box-Cox"]
+    legacy_box_cox = [col for col in box_cox if col != "feature_0"]  # scipy's boxcox rejects missing values
+
+    print_section(1, "Column by column standardization")
+    legacy_methods = {col: method for col, method in methods.items() if col not in box_cox or col in legacy_box_cox}
+    legacy, legacy_time = timed(legacy_standardize, df, legacy_methods)
+    print(f"- standardize_df: {legacy_time:.2f} s\n")
+
+    print_section(2, "Fitted standardizer")
+    standardizer, fit_time = timed(Standardizer(legacy_methods).fit, df)
+    transformed, transform_time = timed(standardizer.transform, df)
+    _, transform_32_time = timed(standardizer.transform, df, dtype=FEATURES_DTYPE)
+    print(f"- fit: {fit_time:.2f} s")
+    print(f"- transform: {transform_time:.2f} s (float64), {transform_32_time:.2f} s ({np.dtype(FEATURES_DTYPE)})")
+    print(f"- Speed-up of fit and transform: x{legacy_time / (fit_time + transform_time):.1f}")
+    print(f"- Speed-up of transform only (fitted parameters reused): x{legacy_time / transform_time:.1f}")
+    differences = [
+        np.nanmax(np.abs(legacy[col].to_numpy() - transformed[col].to_numpy())) for col in legacy_methods
+    ]
+    print(f"- Largest absolute difference with standardize_df: {max(differences):.1e}")
+    print(f"- Same missing values: {legacy[list(legacy_methods)].isna().equals(transformed[list(legacy_methods)].isna())}\n")
+
+    print_section(3, "Streaming new addresses")
+    new_users, _ = build_fixture(args.new_users, args.features, args.seed + 1)
+    path = "benchmark_standardizer.csv"
+    standardizer.save(path)
+    standardizer = Standardizer.load(path)
+    os.remove(path)
+    batches = pa.Table.from_pandas(new_users, preserve_index=False).to_batches(max_chunksize=args.batch_rows)
+    rows, elapsed = timed(lambda: sum(batch.num_rows for batch in standardizer.transform_batches(batches)))
+    print(f"- {rows} rows in batches of {args.batch_rows}: {elapsed:.2f} s, {rows / elapsed:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+import pyarrow.feather as feather
+from sklearn.metrics import adjusted_rand_score
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../ml/models/kmeans")))
+from ml.utils.feature_matrix import write_feature_matrix
+from ml.utils.splitting import FEATURES_PATH
+from benchmark_utils import PeakMemory, blobs, features_frame, fresh_process_pool, print_header, print_section, timed
+
+
+def build_fixture(n_users, n_features, n_clusters, seed):
+    """Build a features frame of clustered users with a few missing values."""
+    return features_frame(blobs(n_users, n_features, n_clusters, seed).astype(np.float32), missing=slice(None, None, 100))
+
+
+def run_pipeline(streaming, workdir):
+    """Reduce, train and predict in a fresh process; return the wall time of each step and the peak memory."""
+    from kmeans_pipeline import KMeansPipeline
+
+    os.chdir(workdir)
+    with PeakMemory() as memory:
+        pipeline = KMeansPipeline(streaming=streaming, no_graph=True)
+        elapsed = [timed(step)[1] for step in [pipeline.load_data, pipeline.reduce, pipeline.train_model, pipeline.predict]]
+    return elapsed, memory.peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the in-memory and streaming KMeans training and prediction.")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--features", type=int, default=62)
+    parser.add_argument("--clusters", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print_header(f"Fixture: {args.users} users x {args.features} features, {os.cpu_count()} CPU")
+    with tempfile.TemporaryDirectory() as tmp, fresh_process_pool() as pool:
+        for directory in ["data/features", "data/clustering/kmeans", "src/frontend/layouts/data", "tmp"]:
+            os.makedirs(os.path.join(tmp, directory))
+        write_feature_matrix(build_fixture(args.users, args.features, args.clusters, args.seed), os.path.join(tmp, FEATURES_PATH))
+
+        predictions = {}
+        for i, (name, streaming) in enumerate([("In memory: PCA, KMeans", False), ("Streaming: cached PCA, MiniBatchKMeans", True)], start=1):
+            print_section(i, name)
+            elapsed, (anonymous, mapped) = pool.apply(run_pipeline, (streaming, tmp))
+            for step, seconds in zip(["load", "reduce", "train", "predict"], elapsed):
+                print(f"- {step}: {seconds:.2f} s")
+            print(f"- Total: {sum(elapsed):.2f} s, peak memory {anonymous:,.0f} MB + {mapped:,.0f} MB of mapped file pages\n")
+            predictions[streaming] = feather.read_table(os.path.join(tmp, "data/clustering/kmeans/kmeans_predictions.arrow")).to_pandas()
+
+        in_memory, streamed = predictions[False], predictions[True]
+        print(f"- Same addresses in the predictions: {in_memory['address'].astype(str).equals(streamed['address'])}")
+        print(f"- Adjusted Rand index between the two clusterings: {adjusted_rand_score(in_memory['cluster'], streamed['cluster']):.4f}")
+
+
+if __name__ == "__main__":
+    main()
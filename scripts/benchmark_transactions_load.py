@@ -0,0 +1,123 @@
+import os
+import sys
+import argparse
+import logging.config
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../etl")))
+os.makedirs("logs", exist_ok=True)
+from etl_pipeline.transactions.load import (
+    build_transaction_documents,
+    insert_transactions,
+    load_known_hashes,
+    setup_transactions_collection,
+    upsert_transactions,
+)
+import etl_pipeline.transactions.load as load_module
+from benchmark_utils import print_header, print_section, timed
+
+CONTRACT = ("benchmark", "DEX", "benchmark_contract", "ethereum")
+
+
+def build_records(n_tx, seed):
+    """Build synthetic Etherscan `tokentx` records."""
+    rng = np.random.default_rng(seed)
+    timestamps = np.sort(rng.integers(1672531200, 1735689600, n_tx))
+    values = rng.integers(0, 10**19, n_tx, dtype=np.uint64)  # wei
+    gas = rng.integers(21000, 300000, n_tx)
+    return [
+        {
+            "timeStamp": str(timestamps[i]),
+            "hash": f"0x{i:064x}",
+            "from": f"0x{rng.integers(0, 2**62):040x}",
+            "to": f"0x{rng.integers(0, 2**62):040x}",
+            "value": str(values[i]),
+            "gas": str(gas[i]),
+            "gasUsed": str(gas[i] // 2),
+        }
+        for i in range(n_tx)
+    ]
+
+
+def get_collection(mongo_uri):
+    """Return a fresh benchmark collection on a server, or on mongomock."""
+    if mongo_uri:
+        from pymongo import MongoClient
+
+        client = MongoClient(mongo_uri)
+    else:
+        import mongomock
+
+        client = mongomock.MongoClient()
+    collection = client["benchmark_db"]["transactions"]
+    collection.drop()
+    return collection
+
+
+def benchmark_insert(records, collection, batch_size):
+    """Time the insert-only path on a cold collection, then a full replay of the same batches."""
+
+    def load():
+        known_hashes = load_known_hashes(CONTRACT[2], collection)
+        for i in range(0, len(records), batch_size):
+            insert_transactions(
+                *CONTRACT, records[i : i + batch_size], known_hashes, collection
+            )
+
+    setup_transactions_collection(collection)
+    _, cold = timed(load)
+    _, replay = timed(load)
+    return cold, replay, collection.count_documents({})
+
+
+def benchmark_upsert(records, collection, batch_size):
+    """Time the per-document upsert path, which re-creates the indexes on every call."""
+
+    def load():
+        for i in range(0, len(records), batch_size):
+            collection.create_index([("transaction_hash", 1)])
+            collection.create_index([("timestamp", 1)])
+            upsert_transactions(*CONTRACT, records[i : i + batch_size])
+
+    load_module.get_mongo_collection = lambda db_name, collection_name: collection
+    _, elapsed = timed(load)
+    return elapsed, collection.count_documents({})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transactions load paths.")
+    parser.add_argument("--n-tx", type=int, default=None, help="Defaults to 200k on a server, 5k on mongomock.")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mongo-uri", default=None, help="Benchmark against this server instead of mongomock.")
+    args = parser.parse_args()
+    args.n_tx = args.n_tx or (200_000 if args.mongo_uri else 5_000)  # mongomock checks unique indexes in O(n)
+    logging.disable(logging.INFO)
+
+    print_header(f"Building fixture: {args.n_tx} transactions")
+    records = build_records(args.n_tx, args.seed)
+
+    print_section(1, "Document building")
+    _, elapsed = timed(build_transaction_documents, *CONTRACT, records)
+    print(f"- Throughput: {args.n_tx / elapsed:,.0f} docs/s")
+
+    print()
+    print_section(2, "Insert-only path")
+    cold, replay, count = benchmark_insert(
+        records, get_collection(args.mongo_uri), args.batch_size
+    )
+    print(f"- Cold load: {args.n_tx / cold:,.0f} docs/s ({count} documents)")
+    print(f"- Replay of known hashes: {args.n_tx / replay:,.0f} docs/s")
+
+    if args.mongo_uri:  # mongomock does not support every `UpdateOne` option of recent pymongo
+        print()
+        print_section(3, "Upsert path")
+        elapsed, count = benchmark_upsert(
+            records, get_collection(args.mongo_uri), args.batch_size
+        )
+        print(f"- Cold load: {args.n_tx / elapsed:,.0f} docs/s ({count} documents)")
+        print(f"- Speed-up of the insert-only path: x{elapsed / cold:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import time
+import threading
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+from sklearn.datasets import make_blobs
+
+RULE = "---------------------------------"
+
+
+def print_header(text):
+    """Print the banner of a benchmark, e.g. its fixture."""
+    print(f"\n ======= {text} ======= \n")
+
+
+def print_section(step, title):
+    """Print the numbered title of a step of a benchmark."""
+    print(f"{step}. {title}\n{RULE}", flush=True)
+
+
+def timed(function, *args, **kwargs):
+    """Result and wall time in seconds of one call."""
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def rss_mb():
+    """Anonymous and file-backed resident memory of the current process, in MB (Linux)."""
+    with open("/proc/self/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    return np.array([int(status[key].split()[0]) / 2**10 for key in ["RssAnon", "RssFile"]])
+
+
+class PeakMemory:
+    """
+    Peak anonymous and file-backed resident memory above the memory at entry, sampled by a thread every few
+    milliseconds while the block runs: `peak` after the block, `current()` within it.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = np.zeros(2)
+
+    def __enter__(self):
+        self.baseline, self._max, self._done = rss_mb(), rss_mb(), threading.Event()
+        self._sampler = threading.Thread(target=self._sample)
+        self._sampler.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self._max = np.maximum(self._max, rss_mb())
+
+    def current(self):
+        """Peak above the memory at entry so far."""
+        return np.maximum(self._max, rss_mb()) - self.baseline
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._sampler.join()
+        self.peak = self.current()
+        return False
+
+
+def fresh_process_pool():
+    """Pool running each task in a new spawned process, so that the peak memory of a run is its own."""
+    return get_context("spawn").Pool(1, maxtasksperchild=1)
+
+
+def addresses(n_users):
+    """Distinct Ethereum-like addresses of the users."""
+    return np.array([f"0x{i:040x}" for i in range(n_users)], dtype=object)
+
+
+def features_frame(values, missing=None):
+    """
+    Features frame of users: the columns of `values`, a dict or a 2D array of columns named feature_i, with
+    NaN on the `missing` rows of the first feature, and the addresses as first column.
+    """
+    df = pd.DataFrame(values if isinstance(values, dict) else {f"feature_{i}": column for i, column in enumerate(values.T)})
+    if missing is not None:
+        df.iloc[missing, 0] = np.nan
+    df.insert(0, "address", addresses(len(df)))
+    return df
+
+
+def blobs(n_users, n_features, n_clusters, seed, cluster_std=3.0, unbalanced=False):
+    """Clustered rows; with `unbalanced`, each cluster half the size of the previous one."""
+    if unbalanced:
+        weights = 0.5 ** np.arange(n_clusters)
+        sizes = np.round(n_users * weights / weights.sum()).astype(int).tolist()
+        return make_blobs(sizes, n_features, cluster_std=cluster_std, random_state=seed)[0]
+    return make_blobs(n_users, n_features, centers=n_clusters, cluster_std=cluster_std, random_state=seed)[0]
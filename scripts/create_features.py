@@ -1,13 +1,33 @@
 import os
 import sys
+import argparse
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from ml.processing.features_engineering import implement_features
+from ml.processing.features_engineering import MEDIAN_ERROR_SAMPLE, implement_features
 from ml.utils.hf_hub import upload_dataset
 
 
 if __name__ == "__main__":
-    implement_features()
+    parser = argparse.ArgumentParser(description="Build the features of the users.")
+    parser.add_argument(
+        "--median-error",
+        type=float,
+        default=None,
+        help="Relative error of sketched medians; exact medians when not given.",
+    )
+    parser.add_argument(
+        "--report-sample",
+        type=int,
+        nargs="?",
+        const=MEDIAN_ERROR_SAMPLE,
+        default=None,
+        help=f"With --median-error, print the error of the sketched medians on a sample of groups ({MEDIAN_ERROR_SAMPLE} by default).",
+    )
+    args = parser.parse_args()
+    if args.report_sample is not None and args.median_error is None:
+        parser.error("--report-sample needs --median-error")
+
+    implement_features(median_error=args.median_error, report_sample=args.report_sample)
 
     upload_dataset(
         dataset_path="data/features/features.arrow",
@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+MAX_RESULTS = 10000
+
+
+def load_recorded_pages(record_dir):
+    """Load the pages recorded by `EtherscanFetcher(record_dir=...)`, indexed by contract address."""
+    transactions = defaultdict(dict)
+    for file in sorted(os.listdir(record_dir)):
+        if not file.endswith(".json"):
+            continue
+        contract_address = file.split("_")[0].lower()
+        with open(os.path.join(record_dir, file)) as f:
+            for tx in json.load(f).get("result", []):
+                key = (tx.get("hash"), tx.get("logIndex"), tx.get("from"), tx.get("to"))
+                transactions[contract_address][key] = tx
+    return {
+        contract: sorted(txs.values(), key=lambda tx: int(tx["blockNumber"]))
+        for contract, txs in transactions.items()
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answer `tokentx` queries from the recorded transactions, with the API result cap and rate limit.
+    The HTTP statuses of `errors`, e.g. 503, are answered first, one per call.
+    """
+
+    transactions = {}
+    calls_per_second = None
+    calls = []
+    errors = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        with self.lock:
+            status = self.errors.pop(0) if self.errors else None
+        if status is not None:
+            return self.answer({"status": "0", "message": "NOTOK", "result": "Server error"}, status)
+        if self.rate_limited():
+            return self.answer({"status": "0", "message": "NOTOK", "result": "Max rate limit reached"})
+
+        start_block = int(params.get("startblock", 0))
+        end_block = int(params.get("endblock", sys.maxsize))
+        page, offset = int(params.get("page", 1)), int(params.get("offset", MAX_RESULTS))
+        if page * offset > MAX_RESULTS:
+            return self.answer({"status": "0", "message": "Result window is too large", "result": []})
+
+        matching = [
+            tx
+            for tx in self.transactions.get(params.get("contractaddress", "").lower(), [])
+            if start_block <= int(tx["blockNumber"]) <= end_block
+        ]
+        if params.get("sort") == "desc":
+            matching.reverse()
+        matching = matching[(page - 1) * offset : page * offset]
+        if not matching:
+            return self.answer({"status": "0", "message": "No transactions found", "result": []})
+        return self.answer({"status": "1", "message": "OK", "result": matching})
+
+    def rate_limited(self):
+        if not self.calls_per_second:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.calls[:] = [t for t in self.calls if now - t < 1]
+            if len(self.calls) >= self.calls_per_second:
+                return True
+            self.calls.append(now)
+            return False
+
+    def answer(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Etherscan pages on a local server.")
+    parser.add_argument("record_dir", help="Directory of pages recorded by EtherscanFetcher(record_dir=...).")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--calls-per-second", type=float, default=None)
+    args = parser.parse_args()
+
+    StubHandler.transactions = load_recorded_pages(args.record_dir)
+    StubHandler.calls_per_second = args.calls_per_second
+    print(f"Replaying {sum(map(len, StubHandler.transactions.values()))} transactions on http://localhost:{args.port}/api")
+    ThreadingHTTPServer(("localhost", args.port), StubHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
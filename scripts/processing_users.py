@@ -1,17 +1,14 @@
-import pandas as pd
+import os
 import json
-from tqdm.auto import tqdm
-
+from multiprocessing import Pool
 
-def load_data(file_list, base_path):
-    """Load data with progress tracking"""
-    dataframes = {}
-    for file in tqdm(file_list, desc="Loading files"):
-        file_path = f"{base_path}/{file}.parquet"
-        df = pd.read_parquet(file_path)
-        dataframes[file] = df
-        tqdm.write(f"\nDataFrame '{file}' columns:\n{df.columns.tolist()}")
-    return dataframes
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
+import pyarrow.parquet as pq
+from tqdm.auto import tqdm
 
 
 def clean_column_names(df):
@@ -26,8 +23,13 @@ def clean_column_names(df):
     return df
 
 
+PROTOCOL_TYPES = ["DEX", "Lending", "Stablecoin", "Yield Farming", "NFT-Fi"]
+
+
 def parse_protocols(protocol_str):
-    """Parse JSON protocol strings"""
+    """Parse JSON protocol strings, or Parquet map values (lists of key/value pairs)"""
+    if not isinstance(protocol_str, str):
+        return dict(protocol_str) if protocol_str is not None else {}
     try:
         protocols = json.loads(protocol_str)
         return protocols if isinstance(protocols, dict) else {}
@@ -35,53 +37,144 @@ def parse_protocols(protocol_str):
         return {}
 
 
-def process_user_protocols(users_df):
-    """Process user protocol types"""
-    protocol_columns = [
-        "type_" + k for k in ["DEX", "Lending", "Stablecoin", "Yield Farming", "NFT-Fi"]
-    ]
-    users_df = users_df.assign(**{col: 0 for col in protocol_columns})
+def to_arrow(values):
+    """Arrow array of a protocols column: JSON strings or Parquet maps as is, other Python values as JSON"""
+    if isinstance(values, (pa.Array, pa.ChunkedArray)):
+        array = values
+    elif isinstance(values.dtype, pd.ArrowDtype) or pd.api.types.infer_dtype(
+        values, skipna=True
+    ) in ("string", "empty"):
+        array = pa.array(values, from_pandas=True)
+    else:
+        array = pa.array(
+            [json.dumps(parse_protocols(x), default=str) for x in values], pa.string()
+        )
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    return array
+
+
+def _json_lines(strings):
+    """Newline-delimited buffer of a string array, built by Arrow without Python strings"""
+    lines = pc.binary_join_element_wise(
+        strings, pa.scalar("", strings.type), pa.scalar("\n", strings.type)
+    )
+    offsets = np.frombuffer(
+        lines.buffers()[1], np.int64 if pa.types.is_large_string(lines.type) else np.int32
+    )[lines.offset : lines.offset + len(lines) + 1]
+    return lines.buffers()[2][offsets[0] : offsets[-1]]
+
+
+def read_json_objects(strings):
+    """
+    Parse a string array of JSON objects in one pass with Arrow's JSON reader, one struct
+    column per key in order of first appearance. Null, invalid and non-object rows are empty.
+    """
+    strings = pc.fill_null(strings, "{}")
+    try:
+        return pj.read_json(pa.BufferReader(_json_lines(strings)))
+    except pa.ArrowInvalid:  # Rows spanning several lines or not objects: normalize them one by one
+        objects = [json.dumps(parse_protocols(x), default=str) for x in strings.to_pylist()]
+        return pj.read_json(pa.BufferReader(_json_lines(pa.array(objects, pa.string()))))
+
+
+def _counts(values, count_field):
+    """Integer counts of the values, or of their `count_field`; 0 where a struct has no count"""
+    if count_field is None:
+        return pc.cast(values, pa.int64())
+    if count_field not in [field.name for field in values.type]:
+        return pa.array(np.where(values.is_valid(), 0, None), pa.int64())
+    counts = pc.cast(pc.struct_field(values, count_field), pa.int64())
+    return pc.if_else(pc.and_(values.is_valid(), counts.is_null()), 0, counts)
+
+
+def count_matrix(values, count_field=None):
+    """
+    Wide count matrix of a column of objects, one column per key in order of first appearance
+    and NaN where a row does not have the key. The column holds JSON strings or a Parquet map;
+    with `count_field`, the count is read from the object under each key.
+    """
+    array = to_arrow(values)
+    if len(array) == 0:
+        return pd.DataFrame(index=pd.RangeIndex(0))
+    if pa.types.is_map(array.type):
+        offsets = array.offsets.to_numpy()  # Relative to the children, which slices do not cut
+        size = offsets[-1] - offsets[0]
+        keys = array.keys.slice(offsets[0], size).dictionary_encode()
+        names = keys.dictionary.to_pylist()
+        rows = np.repeat(np.arange(len(array)), np.diff(offsets))
+        counts = _counts(array.items.slice(offsets[0], size), count_field).to_numpy(
+            zero_copy_only=False
+        )
+        matrix = np.full((len(array), len(names)), np.nan)
+        matrix[rows, keys.indices.to_numpy()] = counts
+        return pd.DataFrame(matrix, columns=names)
+    table = read_json_objects(array)
+    return pd.DataFrame(
+        {
+            name: _counts(table[name].combine_chunks(), count_field)
+            .to_numpy(zero_copy_only=False)
+            .astype(np.float64)
+            for name in table.column_names
+        },
+        index=pd.RangeIndex(len(array)),
+    )
 
-    with tqdm(total=2, desc="Processing protocols") as pbar:
-        users_df["parsed_protocols"] = users_df["protocol_types"].apply(parse_protocols)
-        pbar.update(1)
 
-        for protocol in tqdm(
-            ["DEX", "Lending", "Stablecoin", "Yield Farming", "NFT-Fi"],
-            desc="Protocol types",
-        ):
-            column_name = f"type_{protocol}"
-            users_df[column_name] = users_df["parsed_protocols"].apply(
-                lambda x: x.get(protocol, 0)
-            )
-        pbar.update(1)
+def _count_chunk(args):
+    """Count matrix of one chunk of rows, in a worker process"""
+    return count_matrix(*args)
 
-    return users_df.drop(columns=["protocol_types", "parsed_protocols"])
 
+def parallel_count_matrix(values, count_field=None, workers=None):
+    """`count_matrix` over row chunks, one per worker process, concatenated in row order"""
+    array = to_arrow(values)
+    workers = min(workers or os.cpu_count() or 1, max(len(array), 1))
+    if workers == 1:
+        return count_matrix(array, count_field)
+    chunk_rows = -(-len(array) // workers)
+    chunks = [
+        (array.slice(start, chunk_rows), count_field)
+        for start in range(0, len(array), chunk_rows)
+    ]
+    with Pool(workers) as pool:
+        matrices = pool.map(_count_chunk, chunks)
+    return pd.concat(matrices, ignore_index=True, sort=False)
 
-def transform_protocols_column(df, column_name="protocols_used"):
-    """Transform protocols used column into count features"""
-    df[column_name] = df[column_name].apply(
-        lambda x: eval(x) if isinstance(x, str) else x
+
+def process_user_protocols(users_df, workers=None):
+    """Process user protocol types"""
+    counts = parallel_count_matrix(users_df["protocol_types"], workers=workers)
+    users_df = users_df.assign(
+        **{
+            f"type_{protocol}": counts[protocol].fillna(0).astype(np.int64).to_numpy()
+            if protocol in counts
+            else 0
+            for protocol in PROTOCOL_TYPES
+        }
     )
+    return users_df.drop(columns=["protocol_types"])
 
-    with tqdm(total=len(df), desc="Protocol details") as pbar:
-        for index, row in df.iterrows():
-            protocols = row[column_name]
-            for protocol_name, protocol_data in protocols.items():
-                df.at[index, f"{protocol_name}_count"] = int(
-                    protocol_data.get("count", 0)
-                )
-            pbar.update(1)
 
-    return df.drop(columns=[column_name])
+def transform_protocols_column(df, column_name="protocols_used", workers=None):
+    """Transform protocols used column into count features"""
+    counts = parallel_count_matrix(df[column_name], count_field="count", workers=workers)
+    counts.columns = [f"{protocol_name}_count" for protocol_name in counts.columns]
+    counts.index = df.index
+    return pd.concat([df.drop(columns=[column_name]), counts], axis=1)
 
 
-def main():
-    dataframes = load_data(["users"], "../data/raw")
+def load_users(file_path):
+    """Load users, keeping the Parquet map columns as Arrow arrays"""
+    table = pq.read_table(file_path)
+    return table.to_pandas(
+        types_mapper=lambda t: pd.ArrowDtype(t) if pa.types.is_map(t) else None
+    )
 
+
+def main():
     with tqdm(total=4, desc="Overall processing") as main_pbar:
-        users = dataframes["users"].copy()
+        users = load_users("../data/raw/users.parquet")
 
         users = process_user_protocols(users)
         main_pbar.update(1)
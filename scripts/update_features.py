@@ -0,0 +1,28 @@
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from ml.processing.features_engineering import build_feature_store, update_features
+from ml.utils.hf_hub import upload_dataset
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold new transactions into the features.")
+    parser.add_argument("delta_path", help="Parquet file or dataset of the new transactions.")
+    parser.add_argument(
+        "--rebuild-store",
+        action="store_true",
+        help="Build the feature store from data/raw/transactions first.",
+    )
+    parser.add_argument("--median-error", type=float, default=0.01)
+    args = parser.parse_args()
+
+    if args.rebuild_store:
+        build_feature_store(median_error=args.median_error)
+    update_features(args.delta_path)
+
+    upload_dataset(
+        dataset_path="data/features/features.arrow",
+        hub_path="dataset/data/features.arrow",
+    )
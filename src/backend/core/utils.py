@@ -4,6 +4,10 @@ import streamlit as st
 import re
 import os
 import requests
+import operator
+from functools import reduce
+import pyarrow as pa
+import pyarrow.dataset as pds
 from pyarrow import feather
 
 def wait_message():
@@ -36,18 +40,55 @@ def cache():
 
     return ranks
 
-@st.cache_data
-def load_transactions():
+TRANSACTIONS_DATASET = 'data/raw/transactions'
 
-    url = 'https://huggingface.co/datasets/mriusero/DeFi-Protocol-Data-on-Ethereum-2023-2024/resolve/main/dataset/data/transactions.parquet'
-    local_file = 'transactions.parquet'
 
-    response = requests.get(url, timeout=10)
-    with open(local_file, 'wb') as file:
-        file.write(response.content)
+def transactions_filter(dataset, protocols=None, start=None, end=None):
+    """ Build the pushdown filter of a transactions query, pruning partitions when the dataset is partitioned. """
+    conditions = []
+    if protocols is not None:
+        # A partition column in the local dataset, a field of the metadata struct in the published file
+        if 'protocol_name' in dataset.schema.names:
+            protocol_name = pds.field('protocol_name')
+        else:
+            protocol_name = pds.field('metadata', 'protocol_name')
+        conditions.append(protocol_name.isin(list(protocols)))
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions.append(pds.field('timestamp') >= pa.scalar(start.to_pydatetime(), pa.timestamp('us')))
+        if 'month' in dataset.schema.names:
+            conditions.append(pds.field('month') >= start.strftime('%Y-%m'))
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions.append(pds.field('timestamp') < pa.scalar(end.to_pydatetime(), pa.timestamp('us')))
+        if 'month' in dataset.schema.names:
+            conditions.append(pds.field('month') <= (end - pd.Timedelta(1, 'us')).strftime('%Y-%m'))
+    return reduce(operator.and_, conditions) if conditions else None
 
-    tx = pd.read_parquet(local_file)
-    os.remove(local_file)
+
+@st.cache_data
+def load_transactions(protocols=None, start=None, end=None, columns=None):
+    """ Load transactions, reading only the requested protocols, time range and columns.
+
+    Reads the local protocol/month partitioned dataset when present, otherwise the published file.
+    """
+    local_file = None
+    if os.path.isdir(TRANSACTIONS_DATASET):
+        dataset = pds.dataset(TRANSACTIONS_DATASET, format='parquet', partitioning='hive')
+    else:
+        url = 'https://huggingface.co/datasets/mriusero/DeFi-Protocol-Data-on-Ethereum-2023-2024/resolve/main/dataset/data/transactions.parquet'
+        local_file = 'transactions.parquet'
+
+        response = requests.get(url, timeout=10)
+        with open(local_file, 'wb') as file:
+            file.write(response.content)
+        dataset = pds.dataset(local_file, format='parquet')
+
+    tx = dataset.to_table(
+        columns=columns, filter=transactions_filter(dataset, protocols, start, end)
+    ).to_pandas()
+    if local_file is not None:
+        os.remove(local_file)
 
     return tx
 
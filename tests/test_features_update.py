@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from ml.processing.feature_store import TRANSACTION_FEATURES, FeatureStore
+import pytest
+
+from ml.processing.features_engineering import aggregate_transactions, median_mode, report_median_error
+from ml.utils.feature_matrix import FeatureMatrix, write_feature_matrix
+
+
+def fixture(n_tx, n_users, seed):
+    """Users and transactions with Zipf-distributed addresses, some users without transactions."""
+    rng = np.random.default_rng(seed)
+    addresses = np.array([f"0x{i:040x}" for i in range(n_users)], dtype=object)
+    users = pd.DataFrame({"address": addresses, "sent_count": rng.integers(0, 100, n_users)})
+    start = np.datetime64("2023-01-01T00:00:00", "s").astype(np.int64)
+    transactions = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(rng.integers(start, start + 90 * 86400, n_tx), unit="s"),
+            "from": addresses[(rng.zipf(1.5, n_tx) - 1) % (n_users - 10)],
+            "to": addresses[(rng.zipf(1.5, n_tx) - 1) % (n_users - 10)],
+            "value_eth": np.round(rng.lognormal(0, 2, n_tx), 4),
+            "gas_used": rng.integers(0, 300000, n_tx).astype(np.float64),
+        }
+    ).sort_values("timestamp", ignore_index=True)
+    return users, transactions
+
+
+def test_updated_features_match_a_full_sketched_recompute():
+    users, transactions = fixture(20000, 2000, seed=0)
+    split = transactions["timestamp"].quantile(0.9)
+    store = FeatureStore(median_error=0.01)
+    store.fold(transactions[transactions["timestamp"] <= split])
+    store.fold(transactions[transactions["timestamp"] > split])
+
+    updated = store.features(users["address"])[TRANSACTION_FEATURES]
+    full = aggregate_transactions(users, transactions.copy(), median_error=store.median_error)
+    pd.testing.assert_frame_equal(updated, full[TRANSACTION_FEATURES], check_dtype=False, rtol=1e-9)
+
+
+def test_median_mode_is_recorded(tmp_path):
+    users, _ = fixture(10, 20, seed=1)
+    for mode in [median_mode(), median_mode(0.01)]:
+        write_feature_matrix(users, tmp_path / "features.arrow", median_mode=mode)
+        assert FeatureMatrix.load(tmp_path / "features.arrow").median_mode == mode
+    write_feature_matrix(users, tmp_path / "features.arrow")
+    assert FeatureMatrix.load(tmp_path / "features.arrow").median_mode is None
+
+
+@pytest.mark.parametrize("engine", ["arrow", "pandas"])
+def test_median_error_is_reported_on_a_sample(engine, capsys):
+    users, transactions = fixture(20000, 2000, seed=2)
+    aggregate_transactions(users, transactions.copy(), engine=engine, median_error=0.01)
+    assert capsys.readouterr().out == ""  # Opt-in
+
+    aggregate_transactions(users, transactions.copy(), engine=engine, median_error=0.01, report_sample=50)
+    lines = capsys.readouterr().out.splitlines()
+    assert sorted(line.split(":")[0] for line in lines) == [
+        "- med_received_eth", "- med_received_gas", "- med_sent_eth", "- med_sent_gas"
+    ]
+    assert all(line.endswith("on 50 groups") for line in lines)
+
+
+def test_median_error_report_matches_the_exact_medians():
+    users, transactions = fixture(20000, 2000, seed=3)
+    exact = aggregate_transactions(users, transactions.copy())
+    approx = aggregate_transactions(users, transactions.copy(), median_error=0.01)
+    groups = pd.Index(users["address"]).get_indexer(transactions["from"])
+    values = transactions["value_eth"].to_numpy(np.float64)
+
+    medians = approx["med_sent_eth"].to_numpy()
+    report = report_median_error(groups[None], values, medians, "med_sent_eth", 0.01, report_sample=len(medians))
+    filled = exact["med_sent_eth"].notna().to_numpy()
+    truth = np.abs(approx["med_sent_eth"] - exact["med_sent_eth"])[filled] / exact["med_sent_eth"][filled]
+    assert report["groups"] == filled.sum()
+    assert report["max"] == pytest.approx(truth.max())
+    assert report["mean"] == pytest.approx(truth.mean())
+    assert report["max"] <= 0.01
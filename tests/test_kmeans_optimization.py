@@ -0,0 +1,32 @@
+import json
+
+import numpy as np
+import optuna
+import pytest
+from optuna.trial import TrialState
+from sklearn.datasets import make_blobs
+
+pytest.importorskip("matplotlib")
+from ml.models.kmeans.kmeans_analysis import optimize_hyperparams, study_storage
+
+STUDY_NAME = "minibatch_kmeans_optimization"
+
+
+@pytest.mark.parametrize("storage", ["study.log", "sqlite:///{}/study.db"])
+def test_workers_finish_the_trials(tmp_path, storage):
+    x, _ = make_blobs(3000, 4, centers=4, random_state=0)
+    storage = storage.format(tmp_path) if "://" in storage else str(tmp_path / storage)
+    save_path = tmp_path / "results.json"
+    with open(save_path, "w") as f:  # Raw score of a previous version, never compared with normalized ones
+        json.dump({"best_params": {"n_clusters": 4, "init": "random"}, "best_value": 1e6}, f)
+
+    results = optimize_hyperparams(x, n_trials=8, save_path=save_path, storage=storage, workers=2)
+
+    study = optuna.load_study(study_name=STUDY_NAME, storage=study_storage(storage))
+    finished = study.get_trials(states=(TrialState.COMPLETE, TrialState.PRUNED))
+    assert len(finished) >= 8 and not study.get_trials(states=(TrialState.FAIL,))
+    assert study.trials[0].params["n_clusters"] == 4  # The previous best parameters, scored again
+    assert results == {"best_params": study.best_params, "best_value": study.best_value}
+    assert 0 < results["best_value"] <= 1
+    with open(save_path) as f:
+        assert json.load(f) == results
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.etl_pipeline.market.aggregate import aggregate_windows
+
+HOUR = 3_600_000_000_000
+
+
+def skewed_transactions(n, seed):
+    """Timestamp-sorted protocol transactions: small values with a few whale-sized ones, some missing."""
+    rng = np.random.default_rng(seed)
+    timestamps = np.sort(rng.integers(0, 2000 * HOUR, n))
+    values = rng.lognormal(-3.0, 0.5, n)
+    values[rng.choice(n, n // 200, replace=False)] = rng.uniform(1e8, 1e9, n // 200)  # Whales
+    values[rng.choice(n, n // 100, replace=False)] = np.nan
+    return {
+        "timestamp": timestamps,
+        "from": rng.integers(0, 500, n),
+        "to": rng.integers(0, 50, n),
+        "value": values,
+        "gas_used": rng.normal(1e5, 10.0, n),
+        "is_error": rng.random(n) < 0.05,
+    }
+
+
+@pytest.mark.parametrize("time_delta", [1, 24])
+def test_std_matches_pandas_rolling(time_delta):
+    transactions = skewed_transactions(20_000, seed=time_delta)
+    timestamps = pd.to_datetime(transactions["timestamp"], utc=True)
+    # The rolling window of pandas closed on the left is [t - delta, t): the window starting at t - delta
+    metrics = aggregate_windows(transactions, transactions["timestamp"] - time_delta * HOUR, time_delta)
+    for column, name in [("value", "value_eth"), ("gas_used", "gas_used")]:
+        rolling = pd.Series(transactions[column], index=timestamps).rolling(f"{time_delta}h", closed="left")
+        expected = rolling.std(ddof=0).to_numpy()
+        counts = rolling.count().to_numpy()
+        checked = counts >= 2
+        assert checked.sum() > 1000
+        np.testing.assert_allclose(metrics[f"std_{name}"][checked], expected[checked], rtol=1e-6)
+
+
+def test_std_of_small_values_after_whales():
+    transactions = skewed_transactions(20_000, seed=0)
+    window_starts = np.arange(0, 2000 * HOUR, HOUR)
+    metrics = aggregate_windows(transactions, window_starts, 24)
+    lo = np.searchsorted(transactions["timestamp"], window_starts)
+    hi = np.searchsorted(transactions["timestamp"], window_starts + 24 * HOUR)
+    expected = np.array([np.nanstd(transactions["value"][a:b]) if b > a else 0.0 for a, b in zip(lo, hi)])
+    np.testing.assert_allclose(metrics["std_value_eth"], expected, rtol=1e-9, atol=1e-12)
+    totals = np.array([np.nansum(transactions["value"][a:b]) for a, b in zip(lo, hi)])
+    np.testing.assert_allclose(metrics["total_value_eth"], totals, rtol=1e-9)
+
+
+
+class WithoutStd:
+    """Transactions collection dropping the `$stdDevPop` fields, which mongomock does not implement."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def aggregate(self, pipeline):
+        stages = [
+            {operator: {key: value for key, value in spec.items() if not key.startswith("std_")}}
+            for stage in pipeline
+            for operator, spec in stage.items()
+        ]
+        return self.collection.aggregate(stages)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+@pytest.mark.parametrize("time_delta", [1, 24])
+def test_window_metrics_match_the_query_engine(time_delta):
+    mongomock = pytest.importorskip("mongomock")
+    from etl.etl_pipeline.market.aggregate import aggregate_transactions, aggregate_transactions_columnar
+    from etl.etl_pipeline.market.extract_market import get_protocol_transactions
+
+    rng = np.random.default_rng(time_delta)
+    n = 1500
+    timestamps = np.sort(rng.integers(0, 100 * 3600, n)) * 1_000_000_000
+    values = rng.integers(0, 40, n) * 0.5  # Even integer values count in median_value_eth
+    values[:5] = 2e17  # Even whales before the windows: the cumulative sums exceed 2**53
+    collection = WithoutStd(mongomock.MongoClient()["defi_db"]["transactions"])
+    collection.insert_many([
+        {
+            "timestamp": pd.Timestamp(t, unit="ns").to_pydatetime(),
+            "from": f"0x{rng.integers(0, 300):x}",
+            "to": f"0x{rng.integers(0, 30):x}",
+            "value (ETH)": float(value),
+            "gas_used": float(rng.integers(21000, 300000)),
+            "is_error": "1" if rng.random() < 0.05 else "0",
+            "metadata": {"protocol_name": "p"},
+        }
+        for t, value in zip(timestamps, values)
+    ])
+    window_starts = pd.date_range("1970-01-01 01:00", periods=60, freq="h")
+    assert timestamps[4] < window_starts[0].value
+    market = pd.DataFrame({"timestamp": window_starts, "protocol_name": "p"})
+
+    expected = aggregate_transactions(market, time_delta=time_delta, collection=collection)
+    actual = aggregate_transactions_columnar(
+        market, get_protocol_transactions("p", collection=collection), time_deltas=(time_delta,)
+    )
+    for name in [
+        "median_value_eth", "nb_unique_senders", "nb_unique_receivers", "num_errors", "error_rate",
+        "min_value_eth", "max_value_eth", "min_gas_used", "max_gas_used",
+    ]:
+        column = f"{name}_{time_delta}h"
+        np.testing.assert_allclose(
+            actual[column].astype(float), expected[column].astype(float), rtol=1e-12, equal_nan=True, err_msg=column
+        )
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+
+from ml.processing.standardizer import Standardizer
+
+
+def test_boxcox_clips_unseen_rows_below_the_fitted_minimum():
+    rng = np.random.default_rng(0)
+    train = pd.DataFrame({"a": rng.lognormal(0, 1, 1000) + 5, "b": rng.normal(0, 1, 1000)})
+    standardizer = Standardizer({"a": "Box-Cox", "b": "Z-score"}).fit(train)
+
+    minimum = train["a"].min()
+    new = pd.DataFrame({"a": [minimum - 10, minimum - 1, minimum, np.nan], "b": [0.0, 0.0, 0.0, 0.0]})
+    transformed = standardizer.transform(new)["a"].to_numpy()
+    assert np.isfinite(transformed[:3]).all() and np.isnan(transformed[3])
+    assert transformed[0] == transformed[1] == transformed[2]
+
+    fitted = standardizer.transform(train)["a"].to_numpy()
+    assert np.isfinite(fitted).all() and fitted.min() == transformed[2]
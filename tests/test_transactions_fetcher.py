@@ -0,0 +1,91 @@
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from etl.etl_pipeline.transactions import extract
+from etl.etl_pipeline.transactions.fetcher import (
+    MAX_RESULTS,
+    EtherscanFetcher,
+    TokenBucket,
+    fetch_contract_transactions,
+)
+from scripts.etherscan_stub_server import StubHandler
+
+CONTRACT = "0xcontract"
+
+
+def transfers(blocks):
+    """Transfers of the contract, `count` of them in each block of `blocks`."""
+    return [
+        {"hash": f"0x{block:08x}{i:08x}", "logIndex": str(i), "blockNumber": str(block), "from": "0xa", "to": "0xb"}
+        for block, count in sorted(blocks.items())
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """A local Etherscan stub, answering from the transactions set on `StubHandler`."""
+    monkeypatch.setattr(StubHandler, "transactions", {})
+    monkeypatch.setattr(StubHandler, "calls_per_second", None)
+    monkeypatch.setattr(StubHandler, "errors", [])
+    httpd = ThreadingHTTPServer(("localhost", 0), StubHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://localhost:{httpd.server_address[1]}/api"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_block_over_the_result_cap_is_fetched_from_both_ends(server):
+    expected = transfers({10: 5, 11: MAX_RESULTS + 2500, 12: 7})
+    StubHandler.transactions = {CONTRACT: expected}
+    txs = fetch_contract_transactions(CONTRACT, 0, 100, base_url=server, calls_per_second=1000)
+    assert [tx["hash"] for tx in txs] == [tx["hash"] for tx in expected]
+
+
+def test_server_errors_are_retried(server):
+    expected = transfers({block: 2 for block in range(10, 20)})
+    StubHandler.transactions = {CONTRACT: expected}
+    StubHandler.errors = [503, 502]
+    txs = fetch_contract_transactions(CONTRACT, 0, 100, base_url=server, calls_per_second=1000)
+    assert not StubHandler.errors
+    assert [tx["hash"] for tx in txs] == [tx["hash"] for tx in expected]
+
+
+def test_block_beyond_two_pages_fails_loudly(server):
+    StubHandler.transactions = {CONTRACT: transfers({11: 2 * MAX_RESULTS + 1})}
+    with pytest.raises(ValueError, match="could not be fetched"):
+        fetch_contract_transactions(CONTRACT, 0, 100, base_url=server, calls_per_second=1000)
+
+
+def test_one_fetcher_serves_every_window(server, monkeypatch):
+    StubHandler.transactions = {CONTRACT: transfers({block: 3 for block in range(0, 1000, 7)})}
+    fetchers = []
+
+    class Fetcher(EtherscanFetcher):
+        def __init__(self):
+            super().__init__(base_url=server, calls_per_second=1000)
+            fetchers.append(self)
+
+    inserted = []
+    monkeypatch.setattr(extract, "EtherscanFetcher", Fetcher)
+    monkeypatch.setattr(extract, "load_known_hashes", lambda contract_id: set())
+    monkeypatch.setattr(extract, "insert_transactions", lambda *args, **kwargs: inserted.extend(args[4]))
+    monkeypatch.setattr(extract, "save_checkpoint", lambda *args: None)
+    contract = {"contract_id": "0x1", "contract_address": CONTRACT, "protocol_name": "p", "type": "dex", "blockchain": "ethereum"}
+
+    assert extract.ingest_contract(contract, 0, 999, resume=False, checkpoint_blocks=100) == len(inserted)
+    assert len(fetchers) == 1 and len(inserted) == 3 * len(range(0, 1000, 7))
+
+
+def test_rate_recovers_after_rate_limits():
+    bucket = TokenBucket(8)
+    for _ in range(3):
+        bucket.slow_down()
+    assert bucket.rate == 1
+    calls = 0
+    while bucket.rate < 8:
+        bucket.succeeded()
+        calls += 1
+    assert bucket.rate == 8 and calls < 100
@@ -0,0 +1,89 @@
+import datetime
+
+import numpy as np
+import pytest
+
+from etl.etl_pipeline.users import extract
+from etl.etl_pipeline.users.transform import transform_to_user_data
+
+ROUTER = "0xrouter"
+PROTOCOLS = [
+    {"protocol_name": "uniswap", "type": "dex", "blockchain": "ethereum", "contract_id": "0x1"},
+    {"protocol_name": "uniswap", "type": "dex", "blockchain": "arbitrum", "contract_id": "0x2"},
+    {"protocol_name": "aave", "type": "lending", "blockchain": "ethereum", "contract_id": "0x3"},
+    {"type": "bridge"},
+]
+
+
+def skewed_transactions(n, seed):
+    """Transactions between a few hundred addresses, two thirds of them through one router."""
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2024, 1, 1)
+    transactions = []
+    for i in range(n):
+        sender, receiver = (f"0x{a:04x}" for a in rng.integers(0, 300, 2))
+        if i % 3 == 0:
+            receiver = ROUTER
+        elif i % 3 == 1:
+            sender = ROUTER
+        transactions.append(
+            {
+                "from": sender,
+                "to": receiver,
+                "transaction_hash": f"0x{i:064x}",
+                "value (ETH)": float(rng.lognormal()),
+                "gas_used": float(rng.integers(21000, 200000)),
+                "timestamp": start + datetime.timedelta(seconds=int(rng.integers(0, 10**7))),
+                "metadata": PROTOCOLS[rng.integers(0, len(PROTOCOLS))],
+            }
+        )
+    return transactions
+
+
+@pytest.fixture
+def flushed(monkeypatch):
+    """Users flushed by the workers, collected instead of written to MongoDB."""
+    documents = {}
+
+    def flush(users_data):
+        documents.update(users_data.items())
+        return len(users_data)
+
+    monkeypatch.setattr(extract, "flush_users_data", flush)
+    return documents
+
+
+def test_skewed_partitions_fit_their_capacity(tmp_path, flushed):
+    transactions = skewed_transactions(6000, seed=0)
+    capacity, max_transactions = 1000, 400
+    n_partitions = extract.partition_count(len(transactions), capacity, num_workers=2)
+    total, tasks = extract.spill_transactions(iter(transactions[500:]), n_partitions, tmp_path, 1000, transactions[:500])
+    sides = [n for _, _, _, n in tasks]
+    assert total == len(transactions) and sum(sides) == 2 * len(transactions)
+    assert max(sides) > capacity  # The router overflows its partition
+
+    tasks = extract.plan_partitions(tasks, capacity)
+    assert all(n <= capacity for _, _, hot, n in tasks if hot is None)
+    assert [hot for _, _, hot, _ in tasks if hot is not None] == [ROUTER]
+    for task in tasks:
+        extract.process_partition(task + (max_transactions,))
+    assert not list(tmp_path.iterdir())
+
+    expected = dict(transform_to_user_data(transactions).finalize().items())
+    assert flushed.keys() == expected.keys()
+    for address, document in expected.items():
+        if address != ROUTER:
+            assert flushed[address] == document
+
+    router, full = flushed[ROUTER], expected[ROUTER]
+    assert router["transactions_truncated"] and router["transactions_seen"] == len(full["transactions"])
+    assert router["transactions"] == full["transactions"][-max_transactions:]
+    for field in ["sent_count", "received_count", "first_seen", "last_seen", "protocols_used", "protocol_types"]:
+        assert router[field] == full[field], field
+    for field in ["total_sent (ETH)", "total_received (ETH)"]:
+        assert router[field] == pytest.approx(full[field], rel=1e-12), field
+
+
+def test_side_footprint_is_measured():
+    footprint = extract.measure_side_footprint(skewed_transactions(2000, seed=1))
+    assert 100 < footprint < 10_000
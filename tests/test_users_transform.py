@@ -0,0 +1,120 @@
+import datetime
+import json
+import pickle
+from multiprocessing import get_context
+
+import numpy as np
+import pytest
+
+from etl.etl_pipeline.users.extract import process_transactions_batch
+from etl.etl_pipeline.users.transform import merge_user_data, reduce_user_data, transform_to_user_data
+
+PROTOCOLS = [
+    {"protocol_name": "uniswap", "type": "dex", "blockchain": "ethereum", "contract_id": "0x1"},
+    {"protocol_name": "aave", "type": "lending", "blockchain": "ethereum", "contract_id": "0x2"},
+    {"protocol_name": "lido", "type": "staking", "blockchain": "ethereum", "contract_id": "0x3"},
+    {"type": "dex"},
+    {},
+]
+
+
+def random_transactions(n, seed):
+    """Transactions between a few addresses with self-transfers, repeated timestamps and missing fields."""
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2024, 1, 1)
+    transactions = []
+    for i in range(n):
+        sender = f"0x{rng.integers(0, 40):04x}"
+        receiver = sender if rng.random() < 0.05 else f"0x{rng.integers(0, 40):04x}"
+        transaction = {
+            "from": sender,
+            "to": receiver,
+            "transaction_hash": None if rng.random() < 0.05 else f"0x{i:064x}",
+            "value (ETH)": float("nan") if rng.random() < 0.05 else float(rng.lognormal()),
+            "gas_used": float(rng.integers(21000, 200000)),
+            "timestamp": start + datetime.timedelta(minutes=int(rng.integers(0, 500))),
+        }
+        metadata = PROTOCOLS[rng.integers(0, len(PROTOCOLS))]
+        if metadata:
+            transaction["metadata"] = metadata
+        transactions.append(transaction)
+    return transactions
+
+
+def random_batches(transactions, rng):
+    """Shuffles the transactions into batches of random sizes, some of them empty."""
+    order = rng.permutation(len(transactions))
+    cuts = np.sort(rng.integers(0, len(transactions) + 1, rng.integers(1, 12)))
+    return [[transactions[i] for i in part] for part in np.split(order, cuts)]
+
+
+def random_tree_merge(batches, rng):
+    """Merges the batches as a random binary tree, each merge in a random operand order."""
+    if len(batches) == 1:
+        return batches[0]
+    batches = [batches[i] for i in rng.permutation(len(batches))]
+    cut = rng.integers(1, len(batches))
+    left, right = random_tree_merge(batches[:cut], rng), random_tree_merge(batches[cut:], rng)
+    return merge_user_data(left, right) if rng.random() < 0.5 else merge_user_data(right, left)
+
+
+def documents(users_data):
+    """User documents by address, as flushed to MongoDB."""
+    return dict(users_data.finalize().items())
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_batches_and_merge_trees_match_one_batch(seed):
+    rng = np.random.default_rng(seed)
+    transactions = random_transactions(int(rng.integers(1, 400)), seed)
+    expected = documents(transform_to_user_data(transactions))
+
+    batches = [transform_to_user_data(batch) for batch in random_batches(transactions, rng)]
+    merged = documents(random_tree_merge(batches, rng))
+
+    assert merged.keys() == expected.keys()
+    for address, document in expected.items():
+        for field in [
+            "sent_count", "received_count", "total_sent (ETH)", "total_received (ETH)",
+            "first_seen", "last_seen", "protocols_used", "protocol_types", "transactions",
+        ]:
+            assert merged[address][field] == document[field], field  # Canonical order: sums are exact too
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_latest_sides_keep_the_statistics_of_every_side(seed):
+    rng = np.random.default_rng(seed)
+    transactions = random_transactions(600, seed)
+    expected = documents(transform_to_user_data(transactions))
+
+    batches = [  # Truncated in worker processes, then merged
+        pickle.loads(pickle.dumps(transform_to_user_data(batch).keep_latest(5)))
+        for batch in random_batches(transactions, rng)
+    ]
+    kept = documents(random_tree_merge(batches, rng).keep_latest(5))
+
+    assert kept.keys() == expected.keys()
+    for address, document in expected.items():
+        for field in ["sent_count", "received_count", "first_seen", "last_seen", "protocols_used", "protocol_types"]:
+            assert kept[address][field] == document[field], field
+        for field in ["total_sent (ETH)", "total_received (ETH)"]:
+            assert kept[address][field] == pytest.approx(document[field], rel=1e-12), field
+        assert kept[address]["transactions"] == document["transactions"][-5:]
+        assert kept[address].get("transactions_seen", len(document["transactions"])) == len(document["transactions"])
+
+
+def test_json_records_match_dicts():
+    transactions = random_transactions(200, seed=0)
+    as_json = [json.dumps(tx, default=str) for tx in transactions]
+    assert documents(transform_to_user_data(as_json)) == documents(transform_to_user_data(transactions))
+
+
+@pytest.mark.parametrize("workers", [2, 3])
+def test_one_worker_and_several_workers_match(workers):
+    transactions = random_transactions(1000, seed=workers)
+    single = documents(reduce_user_data([process_transactions_batch(transactions)]))
+    size = -(-len(transactions) // workers)
+    batches = [transactions[i : i + size] for i in range(0, len(transactions), size)]
+    with get_context("spawn").Pool(workers) as pool:
+        results = pool.map(process_transactions_batch, batches)
+    assert documents(reduce_user_data(results)) == single